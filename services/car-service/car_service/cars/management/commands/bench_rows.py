@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...models import Car
+from ...serializers import CarResponseSerializer, car_rows
+
+
+class Command(BaseCommand):
+    help = "Список авто: CarResponseSerializer против car_rows (values_list) – время на страницу"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100, help="авто на странице")
+        parser.add_argument("--repeat", type=int, default=200, help="сколько раз собрать страницу")
+
+    def handle(self, *args, rows, repeat, **options):
+        # Тестовые авто живут только внутри транзакции и откатываются в конце
+        with transaction.atomic():
+            cars = Car.objects.bulk_create(
+                Car(brand="Mercedes Benz", model="GLA 250", registration_number=f"Х{i:06d}",
+                    power=249, price=3500, type=Car.CarType.SEDAN)
+                for i in range(rows)
+            )
+            queryset = Car.objects.filter(id__gte=cars[0].id).order_by("id")[:rows]
+
+            serializer = self._measure(lambda: CarResponseSerializer(queryset.all(), many=True).data, repeat)
+            mapper = self._measure(lambda: car_rows.rows(car_rows.values_list(queryset.all())), repeat)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"serializer: {serializer * 1e3:8.3f} мс на страницу из {rows}")
+        self.stdout.write(f"  car_rows: {mapper * 1e3:8.3f} мс на страницу из {rows}")
+        self.stdout.write(f"ускорение: x{serializer / mapper:.1f}")
+
+    @staticmethod
+    def _measure(func, repeat: int) -> float:
+        func()  # прогрев
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - started) / repeat
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from ...models import FleetCounter
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитать FleetCounter по таблице cars (COUNT(*)) – после bulk_create, "
+        "правок в админке, загрузки фикстур или SQL в обход API"
+    )
+
+    def handle(self, *args, **options):
+        before = FleetCounter.totals()
+        after = FleetCounter.reseed()
+        self.stdout.write(f"total: {before['total']} -> {after['total']}, "
+                          f"available: {before['available']} -> {after['available']}")
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:15
+
+from django.db import migrations, models
+
+SHARDS = 8
+
+
+def seed_counter(apps, schema_editor):
+    """Шарды счётчика; текущие значения – в шарде 0, остальные начинают с нуля."""
+    Car = apps.get_model('cars', 'Car')
+    FleetCounter = apps.get_model('cars', 'FleetCounter')
+    FleetCounter.objects.bulk_create(FleetCounter(shard=shard) for shard in range(SHARDS))
+    FleetCounter.objects.filter(shard=0).update(
+        total=Car.objects.count(),
+        available=Car.objects.filter(availability=True).count(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FleetCounter',
+            fields=[
+                ('shard', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('total', models.BigIntegerField(default=0)),
+                ('available', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'fleet_counter',
+            },
+        ),
+        migrations.RunPython(seed_counter, migrations.RunPython.noop),
+    ]
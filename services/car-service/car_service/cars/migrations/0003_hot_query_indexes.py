@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:17
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0002_fleet_counter'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='car',
+            name='cars_availab_ce8337_idx',
+        ),
+        migrations.AlterField(
+            model_name='car',
+            name='car_uid',
+            field=models.UUIDField(default=uuid.uuid4, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(condition=models.Q(('availability', True)), fields=['id'], name='cars_available_id_idx'),
+        ),
+    ]
@@ -1,5 +1,8 @@
+import random
 import uuid
-from django.db import models
+from typing import Sequence
+
+from django.db import connection, models, transaction
 
 
 class Car(models.Model):
@@ -9,7 +12,7 @@ class Car(models.Model):
         MINIVAN = "MINIVAN", "Minivan"
         ROADSTER = "ROADSTER", "Roadster"
 
-    car_uid = models.UUIDField(default=uuid.uuid4, unique=True, db_index=True)
+    car_uid = models.UUIDField(default=uuid.uuid4, unique=True)
     brand = models.CharField(max_length=80)
     model = models.CharField(max_length=80)
     registration_number = models.CharField(max_length=20)
@@ -20,10 +23,102 @@ class Car(models.Model):
 
     class Meta:
         db_table = "cars"
+        # Список доступных авто – filter(availability=True).order_by("id"): частичный
+        # индекс по id только доступных авто меньше полного и сразу отдаёт их по порядку
         indexes = [
-            models.Index(fields=["availability"]),
+            models.Index(fields=["id"], condition=models.Q(availability=True), name="cars_available_id_idx"),
             models.Index(fields=["brand", "model"]),
         ]
 
     def __str__(self):
         return f"{self.brand} {self.model} ({self.registration_number})"
+
+    @classmethod
+    def set_availability(cls, car_uids: Sequence[uuid.UUID], available: bool,
+                         returning: Sequence[str]) -> list[tuple]:
+        """
+        Резерв/снятие резерва одним запросом:
+        UPDATE cars SET availability = %s WHERE car_uid IN (...) AND availability = NOT %s RETURNING ...
+        Меняются только авто в противоположном состоянии, поэтому из параллельных
+        резервов одного авто успеет ровно один. Возвращает изменённые строки
+        (поля returning, значения уже в типах Python); FleetCounter обновляется
+        в той же транзакции.
+        """
+        if not car_uids:
+            return []
+        uid_field = cls._meta.get_field("car_uid")
+        availability = cls._meta.get_field("availability")
+        fields = [cls._meta.get_field(name) for name in returning]
+        quote = connection.ops.quote_name
+        sql = "UPDATE {table} SET {flag} = %s WHERE {uid} IN ({uids}) AND {flag} = %s RETURNING {columns}".format(
+            table=quote(cls._meta.db_table),
+            flag=quote(availability.column),
+            uid=quote(uid_field.column),
+            uids=", ".join(["%s"] * len(car_uids)),
+            columns=", ".join(quote(field.column) for field in fields),
+        )
+        params = [available, *(uid_field.get_db_prep_value(uid, connection) for uid in car_uids), not available]
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                # Сырой курсор отдаёт значения как есть (на sqlite UUID – строка, bool – 0/1)
+                rows = [tuple(field.to_python(value) for field, value in zip(fields, row))
+                        for row in cursor.fetchall()]
+            FleetCounter.add(available=len(rows) if available else -len(rows))
+        return rows
+
+
+class FleetCounter(models.Model):
+    """
+    Шардированный счётчик автопарка: total – всего авто, available – доступных.
+
+    Каждое изменение увеличивает/уменьшает случайный шард (UPDATE ... SET x = x + d),
+    поэтому параллельные резервы не ждут блокировки одной строки. Итог – сумма
+    по SHARDS строкам, это дешевле COUNT(*) по таблице cars на каждый запрос списка.
+
+    Изменения в обход API (bulk_create, админка, фикстуры, SQL) счётчик не видит –
+    его выравнивает reseed() (команда recount_fleet).
+    """
+    SHARDS = 8
+
+    shard = models.PositiveSmallIntegerField(primary_key=True)
+    total = models.BigIntegerField(default=0)
+    available = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = "fleet_counter"
+
+    @classmethod
+    def add(cls, total: int = 0, available: int = 0) -> None:
+        if not total and not available:
+            return
+        cls.objects.filter(shard=random.randrange(cls.SHARDS)).update(
+            total=models.F("total") + total, available=models.F("available") + available,
+        )
+
+    @classmethod
+    @transaction.atomic
+    def reseed(cls) -> dict[str, int]:
+        """
+        Пересчитать счётчик по таблице cars: итог – в шард 0, остальные – в ноль.
+        Шарды блокируются до COUNT(*): резерв, который ещё не закоммичен, в подсчёт
+        не попадёт, а его add() дождётся конца пересчёта и применится поверх.
+        """
+        shards = {counter.shard for counter in cls.objects.select_for_update()}
+        cls.objects.bulk_create(cls(shard=shard) for shard in range(cls.SHARDS) if shard not in shards)
+        totals = {
+            "total": Car.objects.count(),
+            "available": Car.objects.filter(availability=True).count(),
+        }
+        cls.objects.exclude(shard=0).update(total=0, available=0)
+        cls.objects.filter(shard=0).update(**totals)
+        return totals
+
+    @classmethod
+    def totals(cls) -> dict[str, int]:
+        sums = cls.objects.aggregate(total=models.Sum("total"), available=models.Sum("available"))
+        return {key: value or 0 for key, value in sums.items()}
+
+    def __str__(self):
+        return f"shard {self.shard}: {self.available}/{self.total}"
@@ -1,18 +1,110 @@
+import base64
+import binascii
+from functools import cached_property, partial
+
+from django.core.paginator import EmptyPage, Paginator
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
 
+def _row_id(row) -> int:
+    # Объект модели или кортеж values_list() с id первым (FieldMapper.values_list)
+    return row[0] if isinstance(row, tuple) else row.id
+
+
+class CountedPaginator(Paginator):
+    """
+    Paginator с заранее известным числом элементов – без COUNT(*) на каждую страницу.
+    Если по этому числу страницы нет, перед 404 число пересчитывается COUNT(*):
+    отставший счётчик не должен прятать существующие страницы.
+    """
+
+    def __init__(self, object_list, per_page, total=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.total = total
+
+    @cached_property
+    def count(self):
+        return self.total if self.total is not None else super().count
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if self.total is None:
+                raise
+        # Счётчик мог отстать от таблицы – проверяем по COUNT(*)
+        self.total = None
+        for name in ("count", "num_pages"):
+            self.__dict__.pop(name, None)
+        return super().validate_number(number)
+
+    def page(self, number):
+        # Срез не обрезается по count: счётчик может отставать от таблицы, страница – нет
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(self.object_list[bottom:bottom + self.per_page], number, self)
+
+
 class ApiPagination(PageNumberPagination):
+    """
+    Два режима:
+    - ?page=&size= – номер страницы (как раньше); totalElements берётся из
+      view.get_total_count(), если view его даёт, иначе COUNT(*);
+    - ?cursor=&size= – keyset по id: следующая страница – id > последнего id
+      текущей, без OFFSET. Пустой cursor – первая страница, курсор следующей
+      страницы – в nextCursor (null на последней).
+    """
     page_query_param = "page"  # ?page=
     page_size_query_param = "size"  # ?size=
+    cursor_query_param = "cursor"  # ?cursor=
     page_size = 10  # значение по умолчанию
     max_page_size = 100  # на всякий случай
 
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.total = view.get_total_count() if hasattr(view, "get_total_count") else None
+        if self.cursor_query_param not in request.query_params:
+            self.keyset = False
+            self.django_paginator_class = partial(CountedPaginator, total=self.total)
+            return super().paginate_queryset(queryset, request, view)
+
+        self.keyset = True
+        size = self.get_page_size(request)
+        last_id = self.decode_cursor(request.query_params[self.cursor_query_param])
+        if last_id is not None:
+            queryset = queryset.filter(id__gt=last_id)
+
+        # Лишняя строка показывает, есть ли следующая страница
+        page = list(queryset.order_by("id")[:size + 1])
+        self.next_cursor = self.encode_cursor(_row_id(page[size - 1])) if len(page) > size else None
+        return page[:size]
+
     def get_paginated_response(self, data):
+        if not self.keyset:
+            return Response({
+                "page": self.page.number,
+                # фактический размер текущей страницы (на последней может быть меньше)
+                "pageSize": len(data),
+                "totalElements": self.page.paginator.count,
+                "items": data,
+            })
         return Response({
-            "page": self.page.number,
-            # фактический размер текущей страницы (на последней может быть меньше)
             "pageSize": len(data),
-            "totalElements": self.page.paginator.count,
+            "totalElements": self.total,
+            "nextCursor": self.next_cursor,
             "items": data,
         })
+
+    def decode_cursor(self, raw):
+        if not raw:
+            return None
+        try:
+            return int(base64.urlsafe_b64decode(raw.encode("ascii")).decode("ascii"))
+        except (ValueError, UnicodeError, binascii.Error):
+            raise ValidationError({self.cursor_query_param: ["Некорректный курсор"]})
+
+    @staticmethod
+    def encode_cursor(last_id: int) -> str:
+        return base64.urlsafe_b64encode(str(last_id).encode("ascii")).decode("ascii")
@@ -1,6 +1,21 @@
 from rest_framework import serializers
+
+from ..field_mapper import FieldMapper
 from .models import Car
 
+
+class CarBatchRequestSerializer(serializers.Serializer):
+    carUids = serializers.ListField(child=serializers.UUIDField(), allow_empty=True, max_length=500)
+
+
+class CarReserveAnyRequestSerializer(serializers.Serializer):
+    """Критерии выбора свободного авто; все необязательны."""
+    type = serializers.ChoiceField(choices=Car.CarType.choices, required=False)
+    brand = serializers.CharField(max_length=80, required=False)
+    maxPrice = serializers.IntegerField(min_value=0, required=False)
+    minPower = serializers.IntegerField(min_value=0, required=False)
+
+
 class CarResponseSerializer(serializers.ModelSerializer):
     carUid = serializers.UUIDField(source="car_uid", read_only=True)
     registrationNumber = serializers.CharField(source="registration_number")
@@ -17,4 +32,7 @@ class CarResponseSerializer(serializers.ModelSerializer):
             "type",
             "price",
             "available",
-        ]
\ No newline at end of file
+        ]
+
+# Списки авто – из values_list() без экземпляров Car (ответ как у CarResponseSerializer)
+car_rows = FieldMapper(CarResponseSerializer)
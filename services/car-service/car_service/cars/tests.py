@@ -0,0 +1,375 @@
+import json
+import uuid
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from rest_framework.renderers import JSONRenderer
+from service_common.json_codec import FastJSONRenderer
+from service_common.testing import MetricsEndpointTestsMixin
+
+from .models import Car, FleetCounter
+from .serializers import CarResponseSerializer, car_rows
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from _plan_nodes(child)
+
+
+class CarRowsParityTests(TestCase):
+    """Ответы из values_list() (car_rows) байт в байт совпадают с CarResponseSerializer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Car.objects.bulk_create([
+            Car(brand="Mercedes Benz", model="GLA 250", registration_number="ЛО777Х799", power=249,
+                price=3500, type=Car.CarType.SEDAN, availability=True),
+            Car(brand="Lada", model="Niva \"Legend\"", registration_number="А001АА77", power=None,
+                price=0, type=Car.CarType.SUV, availability=False),
+            Car(brand="", model="Ω", registration_number="X", power=0,
+                price=2 ** 31 - 1, type=Car.CarType.ROADSTER, availability=True),
+        ])
+
+    def assertSameBytes(self, queryset):
+        expected = CarResponseSerializer(queryset, many=True).data
+        actual = car_rows.rows(car_rows.values_list(queryset))
+        for renderer in (JSONRenderer(), FastJSONRenderer()):
+            self.assertEqual(renderer.render(actual), renderer.render(expected))
+
+    def test_all_cars(self):
+        self.assertSameBytes(Car.objects.order_by("id"))
+
+    def test_available_cars(self):
+        self.assertSameBytes(Car.objects.filter(availability=True).order_by("id"))
+
+    def test_empty(self):
+        self.assertSameBytes(Car.objects.none())
+
+    def test_list_endpoint_matches_serializer(self):
+        response = self.client.get("/api/v1/cars/", {"showAll": "true", "size": 100})
+        expected = CarResponseSerializer(Car.objects.order_by("id"), many=True).data
+        self.assertEqual(response.json()["items"], json.loads(FastJSONRenderer().render(expected)))
+
+    def test_batch_endpoint_matches_serializer(self):
+        cars = Car.objects.order_by("id")
+        response = self.client.post("/api/v1/cars/batch/", {"carUids": [str(car.car_uid) for car in cars]},
+                                    content_type="application/json")
+        self.assertEqual(response.content, FastJSONRenderer().render(CarResponseSerializer(cars, many=True).data))
+
+
+def _car(i, **kwargs):
+    return Car(brand="Brand", model=f"Model {i}", registration_number=f"X{i:03d}", power=100,
+               price=1000, type=Car.CarType.SEDAN, **kwargs)
+
+
+class KeysetPaginationTests(TestCase):
+    """?cursor= – страницы по id без OFFSET, курсор следующей страницы в nextCursor."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Car.objects.bulk_create([_car(i, availability=i % 3 != 0) for i in range(7)])
+        FleetCounter.reseed()
+
+    def collect(self, size=3, **params):
+        pages, cursor = [], ""
+        while cursor is not None:
+            body = self.client.get("/api/v1/cars/", {**params, "cursor": cursor, "size": size}).json()
+            pages.append(body)
+            cursor = body["nextCursor"]
+        return pages
+
+    def test_pages_follow_id_order(self):
+        pages = self.collect(showAll="true")
+        uids = [item["carUid"] for page in pages for item in page["items"]]
+        self.assertEqual(uids, [str(uid) for uid in Car.objects.order_by("id").values_list("car_uid", flat=True)])
+        self.assertEqual([page["pageSize"] for page in pages], [3, 3, 2])
+        self.assertEqual({page["totalElements"] for page in pages}, {Car.objects.count()})
+
+    def test_last_page_has_no_cursor(self):
+        body = self.client.get("/api/v1/cars/", {"showAll": "true", "cursor": "", "size": 100}).json()
+        self.assertEqual(body["pageSize"], Car.objects.count())
+        self.assertIsNone(body["nextCursor"])
+
+    def test_exact_last_page_has_no_cursor(self):
+        # Последняя страница заполнена целиком: лишней строки нет – nextCursor=null, пустой страницы за ней нет
+        total = Car.objects.count()
+        pages = self.collect(size=total // 2, showAll="true")
+        self.assertEqual([page["pageSize"] for page in pages], [total // 2, total // 2])
+
+    def test_available_only(self):
+        pages = self.collect(showAll="false")
+        self.assertEqual([page["pageSize"] for page in pages], [3, 2])
+        self.assertEqual({page["totalElements"] for page in pages}, {Car.objects.filter(availability=True).count()})
+        self.assertTrue(all(item["available"] for page in pages for item in page["items"]))
+
+    def test_invalid_cursor(self):
+        for cursor in ("###", "YWJj"):  # не base64 и base64 не от числа
+            response = self.client.get("/api/v1/cars/", {"cursor": cursor})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("cursor", response.json())
+
+
+class FleetCounterTests(TestCase):
+    """totalElements берётся из FleetCounter – его ведут все пути, меняющие парк."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Car.objects.bulk_create([_car(i, availability=True) for i in range(3)])
+        FleetCounter.reseed()
+
+    def assertCounter(self):
+        self.assertEqual(FleetCounter.totals(), {
+            "total": Car.objects.count(),
+            "available": Car.objects.filter(availability=True).count(),
+        })
+
+    def test_create(self):
+        for available in (True, False):
+            response = self.client.post("/api/v1/cars/", {
+                "brand": "Lada", "model": "Vesta", "registrationNumber": "А001АА77", "power": 106,
+                "type": "SEDAN", "price": 900, "available": available,
+            }, content_type="application/json")
+            self.assertEqual(response.status_code, 201)
+            self.assertCounter()
+
+    def test_update(self):
+        car = Car.objects.first()
+        response = self.client.patch(f"/api/v1/cars/{car.car_uid}/", {"available": False},
+                                     content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertCounter()
+
+    def test_destroy(self):
+        available, reserved = Car.objects.order_by("id")[:2]
+        self.client.post(f"/api/v1/cars/{reserved.car_uid}/reserve/")
+        self.assertCounter()
+        for car in (available, reserved):
+            self.assertEqual(self.client.delete(f"/api/v1/cars/{car.car_uid}/").status_code, 204)
+            self.assertCounter()
+
+    def test_reserve_and_release(self):
+        car = Car.objects.first()
+        for action in ("reserve", "release"):
+            self.assertEqual(self.client.post(f"/api/v1/cars/{car.car_uid}/{action}/").status_code, 200)
+            self.assertCounter()
+
+    def test_reseed_command_repairs_drift(self):
+        FleetCounter.add(total=5, available=-2)
+        FleetCounter.objects.filter(shard=3).delete()
+        out = StringIO()
+        call_command("recount_fleet", stdout=out)
+        self.assertCounter()
+        self.assertEqual(FleetCounter.objects.count(), FleetCounter.SHARDS)
+        self.assertIn(f"-> {Car.objects.count()}, available: ", out.getvalue())
+
+    def test_existing_page_survives_lagging_counter(self):
+        # Авто добавлены в обход API – счётчик отстал, но страница 2 есть в таблице
+        Car.objects.bulk_create([_car(i, availability=True) for i in range(10, 20)])
+        response = self.client.get("/api/v1/cars/", {"page": 2, "size": 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["pageSize"], Car.objects.count() - 10)
+        self.assertEqual(response.json()["totalElements"], Car.objects.count())
+        self.assertEqual(self.client.get("/api/v1/cars/", {"page": 3, "size": 10}).status_code, 404)
+
+
+class AvailabilityTests(TestCase):
+    """reserve/release и bulk-варианты: один условный UPDATE, счётчик – только по изменённым строкам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.free, cls.busy = Car.objects.bulk_create([_car(1, availability=True), _car(2, availability=False)])
+        FleetCounter.reseed()
+
+    def setUp(self):
+        self.available = FleetCounter.totals()["available"]
+
+    def assertAvailableDelta(self, delta):
+        self.assertEqual(FleetCounter.totals()["available"], self.available + delta)
+        self.assertEqual(FleetCounter.totals()["available"], Car.objects.filter(availability=True).count())
+
+    def post(self, url, data=None):
+        return self.client.post(url, data, content_type="application/json")
+
+    def test_reserve(self):
+        response = self.post(f"/api/v1/cars/{self.free.car_uid}/reserve/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["carUid"], str(self.free.car_uid))
+        self.assertFalse(response.json()["available"])
+        self.assertAvailableDelta(-1)
+
+    def test_release(self):
+        response = self.post(f"/api/v1/cars/{self.busy.car_uid}/release/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["available"])
+        self.assertAvailableDelta(+1)
+
+    def test_conflict_keeps_counter(self):
+        for uid, action, message in ((self.busy.car_uid, "reserve", "Авто уже в резерве."),
+                                     (self.free.car_uid, "release", "Авто уже доступно.")):
+            response = self.post(f"/api/v1/cars/{uid}/{action}/")
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.json(), {"message": message})
+            self.assertAvailableDelta(0)
+
+    def test_unknown_car(self):
+        for action in ("reserve", "release"):
+            self.assertEqual(self.post(f"/api/v1/cars/{uuid.uuid4()}/{action}/").status_code, 404)
+        self.assertEqual(self.post("/api/v1/cars/not-a-uuid/reserve/").status_code, 404)
+        self.assertAvailableDelta(0)
+
+    def test_set_availability_returns_changed_rows_only(self):
+        uids = [self.free.car_uid, self.busy.car_uid, uuid.uuid4()]
+        rows = Car.set_availability(uids, False, ["car_uid", "availability"])
+        self.assertEqual(rows, [(self.free.car_uid, False)])
+        self.assertAvailableDelta(-1)
+        self.assertEqual(Car.set_availability([self.free.car_uid], False, ["car_uid"]), [])
+        self.assertEqual(Car.set_availability([], True, ["car_uid"]), [])
+        self.assertAvailableDelta(-1)
+
+    def test_bulk_reserve(self):
+        unknown = uuid.uuid4()
+        uids = [self.free.car_uid, self.busy.car_uid, unknown, self.free.car_uid]
+        response = self.post("/api/v1/cars/bulk-reserve/", {"carUids": [str(uid) for uid in uids]})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([item["carUid"] for item in body["items"]], [str(self.free.car_uid)])
+        self.assertFalse(body["items"][0]["available"])
+        # Повторы uid схлопываются, занятые и неизвестные – в skipped
+        self.assertEqual(body["skipped"], [str(self.busy.car_uid), str(unknown)])
+        self.assertAvailableDelta(-1)
+
+    def test_bulk_release(self):
+        uids = [str(self.free.car_uid), str(self.busy.car_uid)]
+        body = self.post("/api/v1/cars/bulk-release/", {"carUids": uids}).json()
+        self.assertEqual([item["carUid"] for item in body["items"]], [str(self.busy.car_uid)])
+        self.assertEqual(body["skipped"], [str(self.free.car_uid)])
+        self.assertAvailableDelta(+1)
+
+        body = self.post("/api/v1/cars/bulk-release/", {"carUids": uids}).json()
+        self.assertEqual(body, {"items": [], "skipped": uids})
+        self.assertAvailableDelta(+1)
+
+    def test_bulk_validation(self):
+        self.assertEqual(self.post("/api/v1/cars/bulk-reserve/", {"carUids": ["nope"]}).status_code, 400)
+        self.assertEqual(self.post("/api/v1/cars/bulk-reserve/", {}).status_code, 400)
+        self.assertEqual(self.post("/api/v1/cars/bulk-reserve/", {"carUids": []}).json(), {"items": [], "skipped": []})
+        self.assertAvailableDelta(0)
+
+
+class ReserveAnyTests(TestCase):
+    """reserve-any: первое по id свободное авто, подходящее под все заданные критерии."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Car.objects.update(availability=False)  # авто из миграции не мешает выбору
+        cls.cars = {car.model: car for car in Car.objects.bulk_create([
+            Car(brand="Lada", model="Niva", registration_number="A1", power=80, price=900,
+                type=Car.CarType.SUV, availability=True),
+            Car(brand="BMW", model="X5", registration_number="A2", power=340, price=5000,
+                type=Car.CarType.SUV, availability=True),
+            Car(brand="BMW", model="Z4", registration_number="A3", power=None, price=4000,
+                type=Car.CarType.ROADSTER, availability=True),
+            Car(brand="BMW", model="M5", registration_number="A4", power=600, price=7000,
+                type=Car.CarType.SEDAN, availability=False),
+        ])}
+        FleetCounter.reseed()
+
+    def reserve_any(self, **criteria):
+        return self.client.post("/api/v1/cars/reserve-any/", criteria, content_type="application/json")
+
+    def assertReserves(self, model, **criteria):
+        response = self.reserve_any(**criteria)
+        self.assertEqual(response.status_code, 200, criteria)
+        self.assertEqual(response.json()["carUid"], str(self.cars[model].car_uid), criteria)
+        self.assertFalse(response.json()["available"])
+        self.assertFalse(Car.objects.get(car_uid=self.cars[model].car_uid).availability)
+
+    def test_no_criteria(self):
+        self.assertReserves("Niva")
+
+    def test_type(self):
+        self.assertReserves("Z4", type="ROADSTER")
+
+    def test_brand(self):
+        self.assertReserves("X5", brand="BMW")
+
+    def test_max_price(self):
+        self.assertReserves("Z4", brand="BMW", maxPrice=4000)
+
+    def test_min_power(self):
+        # Авто без мощности под minPower не попадает
+        self.assertReserves("X5", minPower=100)
+
+    def test_skips_reserved(self):
+        self.assertReserves("X5", brand="BMW")
+        self.assertReserves("Z4", brand="BMW")
+
+    def test_no_match(self):
+        available = FleetCounter.totals()["available"]
+        for criteria in ({"type": "SEDAN"}, {"brand": "Lada", "minPower": 100}, {"maxPrice": 100}):
+            response = self.reserve_any(**criteria)
+            self.assertEqual(response.status_code, 409, criteria)
+            self.assertEqual(response.json(), {"message": "Нет свободных авто по заданным критериям."})
+        self.assertEqual(FleetCounter.totals()["available"], available)
+
+    def test_counter(self):
+        self.assertReserves("Niva")
+        self.assertEqual(FleetCounter.totals()["available"], Car.objects.filter(availability=True).count())
+
+    def test_invalid_criteria(self):
+        for criteria in ({"type": "TRUCK"}, {"maxPrice": -1}, {"minPower": "many"}):
+            self.assertEqual(self.reserve_any(**criteria).status_code, 400, criteria)
+
+
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN-тесты индексов – только на Postgres (TEST_DB=postgres)")
+class HotQueryIndexTests(TestCase):
+    """
+    Горячие запросы должны идти по индексам. Таблица засеивается так, чтобы читать
+    её целиком планировщику было невыгодно, после ANALYZE проверяется план EXPLAIN.
+    """
+    CARS = 20000
+
+    @classmethod
+    def setUpTestData(cls):
+        # Большая часть парка в резерве: доступные авто – малая доля таблицы
+        Car.objects.bulk_create(
+            (Car(brand="Brand", model=f"Model {i % 50}", registration_number=f"X{i:06d}",
+                 price=1000, type=Car.CarType.SEDAN, availability=i % 20 == 0)
+             for i in range(cls.CARS)),
+            batch_size=2000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE cars")
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        nodes = list(_plan_nodes(json.loads(queryset.explain(format="json"))["Plan"]))
+        self.assertFalse([node for node in nodes if node["Node Type"] == "Seq Scan"],
+                         f"Seq Scan в плане: {nodes}")
+        used = {node.get("Index Name") for node in nodes if "Index" in node["Node Type"]}
+        if index_name is None:
+            self.assertTrue(used, f"Нет индексного доступа в плане: {nodes}")
+        else:
+            self.assertIn(index_name, used)
+
+    def test_available_cars_page_uses_partial_index(self):
+        self.assertUsesIndex(Car.objects.filter(availability=True).order_by("id")[:11], "cars_available_id_idx")
+
+    def test_available_cars_keyset_page_uses_partial_index(self):
+        qs = Car.objects.filter(availability=True, id__gt=self.CARS // 2).order_by("id")[:11]
+        self.assertUsesIndex(qs, "cars_available_id_idx")
+
+    def test_car_by_uid_uses_unique_index(self):
+        car = Car.objects.order_by("id")[self.CARS // 2]
+        self.assertUsesIndex(Car.objects.filter(car_uid=car.car_uid))
+
+    def test_cars_batch_uses_unique_index(self):
+        uids = list(Car.objects.order_by("?").values_list("car_uid", flat=True)[:20])
+        self.assertUsesIndex(Car.objects.filter(car_uid__in=uids).order_by("id"))
+
+
+class MetricsTests(MetricsEndpointTestsMixin, SimpleTestCase):
+    """/manage/metrics сервиса: гистограмма запросов и multiprocess-режим."""
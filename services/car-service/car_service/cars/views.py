@@ -1,11 +1,17 @@
+import uuid
+
+from django.db import transaction
+from django.http import Http404
+from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from .models import Car
-from .serializers import CarResponseSerializer
+from .models import Car, FleetCounter
+from .serializers import CarResponseSerializer, CarBatchRequestSerializer, CarReserveAnyRequestSerializer, car_rows
 from .pagination import ApiPagination
 
+
 def define_bool(raw_string) -> bool:
     if not isinstance(raw_string, str):
         return True
@@ -21,6 +27,16 @@ class CarViewSet(viewsets.ModelViewSet):
     GET /api/v1/cars?showAll=true&page=...&size=...
       - по умолчанию только доступные (available=true)
       - c showAll=true вернёт и в резерве (available=false)
+      - ?cursor= вместо ?page= – keyset-пагинация по id (см. ApiPagination)
+      - totalElements – из FleetCounter, который ведут create/update/destroy и reserve/release
+    POST /api/v1/cars/batch {"carUids": [...]}
+      - пакетное чтение авто по списку uid (без пагинации и фильтра доступности)
+    POST /api/v1/cars/{carUid}/reserve, /release
+      - один UPDATE ... RETURNING; 409, если авто уже в этом состоянии
+    POST /api/v1/cars/bulk-reserve, /bulk-release {"carUids": [...]}
+      - то же для списка авто одним запросом: {"items": [изменённые], "skipped": [uid]}
+    POST /api/v1/cars/reserve-any {"type", "brand", "maxPrice", "minPower"}
+      - выбрать и зарезервировать любое свободное авто по критериям; 409, если таких нет
     """
     serializer_class = CarResponseSerializer
     pagination_class = ApiPagination
@@ -39,22 +55,115 @@ class CarViewSet(viewsets.ModelViewSet):
             qs = qs.filter(availability=True)
         return qs
 
+    def list(self, request, *args, **kwargs):
+        # Страница собирается из values_list(), без экземпляров Car
+        page = self.paginate_queryset(car_rows.values_list(self.filter_queryset(self.get_queryset())))
+        return self.get_paginated_response(car_rows.rows(page))
+
+    def get_total_count(self) -> int:
+        totals = FleetCounter.totals()
+        return totals["total"] if define_bool(self.request.query_params.get("showAll")) else totals["available"]
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        car = serializer.save()
+        FleetCounter.add(total=1, available=int(car.availability))
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        was_available = serializer.instance.availability
+        car = serializer.save()
+        FleetCounter.add(available=int(car.availability) - int(was_available))
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        FleetCounter.add(total=-1, available=-int(instance.availability))
+        instance.delete()
+
+    @action(detail=False, methods=["post"], url_path="batch")
+    def batch(self, request):
+        """Вернуть авто по списку carUid одним запросом (WHERE car_uid IN (...))."""
+        req = CarBatchRequestSerializer(data=request.data)
+        req.is_valid(raise_exception=True)
+        car_uids = req.validated_data["carUids"]
+        if not car_uids:
+            return Response([])
+        cars = car_rows.values_list(Car.objects.filter(car_uid__in=car_uids).order_by("id"))
+        return Response(car_rows.rows(cars))
+
+    @action(detail=False, methods=["post"], url_path="bulk-reserve")
+    def bulk_reserve(self, request):
+        """Зарезервировать авто по списку carUid одним UPDATE; занятые и неизвестные – в skipped."""
+        return self._set_many(request, False)
+
+    @action(detail=False, methods=["post"], url_path="bulk-release")
+    def bulk_release(self, request):
+        """Снять резерв с авто по списку carUid одним UPDATE; свободные и неизвестные – в skipped."""
+        return self._set_many(request, True)
+
+    @action(detail=False, methods=["post"], url_path="reserve-any")
+    def reserve_any(self, request):
+        """
+        Зарезервировать любое подходящее свободное авто. Кандидат выбирается
+        SELECT ... FOR UPDATE SKIP LOCKED: авто, которые сейчас резервируют другие
+        запросы, пропускаются, поэтому параллельные резервы расходятся по парку,
+        а не ждут блокировки и не проигрывают гонку за одно и то же авто.
+        """
+        req = CarReserveAnyRequestSerializer(data=request.data)
+        req.is_valid(raise_exception=True)
+        criteria = req.validated_data
+
+        candidates = Car.objects.filter(availability=True)
+        if "type" in criteria:
+            candidates = candidates.filter(type=criteria["type"])
+        if "brand" in criteria:
+            candidates = candidates.filter(brand=criteria["brand"])
+        if "maxPrice" in criteria:
+            candidates = candidates.filter(price__lte=criteria["maxPrice"])
+        if "minPower" in criteria:
+            candidates = candidates.filter(power__gte=criteria["minPower"])
+
+        with transaction.atomic():
+            car_uid = (candidates.select_for_update(skip_locked=True)
+                       .order_by("id").values_list("car_uid", flat=True).first())
+            # Строка заблокирована этой транзакцией – условный UPDATE не может проиграть
+            rows = Car.set_availability([car_uid], False, car_rows.row_fields) if car_uid else []
+        if not rows:
+            return Response({"message": "Нет свободных авто по заданным критериям."},
+                            status=status.HTTP_409_CONFLICT)
+        return Response(car_rows.rows(rows)[0], status=status.HTTP_200_OK)
+
     @action(detail=True, methods=["post"], url_path="reserve")
     def reserve(self, request, car_uid=None):
         """Пометить авто как зарезервированное (available=false)."""
-        car = self.get_object()
-        if car.availability is False:
-            return Response({"message": "Авто уже в резерве."}, status=status.HTTP_409_CONFLICT)
-        car.availability = False
-        car.save(update_fields=["availability"])
-        return Response(self.get_serializer(car).data, status=status.HTTP_200_OK)
+        return self._set_one(car_uid, False, "Авто уже в резерве.")
 
     @action(detail=True, methods=["post"], url_path="release")
     def release(self, request, car_uid=None):
         """Снять резерв с авто (available=true)."""
-        car = self.get_object()
-        if car.availability is True:
-            return Response({"message": "Авто уже доступно."}, status=status.HTTP_409_CONFLICT)
-        car.availability = True
-        car.save(update_fields=["availability"])
-        return Response(self.get_serializer(car).data, status=status.HTTP_200_OK)
+        return self._set_one(car_uid, True, "Авто уже доступно.")
+
+    @staticmethod
+    def _set_one(car_uid, available: bool, conflict_message: str):
+        try:
+            uid = uuid.UUID(str(car_uid))
+        except ValueError:
+            raise Http404
+        rows = Car.set_availability([uid], available, car_rows.row_fields)
+        if rows:
+            return Response(car_rows.rows(rows)[0], status=status.HTTP_200_OK)
+        # Второй запрос – только если ничего не изменилось: авто нет (404) или оно уже в этом состоянии (409)
+        get_object_or_404(Car.objects.only("id"), car_uid=uid)
+        return Response({"message": conflict_message}, status=status.HTTP_409_CONFLICT)
+
+    @staticmethod
+    def _set_many(request, available: bool):
+        req = CarBatchRequestSerializer(data=request.data)
+        req.is_valid(raise_exception=True)
+        car_uids = list(dict.fromkeys(req.validated_data["carUids"]))
+        items = car_rows.rows(Car.set_availability(car_uids, available, car_rows.row_fields))
+        changed = {item["carUid"] for item in items}
+        return Response({
+            "items": items,
+            "skipped": [str(uid) for uid in car_uids if str(uid) not in changed],
+        })
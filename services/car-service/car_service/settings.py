@@ -19,6 +19,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 import os
 from dotenv import load_dotenv
 
+from service_common.log_pipeline import build_logging
+
 load_dotenv()
 SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
 MODE = os.environ['MODE']
@@ -56,12 +58,32 @@ DATABASES = {
     }
 }
 
-if "test" in sys.argv:  # manage.py test
+# manage.py test – на sqlite; TEST_DB=postgres оставляет Postgres (нужно EXPLAIN-тестам индексов)
+if "test" in sys.argv and os.environ.get("TEST_DB") != "postgres":
     DATABASES["default"] = {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": os.path.join(BASE_DIR, "testdb.sqlite3"),
     }
 
+# Структурированные логи через очередь; успешные записи сэмплируются по маршруту
+# (LOG_SAMPLE_RATES), ошибки и медленные запросы пишутся всегда
+LOGGING = build_logging(
+    loggers={
+        "django": "INFO",
+        "car_service": "INFO",
+    },
+    sample_rates=os.environ.get("LOG_SAMPLE_RATES", ""),
+    default_rate=float(os.environ.get("LOG_DEFAULT_SAMPLE_RATE", "1.0")),
+    slow_ms=float(os.environ.get("LOG_SLOW_MS", "1000")),
+)
+
+# Трассировка: контекст идёт между сервисами в заголовке traceparent,
+# готовые спаны пишет TRACING_EXPORTER (none | memory | file | dotted path)
+TRACING_SERVICE_NAME = "car-service"
+TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER", "none")
+TRACING_FILE = os.environ.get("TRACING_FILE", "/tmp/traces.jsonl")
+TRACING_MEMORY_SIZE = int(os.environ.get("TRACING_MEMORY_SIZE", "10000"))
+
 # --------------------------------------------------------------------------
 
 
@@ -86,12 +108,18 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny'
     ],
+    # JSON через orjson (см. service_common/json_codec.py)
+    "DEFAULT_RENDERER_CLASSES": ["service_common.json_codec.FastJSONRenderer"],
+    "DEFAULT_PARSER_CLASSES": ["service_common.json_codec.FastJSONParser"],
     "DEFAULT_PAGINATION_CLASS": "car_service.cars.pagination.ApiPagination",
     "PAGE_SIZE": 10,
 }
 
 MIDDLEWARE = [
+    'service_common.metrics.metrics_middleware',
+    'service_common.tracing.tracing_middleware',
     'django.middleware.security.SecurityMiddleware',
+    'service_common.deadline.DeadlineMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.http import JsonResponse
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from service_common.metrics import metrics_view
 
 from .cars.views import CarViewSet
 
@@ -33,4 +34,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include(router.urls)),
     path('manage/health', health_check, name='health-check'),
+    path('manage/metrics', metrics_view, name='metrics'),
 ]
@@ -2,6 +2,13 @@
 
 set -eu
 
+# Каталог метрик prometheus_client (multiprocess-режим): общий для всех воркеров gunicorn,
+# очищается при старте, чтобы не подхватить значения прошлого запуска
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+chown appuser:appuser "$PROMETHEUS_MULTIPROC_DIR"
+
 python manage.py migrate --noinput
 
 # Параметры
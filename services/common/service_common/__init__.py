@@ -0,0 +1,12 @@
+"""
+Общий код всех сервисов (car, rental, payment, gateway).
+
+- metrics – метрики Prometheus и /manage/metrics;
+- tracing – трассировка по W3C traceparent;
+- log_pipeline – структурированное логирование через очередь;
+- json_codec – рендерер и парсер DRF на orjson;
+- deadline – отказ от запросов шлюза, дедлайн которых уже прошёл.
+
+Ставится в образ каждого сервиса (pip install services/common), локально –
+через requirements.txt в корне репозитория.
+"""
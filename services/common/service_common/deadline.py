@@ -0,0 +1,37 @@
+"""
+Дедлайн запроса от шлюза на стороне сервиса.
+
+Шлюз передаёт в X-Request-Deadline момент (unix-время в мс), после которого ответ
+ему уже не нужен. Ответ 504 по дедлайну помечается X-Deadline-Exceeded: так шлюз
+отличает свой исчерпанный бюджет от таймаута самого сервиса и не считает
+такой ответ сбоем сервиса.
+"""
+import time
+
+from django.http import JsonResponse
+
+DEADLINE_HEADER = "X-Request-Deadline"
+DEADLINE_EXCEEDED_HEADER = "X-Deadline-Exceeded"
+
+
+class DeadlineMiddleware:
+    """
+    Если запрос пришёл после дедлайна (долго ждал в очереди воркера),
+    не выполняем его и сразу отвечаем 504 с X-Deadline-Exceeded.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        value = request.headers.get(DEADLINE_HEADER)
+        if value:
+            try:
+                expired = int(value) / 1000 <= time.time()
+            except ValueError:
+                expired = False
+            if expired:
+                response = JsonResponse({"message": "Request deadline exceeded"}, status=504)
+                response[DEADLINE_EXCEEDED_HEADER] = "1"
+                return response
+        return self.get_response(request)
@@ -0,0 +1,65 @@
+"""
+Быстрый JSON (orjson) для DRF и для межсервисных вызовов.
+
+Каждый переход запроса (шлюз -> сервис -> шлюз) разбирает и заново собирает
+JSON, поэтому stdlib json – заметная доля CPU на запрос. orjson делает то же
+в разы быстрее и сам сериализует UUID, datetime/date и dataclass'ы; Decimal
+отдаётся числом, как у JSONEncoder DRF.
+
+Рендерер и парсер подключаются в REST_FRAMEWORK (DEFAULT_RENDERER_CLASSES,
+DEFAULT_PARSER_CLASSES) – при желании их можно заменить своими.
+"""
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+
+# Время в UTC – с суффиксом Z, как у JSONEncoder DRF; ключи-не-строки (UUID, int) допустимы
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+JSONDecodeError = orjson.JSONDecodeError
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, Promise):
+        # ленивые переводы в сообщениях об ошибках
+        return force_str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_default, option=OPTIONS)
+
+
+def loads(data: Any) -> Any:
+    return orjson.loads(data)
+
+
+class FastJSONRenderer(BaseRenderer):
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        if data is None:
+            return b""
+        return dumps(data)
+
+
+class FastJSONParser(BaseParser):
+    media_type = "application/json"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return loads(stream.read())
+        except JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
@@ -0,0 +1,169 @@
+"""
+Структурированное логирование, не блокирующее обработку запросов.
+
+- QueuedStreamHandler: запись кладётся в ограниченную очередь, форматирование
+  и вывод в stdout делает отдельный поток. При переполнении записи
+  отбрасываются (и считаются), а не тормозят запрос.
+- JsonFormatter: одна JSON-строка на запись, поля из extra попадают в неё как есть.
+- SamplingFilter: пропускает лишь долю записей по маршруту (extra route),
+  но ошибки (WARNING и выше) и медленные вызовы (extra duration_ms) – всегда.
+- BodyPreview: превью тела ответа, которое строится только при форматировании,
+  то есть когда запись действительно выводится.
+
+Подключается через LOGGING в settings.py, см. build_logging().
+"""
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from typing import Any, Optional
+
+# Атрибуты, которые есть у любой LogRecord; всё остальное пришло через extra
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class BodyPreview:
+    """Первые limit символов тела ответа; тело декодируется только в __str__."""
+    __slots__ = ("response", "limit")
+
+    def __init__(self, response: Any, limit: int = 1000):
+        self.response = response
+        self.limit = limit
+
+    def __str__(self) -> str:
+        try:
+            text = self.response.text
+        except Exception:
+            return "<non-text response>"
+        return text[:self.limit] + ("..." if len(text) > self.limit else "")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def parse_rates(value: str) -> dict[str, float]:
+    """'/cars:0.01,/payment:0.1' -> {'/cars': 0.01, '/payment': 0.1}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        route, _, rate = item.rpartition(":")
+        rates[route] = float(rate)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Доля пропускаемых записей по префиксу маршрута (самый длинный совпавший префикс),
+    default_rate – для остальных маршрутов. Записи без route не сэмплируются.
+    """
+
+    def __init__(self, rates: Optional[dict[str, float]] = None, default_rate: float = 1.0,
+                 slow_ms: Optional[float] = None):
+        super().__init__()
+        # Длинные префиксы проверяем первыми
+        self.rates = sorted((rates or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self.default_rate = default_rate
+        self.slow_ms = slow_ms
+
+    def rate_for(self, route: str) -> float:
+        for prefix, rate in self.rates:
+            if route.startswith(prefix):
+                return rate
+        return self.default_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        route = getattr(record, "route", None)
+        if route is None:
+            return True
+        duration_ms = getattr(record, "duration_ms", None)
+        if self.slow_ms is not None and duration_ms is not None and duration_ms >= self.slow_ms:
+            return True
+        rate = self.rate_for(route)
+        return rate >= 1.0 or random.random() < rate
+
+
+class QueuedStreamHandler(logging.handlers.QueueHandler):
+    """
+    Вывод в stream (по умолчанию stdout) через фоновый поток.
+    Форматтер, заданный этому хендлеру, применяется уже в фоновом потоке.
+    """
+
+    def __init__(self, stream=None, queue_size: int = 10000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.dropped = 0
+        self._target = logging.StreamHandler(stream or sys.stdout)
+        self._listener = logging.handlers.QueueListener(self.queue, self._target, respect_handler_level=False)
+        self._listener.start()
+        atexit.register(self._stop_listener)
+
+    def setFormatter(self, fmt: Optional[logging.Formatter]) -> None:
+        # Форматирует целевой хендлер в фоновом потоке, а не вызывающий код
+        self._target.setFormatter(fmt)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Не форматируем в потоке запроса: сообщение и превью тела соберёт фоновый поток
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _stop_listener(self) -> None:
+        # close() и atexit могут прийти оба – останавливаем один раз, дописав очередь
+        if self._listener._thread is not None:
+            self._listener.stop()
+
+    def close(self) -> None:
+        self._stop_listener()
+        super().close()
+
+
+def build_logging(loggers: dict[str, str], sample_rates: str = "", default_rate: float = 1.0,
+                  slow_ms: Optional[float] = None, queue_size: int = 10000) -> dict:
+    """Конфигурация для settings.LOGGING: loggers – {имя логгера: уровень}."""
+    return {
+        "version": 1,
+        "disable_existing_loggers": False,
+        "formatters": {
+            "json": {"()": JsonFormatter},
+        },
+        "filters": {
+            "sampling": {
+                "()": SamplingFilter,
+                "rates": parse_rates(sample_rates),
+                "default_rate": default_rate,
+                "slow_ms": slow_ms,
+            },
+        },
+        "handlers": {
+            "queued": {
+                "()": QueuedStreamHandler,
+                "queue_size": queue_size,
+                "formatter": "json",
+                "filters": ["sampling"],
+            },
+        },
+        "loggers": {
+            name: {"handlers": ["queued"], "level": level, "propagate": False}
+            for name, level in loggers.items()
+        },
+    }
@@ -0,0 +1,103 @@
+"""
+Метрики Prometheus для /manage/metrics.
+
+Воркеры gunicorn – отдельные процессы, поэтому prometheus_client работает
+в multiprocess-режиме: каждый процесс пишет значения в mmap-файлы в
+PROMETHEUS_MULTIPROC_DIR (каталог готовит entrypoint.sh), а /manage/metrics
+собирает их при запросе. Без этой переменной (runserver, тесты) метрики
+живут в обычном реестре процесса.
+
+Значения, которые дешевле прочитать при сборе, чем обновлять на каждом
+запросе (длина очереди, состояние breaker'ов), отдают коллекторы из
+SCRAPE_REGISTRY – они вызываются только при запросе /manage/metrics.
+"""
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Время обработки входящего запроса",
+    ["route", "method", "status"],
+)
+DB_QUERIES = Counter("db_queries_total", "Число SQL-запросов", ["alias"])
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Время выполнения SQL-запроса", ["alias"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+# Коллекторы, которые считают значения в момент сбора метрик
+SCRAPE_REGISTRY = CollectorRegistry(auto_describe=False)
+
+
+def _route(request) -> str:
+    """Шаблон маршрута вместо пути: uid в пути не должны плодить временные ряды."""
+    match = getattr(request, "resolver_match", None)
+    return f"/{match.route}" if match is not None else "unmatched"
+
+
+def _observe(request, response, started: float) -> None:
+    REQUEST_SECONDS.labels(_route(request), request.method, str(response.status_code)).observe(
+        time.perf_counter() - started
+    )
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            started = time.perf_counter()
+            response = await get_response(request)
+            _observe(request, response, started)
+            return response
+    else:
+        def middleware(request):
+            started = time.perf_counter()
+            response = get_response(request)
+            _observe(request, response, started)
+            return response
+    return middleware
+
+
+class _QueryTimer:
+    """execute_wrapper соединения: считает и замеряет каждый SQL-запрос."""
+
+    def __init__(self, alias: str):
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            DB_QUERIES.labels(self.alias).inc()
+            DB_QUERY_SECONDS.labels(self.alias).observe(time.perf_counter() - started)
+
+
+def _instrument_connection(sender, connection, **kwargs):
+    if not any(isinstance(wrapper, _QueryTimer) for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.append(_QueryTimer(connection.alias))
+
+
+connection_created.connect(_instrument_connection, dispatch_uid="metrics_query_timer")
+# Соединения, открытые до импорта модуля (например, в тестах)
+for _connection in connections.all(initialized_only=True):
+    _instrument_connection(None, _connection)
+
+
+def metrics_view(request):
+    """GET /manage/metrics – метрики в текстовом формате Prometheus."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    body = generate_latest(registry) + generate_latest(SCRAPE_REGISTRY)
+    return HttpResponse(body, content_type=CONTENT_TYPE_LATEST)
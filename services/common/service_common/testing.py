@@ -0,0 +1,52 @@
+"""
+Общие проверки для тестов сервисов: подмешиваются к SimpleTestCase в tests.py сервиса,
+чтобы каждый сервис проверял свою сборку (middleware, urls), а не копию проверок.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from unittest.mock import patch
+
+from django.conf import settings
+from prometheus_client import CONTENT_TYPE_LATEST
+
+# Воркер gunicorn в multiprocess-режиме: обслуживает запросы и пишет метрики в mmap-файлы
+_WORKER = """
+import django
+django.setup()
+from django.test import Client
+client = Client()
+for _ in range(2):
+    assert client.get("/manage/health").status_code == 200
+"""
+
+# prometheus_client выводит метки по алфавиту, le – первой
+_HEALTH_LABELS = 'method="GET",route="/manage/health",status="200"'
+
+
+class MetricsEndpointTestsMixin:
+    """GET /manage/metrics: текст Prometheus с гистограммой входящих запросов."""
+
+    def test_metrics_expose_request_histogram(self):
+        self.assertEqual(self.client.get("/manage/health").status_code, 200)
+        response = self.client.get("/manage/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], CONTENT_TYPE_LATEST)
+        body = response.content.decode()
+        self.assertIn("# TYPE http_request_duration_seconds histogram", body)
+        # _count – счётчик запросов, _bucket – распределение их длительности
+        self.assertRegex(body, rf"http_request_duration_seconds_count\{{{_HEALTH_LABELS}\}} [1-9]")
+        self.assertIn(f'http_request_duration_seconds_bucket{{le="+Inf",{_HEALTH_LABELS}}}', body)
+
+    def test_metrics_multiprocess(self):
+        with tempfile.TemporaryDirectory() as path:
+            env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": path}
+            subprocess.run([sys.executable, "-c", _WORKER], env=env, cwd=settings.BASE_DIR,
+                           check=True, capture_output=True, timeout=60)
+            self.assertTrue(os.listdir(path))
+            with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": path}):
+                response = self.client.get("/manage/metrics")
+        self.assertEqual(response.status_code, 200)
+        # Значения собраны из файлов воркера, а не из реестра этого процесса
+        self.assertIn(f"http_request_duration_seconds_count{{{_HEALTH_LABELS}}} 2.0", response.content.decode())
@@ -0,0 +1,292 @@
+import io
+import json
+import logging
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from unittest.mock import Mock, PropertyMock, patch
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from . import tracing
+from .deadline import DEADLINE_EXCEEDED_HEADER, DEADLINE_HEADER, DeadlineMiddleware
+from .json_codec import FastJSONParser, FastJSONRenderer, dumps, loads
+from .log_pipeline import BodyPreview, JsonFormatter, QueuedStreamHandler, SamplingFilter, build_logging, parse_rates
+from .tracing import (
+    KIND_SERVER, FileExporter, InMemoryExporter, Span, current_span, parse_traceparent,
+    start_span, tracing_middleware,
+)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+class TracingTests(SimpleTestCase):
+    """Контекст трассы: разбор traceparent, вложенные спаны и экспорт в файл."""
+
+    def setUp(self):
+        self.exporter = InMemoryExporter()
+        patcher = patch.object(tracing, "EXPORTER", self.exporter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parse_traceparent(self):
+        self.assertEqual(parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01"), (TRACE_ID, PARENT_ID))
+        self.assertEqual(parse_traceparent(f" 00-{TRACE_ID}-{PARENT_ID}-00 "), (TRACE_ID, PARENT_ID))
+        for value in (None, "", "garbage", f"00-{TRACE_ID}-{PARENT_ID}", f"00-{TRACE_ID[:-1]}-{PARENT_ID}-01",
+                      f"00-{'0' * 32}-{PARENT_ID}-01", f"00-{TRACE_ID}-{'0' * 16}-01"):
+            self.assertIsNone(parse_traceparent(value), value)
+
+    def test_child_span_keeps_trace_id(self):
+        with start_span("parent") as parent:
+            with start_span("child") as child:
+                self.assertIs(current_span(), child)
+            self.assertIs(current_span(), parent)
+        self.assertIsNone(current_span())
+        self.assertEqual(child.trace_id, parent.trace_id)
+        self.assertEqual(child.parent_id, parent.span_id)
+        self.assertIsNone(parent.parent_id)
+        self.assertEqual(self.exporter.trace(parent.trace_id), [parent, child])
+
+    def test_failed_span(self):
+        with self.assertRaises(ValueError):
+            with start_span("boom") as span:
+                raise ValueError("boom")
+        self.assertEqual(span.status, "error")
+        self.assertIn("boom", span.attributes["error"])
+
+    def test_middleware_continues_incoming_trace(self):
+        seen = {}
+
+        def view(request):
+            with start_span("work") as span:
+                seen["traceparent"] = span.traceparent()
+            return HttpResponse(status=201)
+
+        request = RequestFactory().get("/x", HTTP_TRACEPARENT=f"00-{TRACE_ID}-{PARENT_ID}-01")
+        self.assertEqual(tracing_middleware(view)(request).status_code, 201)
+        server, work = sorted(self.exporter.trace(TRACE_ID), key=lambda span: span.kind != KIND_SERVER)
+        self.assertEqual((server.kind, server.parent_id), (KIND_SERVER, PARENT_ID))
+        self.assertEqual(work.parent_id, server.span_id)
+        self.assertEqual(server.attributes["http.status_code"], 201)
+        # Исходящий traceparent – та же трасса, родитель – текущий спан
+        self.assertEqual(parse_traceparent(seen["traceparent"]), (TRACE_ID, work.span_id))
+
+    def test_broken_traceparent_starts_new_trace(self):
+        tracing_middleware(lambda request: HttpResponse())(RequestFactory().get("/x", HTTP_TRACEPARENT="broken"))
+        (span,) = self.exporter.spans
+        self.assertIsNone(span.parent_id)
+        self.assertNotEqual(span.trace_id, TRACE_ID)
+
+    def test_file_exporter_writes_in_background(self):
+        fd, path = tempfile.mkstemp(suffix=".jsonl")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        exporter = FileExporter(path)
+        spans = [Span(f"span {i}", TRACE_ID, f"{i:016x}", PARENT_ID, attributes={"i": i}) for i in range(3)]
+        for span in spans:
+            exporter.export(span)
+        exporter.close()
+        # Повторный close() (atexit) ничего не делает
+        exporter.close()
+        with open(path, encoding="utf-8") as fh:
+            lines = [json.loads(line) for line in fh]
+        self.assertEqual([line["name"] for line in lines], [span.name for span in spans])
+        self.assertEqual(lines[0]["trace_id"], TRACE_ID)
+        self.assertEqual(exporter.dropped, 0)
+
+    def test_file_exporter_drops_when_queue_is_full(self):
+        exporter = FileExporter(os.devnull, queue_size=1)
+        self.addCleanup(exporter.close)
+        with patch.object(exporter._queue, "put_nowait", side_effect=queue.Full):
+            exporter.export(Span("lost", TRACE_ID, PARENT_ID))
+        self.assertEqual(exporter.dropped, 1)
+
+
+def _record(level: int = logging.INFO, msg: str = "call", args: tuple = (), **extra) -> logging.LogRecord:
+    return logging.makeLogRecord({"name": "svc", "levelno": level, "levelname": logging.getLevelName(level),
+                                  "msg": msg, "args": args, **extra})
+
+
+class LogPipelineTests(SimpleTestCase):
+    """Логи: сэмплирование по маршруту, JSON-строка на запись и вывод через фоновый поток."""
+
+    def test_parse_rates(self):
+        self.assertEqual(parse_rates(" /cars:0.01, /payment:0.1,,"), {"/cars": 0.01, "/payment": 0.1})
+        self.assertEqual(parse_rates(""), {})
+
+    def test_errors_and_slow_calls_always_pass(self):
+        sampling = SamplingFilter({"/cars": 0.0}, default_rate=0.0, slow_ms=500)
+        self.assertTrue(sampling.filter(_record(logging.WARNING, route="/cars")))
+        self.assertTrue(sampling.filter(_record(logging.ERROR, route="/cars")))
+        self.assertTrue(sampling.filter(_record(route="/cars", duration_ms=750)))
+        self.assertFalse(sampling.filter(_record(route="/cars", duration_ms=20)))
+        # Записи вне вызовов (без route) не сэмплируются
+        self.assertTrue(sampling.filter(_record()))
+
+    def test_sampled_levels_drop_at_configured_rate(self):
+        sampling = SamplingFilter({"/cars": 0.25, "/cars/batch": 1.0}, default_rate=0.5)
+        self.assertEqual(sampling.rate_for("/cars/batch/"), 1.0)
+        self.assertEqual(sampling.rate_for("/cars/1"), 0.25)
+        self.assertEqual(sampling.rate_for("/payment"), 0.5)
+        with patch("service_common.log_pipeline.random.random", side_effect=[0.1, 0.3, 0.2, 0.9]):
+            passed = [sampling.filter(_record(logging.DEBUG, route="/cars/1")) for _ in range(4)]
+        self.assertEqual(passed, [True, False, True, False])
+        self.assertTrue(sampling.filter(_record(route="/cars/batch/")))
+
+        sampling = SamplingFilter(default_rate=0.1)
+        passed = sum(sampling.filter(_record(route="/x")) for _ in range(10000))
+        self.assertAlmostEqual(passed / 10000, 0.1, delta=0.03)
+
+    def test_json_formatter(self):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = _record(logging.ERROR, "HTTP %s -> %s", ("GET", 503), route="/cars", duration_ms=12.5,
+                             peer=object(), _private=1)
+            record.exc_info = sys.exc_info()
+        data = json.loads(JsonFormatter().format(record))
+        self.assertEqual((data["level"], data["logger"], data["message"]), ("ERROR", "svc", "HTTP GET -> 503"))
+        # extra – как есть, несериализуемое – строкой, служебные атрибуты LogRecord – нет
+        self.assertEqual((data["route"], data["duration_ms"]), ("/cars", 12.5))
+        self.assertIsInstance(data["peer"], str)
+        self.assertNotIn("_private", data)
+        self.assertNotIn("lineno", data)
+        self.assertIn("ValueError: boom", data["exc_info"])
+
+    def test_queue_listener_formats_in_background(self):
+        stream = io.StringIO()
+        threads = []
+
+        class Formatter(JsonFormatter):
+            def format(self, record):
+                threads.append(threading.current_thread())
+                return super().format(record)
+
+        handler = QueuedStreamHandler(stream)
+        handler.setFormatter(Formatter())
+        response = PropertyMock(return_value="x" * 2000)
+        body = type("Response", (), {"text": response})()
+        for i in range(3):
+            handler.handle(_record(msg="call %s %s", args=(i, BodyPreview(body, limit=10))))
+        handler.close()
+
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([line["message"] for line in lines], [f"call {i} {'x' * 10}..." for i in range(3)])
+        self.assertNotIn(threading.current_thread(), threads)
+        self.assertEqual(handler.dropped, 0)
+
+    def test_queue_overflow_is_counted(self):
+        handler = QueuedStreamHandler(io.StringIO(), queue_size=1)
+        self.addCleanup(handler.close)
+        with patch.object(handler.queue, "put_nowait", side_effect=queue.Full):
+            handler.handle(_record())
+        self.assertEqual(handler.dropped, 1)
+
+    def test_filtered_record_does_not_read_body(self):
+        config = build_logging({"svc": "DEBUG"}, sample_rates="/cars:0")
+        sampling = config["filters"]["sampling"]
+        sampling = sampling["()"](**{key: value for key, value in sampling.items() if key != "()"})
+        response = PropertyMock(return_value="body")
+        body = type("Response", (), {"text": response})()
+        self.assertFalse(sampling.filter(_record(msg="%s", args=(BodyPreview(body),), route="/cars")))
+        response.assert_not_called()
+
+
+class EchoView(APIView):
+    parser_classes = [FastJSONParser]
+    renderer_classes = [FastJSONRenderer]
+    authentication_classes = []
+    permission_classes = []
+
+    def post(self, request):
+        return Response(request.data)
+
+
+class JsonCodecTests(SimpleTestCase):
+    """orjson-рендерер и парсер: те же байты, что у JSONRenderer DRF, и 400 на битый JSON."""
+
+    def payloads(self):
+        car_uid = uuid.uuid4()
+        yield {"page": 0, "pageSize": 10, "totalElements": 1, "items": [
+            {"carUid": car_uid, "brand": "Лада", "model": "Веста", "registrationNumber": "А123ВС",
+             "power": 106, "price": 3500, "type": "SEDAN", "available": True},
+        ]}
+        yield [{"rentalUid": uuid.uuid4(), "status": "IN_PROGRESS", "carUid": car_uid,
+                "dateFrom": date(2025, 1, 1), "dateTo": date(2025, 1, 4)}]
+        yield {"paymentUid": uuid.uuid4(), "status": "PAID", "price": Decimal("10500.50")}
+        yield {"at": datetime(2025, 1, 2, 3, 4, 5, 123456, tzinfo=timezone.utc),
+               "naive": datetime(2025, 1, 2, 3, 4, 5),
+               "local": datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone(timedelta(hours=3))),
+               "empty": [], "none": None, "ratio": 2.5}
+        yield []
+
+    def test_matches_drf_renderer(self):
+        for payload in self.payloads():
+            self.assertEqual(FastJSONRenderer().render(payload), JSONRenderer().render(payload), payload)
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+
+    def test_types(self):
+        uid = uuid.UUID("6d2cb3a8-ef0c-4f3e-a1f9-3b9f2d4d8a55")
+        data = loads(dumps({
+            "uid": uid, "at": datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc), "day": date(2025, 1, 2),
+            "price": Decimal("10.50"), "message": gettext_lazy("This field is required."), "tags": {"a"},
+        }))
+        self.assertEqual(data, {"uid": str(uid), "at": "2025-01-02T03:04:05Z", "day": "2025-01-02",
+                                "price": 10.5, "message": "This field is required.", "tags": ["a"]})
+        with self.assertRaises(TypeError):
+            dumps({"value": object()})
+
+    def test_non_str_keys(self):
+        uid = uuid.uuid4()
+        self.assertEqual(loads(dumps({uid: 1, 2: "two", date(2025, 1, 2): None})),
+                         {str(uid): 1, "2": "two", "2025-01-02": None})
+
+    def test_parser(self):
+        request = APIRequestFactory().post("/echo", b'{"carUid": "a", "size": 2}', content_type="application/json")
+        response = EchoView.as_view()(request)
+        self.assertEqual((response.status_code, loads(response.rendered_content)), (200, {"carUid": "a", "size": 2}))
+
+    def test_parse_error_is_400(self):
+        for body in (b"{", b"{'a': 1}", b"\xff"):
+            request = APIRequestFactory().post("/echo", body, content_type="application/json")
+            response = EchoView.as_view()(request)
+            self.assertEqual(response.status_code, 400, body)
+            self.assertIn("JSON parse error", loads(response.rendered_content)["detail"])
+
+
+class DeadlineMiddlewareTests(SimpleTestCase):
+    """Запрос шлюза после его дедлайна не выполняется: 504 с пометкой X-Deadline-Exceeded."""
+
+    def setUp(self):
+        self.view = Mock(return_value=HttpResponse())
+        self.middleware = DeadlineMiddleware(self.view)
+
+    def get(self, deadline=None):
+        headers = {} if deadline is None else {"headers": {DEADLINE_HEADER: deadline}}
+        return self.middleware(RequestFactory().get("/api/v1/cars/", **headers))
+
+    def test_expired_deadline(self):
+        response = self.get(str(int((time.time() - 1) * 1000)))
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(response[DEADLINE_EXCEEDED_HEADER], "1")
+        self.view.assert_not_called()
+
+    def test_request_in_time(self):
+        for deadline in (None, str(int((time.time() + 5) * 1000)), "soon"):
+            response = self.get(deadline)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn(DEADLINE_EXCEEDED_HEADER, response)
+        self.assertEqual(self.view.call_count, 3)
@@ -0,0 +1,250 @@
+"""
+Распределённая трассировка без внешнего бэкенда.
+
+Контекст передаётся между сервисами заголовком W3C traceparent
+(00-<trace_id>-<span_id>-<flags>). Текущий спан хранится в contextvar,
+поэтому вложенность сохраняется и для корутин, запущенных конкурентно.
+
+Готовые спаны отдаются экспортеру (TRACING_EXPORTER):
+- none – не сохранять (контекст всё равно передаётся дальше);
+- memory – последние TRACING_MEMORY_SIZE спанов в памяти процесса (EXPORTER.spans);
+- file – JSON-строка на спан в TRACING_FILE (пишет фоновый поток), для офлайн-разбора критического пути;
+- dotted path до своего класса экспортера с методом export(span).
+"""
+import json
+import time
+import queue
+import atexit
+import secrets
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Iterator, Optional
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.module_loading import import_string
+
+TRACEPARENT_HEADER = "traceparent"
+
+KIND_INTERNAL = "internal"
+KIND_SERVER = "server"
+KIND_CLIENT = "client"
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    kind: str = KIND_INTERNAL
+    service: str = ""
+    start: float = 0.0
+    end: float = 0.0
+    status: str = "ok"
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration_ms(self) -> float:
+        return round((self.end - self.start) * 1000, 3)
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> dict[str, Any]:
+        data = asdict(self)
+        data["duration_ms"] = self.duration_ms
+        return data
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+# Родитель из входящего traceparent, пока в процессе ещё нет своего спана
+_remote_parent: ContextVar[Optional[tuple[str, str]]] = ContextVar("remote_parent", default=None)
+
+
+class NullExporter:
+    def export(self, span: Span) -> None:
+        pass
+
+
+class InMemoryExporter:
+    def __init__(self, max_spans: int = 10000):
+        self.spans: deque[Span] = deque(maxlen=max_spans)
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def trace(self, trace_id: str) -> list[Span]:
+        return sorted((span for span in self.spans if span.trace_id == trace_id), key=lambda span: span.start)
+
+
+class FileExporter:
+    """
+    Спаны в файл через фоновый поток, как логи в log_pipeline: export() только кладёт
+    спан в ограниченную очередь (при переполнении спан отбрасывается и считается),
+    а поток сериализует накопившиеся спаны и дописывает их пачкой в открытый файл.
+    """
+
+    def __init__(self, path: str, queue_size: int = 10000):
+        self.path = path
+        self.dropped = 0
+        self._queue: queue.Queue[Optional[Span]] = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="tracing-file-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def export(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        with open(self.path, "a", encoding="utf-8") as fh:
+            while True:
+                batch = [self._queue.get()]
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                spans = [span for span in batch if span is not None]
+                if spans:
+                    fh.write("".join(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n"
+                                     for span in spans))
+                    fh.flush()
+                if len(spans) < len(batch):
+                    # None – сигнал остановки из close()
+                    return
+
+    def close(self) -> None:
+        """Дописать очередь и остановить поток; close() и atexit могут прийти оба."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+def _make_exporter():
+    kind = settings.TRACING_EXPORTER
+    if kind == "none":
+        return NullExporter()
+    if kind == "memory":
+        return InMemoryExporter(settings.TRACING_MEMORY_SIZE)
+    if kind == "file":
+        return FileExporter(settings.TRACING_FILE)
+    return import_string(kind)()
+
+
+EXPORTER = _make_exporter()
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[tuple[str, str]]:
+    """traceparent -> (trace_id, parent span_id); None для пустого/некорректного заголовка."""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2]
+
+
+@contextmanager
+def start_span(name: str, kind: str = KIND_INTERNAL, **attributes: Any) -> Iterator[Span]:
+    """Спан вокруг блока: родитель – текущий спан или удалённый родитель из traceparent."""
+    parent = _current.get()
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        remote = _remote_parent.get()
+        trace_id, parent_id = remote if remote is not None else (secrets.token_hex(16), None)
+
+    span = Span(name, trace_id, secrets.token_hex(8), parent_id, kind,
+                settings.TRACING_SERVICE_NAME, time.time(), attributes=attributes)
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as exc:
+        span.status = "error"
+        span.set("error", repr(exc))
+        raise
+    finally:
+        _current.reset(token)
+        span.end = time.time()
+        EXPORTER.export(span)
+
+
+@contextmanager
+def _remote_context(traceparent: Optional[str]) -> Iterator[None]:
+    token = _remote_parent.set(parse_traceparent(traceparent))
+    try:
+        yield
+    finally:
+        _remote_parent.reset(token)
+
+
+def _server_span_done(span: Span, request, response) -> None:
+    match = getattr(request, "resolver_match", None)
+    if match is not None:
+        span.name = f"{request.method} /{match.route}"
+    span.set("http.status_code", response.status_code)
+    if response.status_code >= 500:
+        span.status = "error"
+
+
+@sync_and_async_middleware
+def tracing_middleware(get_response):
+    """Серверный спан на весь запрос, продолжающий трассу из входящего traceparent."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            with _remote_context(request.headers.get(TRACEPARENT_HEADER)):
+                with start_span(f"{request.method} {request.path}", KIND_SERVER) as span:
+                    response = await get_response(request)
+                    _server_span_done(span, request, response)
+                    return response
+    else:
+        def middleware(request):
+            with _remote_context(request.headers.get(TRACEPARENT_HEADER)):
+                with start_span(f"{request.method} {request.path}", KIND_SERVER) as span:
+                    response = get_response(request)
+                    _server_span_done(span, request, response)
+                    return response
+    return middleware
+
+
+class _QuerySpan:
+    """execute_wrapper соединения: спан на каждый SQL-запрос внутри трассы."""
+
+    def __init__(self, alias: str):
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        if _current.get() is None:
+            # Вне запроса (миграции, management-команды) трассы нет
+            return execute(sql, params, many, context)
+        with start_span("db.query", KIND_CLIENT, **{"db.alias": self.alias, "db.statement": sql[:500]}):
+            return execute(sql, params, many, context)
+
+
+def _instrument_connection(sender, connection, **kwargs):
+    if not any(isinstance(wrapper, _QuerySpan) for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.append(_QuerySpan(connection.alias))
+
+
+connection_created.connect(_instrument_connection, dispatch_uid="tracing_query_span")
+for _connection in connections.all(initialized_only=True):
+    _instrument_connection(None, _connection)
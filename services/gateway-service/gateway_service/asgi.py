@@ -13,4 +13,26 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gateway_service.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Импорт после get_asgi_application(): клиентам нужны загруженные настройки и приложения
+from gateway_service.gateway.clients import close_clients, warm_up_clients  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """
+    Django не обрабатывает ASGI lifespan, поэтому старт и остановку воркера ловим здесь:
+    при старте – прогрев пулов соединений к сервисам до первого запроса,
+    при остановке – закрытие пулов, пока event loop ещё работает.
+    """
+    if scope["type"] != "lifespan":
+        return await django_application(scope, receive, send)
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await warm_up_clients()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_clients()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
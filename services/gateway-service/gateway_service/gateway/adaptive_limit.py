@@ -0,0 +1,89 @@
+"""
+Адаптивный лимит одновременных запросов к шлюзу (AIMD).
+
+Лимит не задаётся вручную, а подстраивается по наблюдаемой задержке:
+- запрос уложился в target_latency и лимит был загружен хотя бы наполовину –
+  аддитивное увеличение (+1 за каждые limit таких запросов);
+- запрос дольше target_latency или закончился 504 – мультипликативное
+  уменьшение (limit * backoff), не чаще раза за target_latency, чтобы одна
+  волна медленных ответов не обрушила лимит до минимума.
+Сверх лимита запросы сразу отклоняются (load shedding), не доходя до сервисов.
+Лимит свой у каждого процесса (воркера gunicorn); в метриках – сумма по воркерам.
+"""
+import time
+import threading
+
+from .metrics import ADAPTIVE_DECREASES, ADAPTIVE_IN_FLIGHT, ADAPTIVE_LIMIT, ADAPTIVE_SHED
+
+
+class AIMDLimiter:
+    def __init__(self, initial_limit: int = 20, min_limit: int = 5, max_limit: int = 200,
+                 target_latency: float = 0.5, backoff: float = 0.9, name: str = "edge"):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.backoff = backoff
+
+        self._limit = float(initial_limit)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+        self.accepted = 0
+        self.shed = 0
+        self.decreases = 0
+
+        self._limit_gauge = ADAPTIVE_LIMIT.labels(name)
+        self._in_flight_gauge = ADAPTIVE_IN_FLIGHT.labels(name)
+        self._shed_counter = ADAPTIVE_SHED.labels(name)
+        self._decreases_counter = ADAPTIVE_DECREASES.labels(name)
+        self._publish()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= self.limit:
+                self.shed += 1
+                self._shed_counter.inc()
+                return False
+            self.in_flight += 1
+            self.accepted += 1
+            self._publish()
+            return True
+
+    def release(self, latency: float, overloaded: bool = False) -> None:
+        """Запрос завершён: latency – сколько он занял, overloaded – явный признак перегрузки (504)."""
+        now = time.monotonic()
+        with self._lock:
+            utilization = self.in_flight / max(self._limit, 1.0)
+            self.in_flight -= 1
+
+            if overloaded or latency > self.target_latency:
+                if now - self._last_decrease >= self.target_latency:
+                    self._limit = max(self.min_limit, self._limit * self.backoff)
+                    self._last_decrease = now
+                    self.decreases += 1
+                    self._decreases_counter.inc()
+            elif utilization >= 0.5:
+                # Лимит растёт, только если он реально используется
+                self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+            self._publish()
+
+    def _publish(self) -> None:
+        # Вызывается под self._lock (или до того, как лимитер кому-то доступен)
+        self._limit_gauge.set(self.limit)
+        self._in_flight_gauge.set(self.in_flight)
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "accepted": self.accepted,
+                "shed": self.shed,
+                "decreases": self.decreases,
+            }
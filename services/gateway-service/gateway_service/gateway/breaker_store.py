@@ -0,0 +1,329 @@
+"""
+Хранилища состояния CircuitBreaker.
+
+LocalStateStore – состояние в памяти процесса.
+RedisStateStore – общее состояние для всех воркеров gunicorn и воркера очереди:
+переходы выполняются атомарно Lua-скриптами, чтение идёт через короткий
+локальный кеш, чтобы Redis не добавлял задержку каждому вызову.
+
+В HALF_OPEN хранилище выдаёт ограниченное число разрешений на пробные вызовы
+(acquire_permit); остальные вызывающие сразу получают отказ и уходят в фолбэк.
+
+Методы хранилищ синхронные. remote=True – они могут ждать сеть, поэтому из
+корутин CircuitBreaker зовёт их в потоке, кроме случаев, когда in_memory()
+обещает ответ без Redis.
+"""
+import time
+import logging
+import threading
+from dataclasses import dataclass, replace
+from typing import Union
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+@dataclass(frozen=True)
+class BreakerState:
+    state: str = STATE_CLOSED
+    failure_count: int = 0
+    last_failure_time: float = 0.0
+    # Выданные разрешения на пробные вызовы и момент перехода в HALF_OPEN
+    half_open_calls: int = 0
+    half_open_since: float = 0.0
+
+
+class LocalStateStore:
+    """Состояние breaker'ов в памяти процесса."""
+    remote = False
+
+    def __init__(self):
+        self._states: dict[str, BreakerState] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> BreakerState:
+        return self._states.get(name, BreakerState())
+
+    def in_memory(self, name: str) -> bool:
+        return True
+
+    def record_failure(self, name: str, threshold: int, now: float) -> BreakerState:
+        with self._lock:
+            current = self.get(name)
+            if current.state == STATE_HALF_OPEN:
+                # Пробная попытка провалилась — обратно в OPEN и ждём
+                new = BreakerState(STATE_OPEN, threshold, now)
+            else:
+                # CLOSED или (теоретически) OPEN
+                failures = current.failure_count + 1
+                state = STATE_OPEN if failures >= threshold else current.state
+                new = BreakerState(state, failures, now)
+            self._states[name] = new
+            return new
+
+    def record_success(self, name: str) -> BreakerState:
+        with self._lock:
+            self._states.pop(name, None)
+            return BreakerState()
+
+    def trip(self, name: str, now: float) -> BreakerState:
+        """Принудительно открыть breaker (сработало скользящее окно)."""
+        with self._lock:
+            new = BreakerState(STATE_OPEN, self.get(name).failure_count, now)
+            self._states[name] = new
+            return new
+
+    def acquire_permit(self, name: str, recovery_timeout: float, max_calls: int,
+                       now: float) -> tuple[BreakerState, bool]:
+        """
+        Можно ли сделать вызов:
+        - CLOSED: да, разрешение не нужно;
+        - OPEN: после recovery_timeout переходим в HALF_OPEN и выдаём первое разрешение;
+        - HALF_OPEN: пока выдано меньше max_calls разрешений. Если держатели не вернули
+          разрешения за recovery_timeout (вызов потерян), раздаём их заново.
+        """
+        with self._lock:
+            current = self.get(name)
+            if current.state == STATE_CLOSED:
+                return current, True
+
+            if current.state == STATE_OPEN:
+                if now - current.last_failure_time < recovery_timeout:
+                    return current, False
+                current = replace(current, state=STATE_HALF_OPEN, half_open_calls=1, half_open_since=now)
+            elif current.half_open_calls < max_calls:
+                current = replace(current, half_open_calls=current.half_open_calls + 1)
+            elif now - current.half_open_since >= recovery_timeout:
+                current = replace(current, half_open_calls=1, half_open_since=now)
+            else:
+                return current, False
+
+            self._states[name] = current
+            return current, True
+
+    def release_permit(self, name: str) -> BreakerState:
+        """Вернуть разрешение, если пробный вызов не дал результата (например, отменён)."""
+        with self._lock:
+            current = self.get(name)
+            if current.state == STATE_HALF_OPEN and current.half_open_calls > 0:
+                current = replace(current, half_open_calls=current.half_open_calls - 1)
+                self._states[name] = current
+            return current
+
+
+# Все скрипты получают KEYS[1] – hash состояния – и возвращают его поля
+# плюс признак granted (выдано ли разрешение, для acquire_permit)
+_FIELDS = ("state", "failures", "last_failure", "half_open_calls", "half_open_since")
+_STATE_REPLY = """
+local r = redis.call('HMGET', KEYS[1], 'state', 'failures', 'last_failure', 'half_open_calls', 'half_open_since')
+return {r[1] or 'closed', tonumber(r[2] or '0'), r[3] or '0', tonumber(r[4] or '0'), r[5] or '0', granted}
+"""
+
+# ARGV: threshold, now, ttl
+_RECORD_FAILURE = """
+local granted = 0
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if state == 'half_open' then
+  redis.call('HSET', KEYS[1], 'state', 'open', 'failures', ARGV[1], 'last_failure', ARGV[2],
+             'half_open_calls', 0)
+else
+  local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+  if failures >= tonumber(ARGV[1]) then
+    state = 'open'
+  end
+  redis.call('HSET', KEYS[1], 'state', state, 'last_failure', ARGV[2])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+""" + _STATE_REPLY
+
+# ARGV: now, ttl
+_TRIP = """
+local granted = 0
+redis.call('HSET', KEYS[1], 'state', 'open', 'last_failure', ARGV[1], 'half_open_calls', 0)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+""" + _STATE_REPLY
+
+# ARGV: recovery_timeout, max_calls, now
+_ACQUIRE_PERMIT = """
+local granted = 0
+local s = redis.call('HMGET', KEYS[1], 'state', 'last_failure', 'half_open_calls', 'half_open_since')
+local state = s[1] or 'closed'
+local now = tonumber(ARGV[3])
+local recovery = tonumber(ARGV[1])
+if state == 'closed' then
+  granted = 1
+elseif state == 'open' then
+  if now - tonumber(s[2] or '0') >= recovery then
+    redis.call('HSET', KEYS[1], 'state', 'half_open', 'half_open_calls', 1, 'half_open_since', ARGV[3])
+    granted = 1
+  end
+else
+  local calls = tonumber(s[3] or '0')
+  if calls < tonumber(ARGV[2]) then
+    redis.call('HINCRBY', KEYS[1], 'half_open_calls', 1)
+    granted = 1
+  elseif now - tonumber(s[4] or '0') >= recovery then
+    -- держатели разрешений не вернулись (например, упал воркер) – раздаём заново
+    redis.call('HSET', KEYS[1], 'half_open_calls', 1, 'half_open_since', ARGV[3])
+    granted = 1
+  end
+end
+""" + _STATE_REPLY
+
+_RELEASE_PERMIT = """
+local granted = 0
+if redis.call('HGET', KEYS[1], 'state') == 'half_open' then
+  if redis.call('HINCRBY', KEYS[1], 'half_open_calls', -1) < 0 then
+    redis.call('HSET', KEYS[1], 'half_open_calls', 0)
+  end
+end
+""" + _STATE_REPLY
+
+
+class RedisStateStore:
+    """
+    Общее состояние breaker'ов в Redis.
+    Снимок состояния кешируется локально на cache_ttl секунд; переходы (ошибка,
+    сброс, открытие окном, выдача разрешений в HALF_OPEN) всегда идут в Redis
+    и обновляют кеш.
+    Если Redis недоступен – на retry_after секунд работаем на локальном состоянии.
+    Клиенту Redis нужны короткие socket_timeout/socket_connect_timeout: зависший
+    Redis должен быстро стать «недоступным», а не держать вызовы.
+    """
+    KEY_PREFIX = "gateway:cb:"
+    remote = True
+
+    def __init__(self, client: redis.Redis, cache_ttl: float = 1.0,
+                 key_ttl: int = 3600, retry_after: float = 5.0):
+        self.client = client
+        self.cache_ttl = cache_ttl
+        self.key_ttl = key_ttl
+        self.retry_after = retry_after
+
+        self._cache: dict[str, tuple[BreakerState, float]] = {}
+        self._local = LocalStateStore()
+        self._redis_down_until = 0.0
+        self._record_failure = client.register_script(_RECORD_FAILURE)
+        self._trip = client.register_script(_TRIP)
+        self._acquire_permit = client.register_script(_ACQUIRE_PERMIT)
+        self._release_permit = client.register_script(_RELEASE_PERMIT)
+
+    def _key(self, name: str) -> str:
+        return f"{self.KEY_PREFIX}{name}"
+
+    def _redis_available(self) -> bool:
+        return time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self) -> None:
+        logger.warning("Circuit breaker store: Redis unavailable, using local state for %.0fs",
+                       self.retry_after, exc_info=True)
+        self._redis_down_until = time.monotonic() + self.retry_after
+
+    def _cached(self, name: str):
+        """Снимок из кеша, если он не старше cache_ttl, иначе None."""
+        cached = self._cache.get(name)
+        if cached is not None and time.monotonic() - cached[1] < self.cache_ttl:
+            return cached[0]
+        return None
+
+    def in_memory(self, name: str) -> bool:
+        """
+        Обойдутся ли без Redis ближайшие get/acquire_permit/record_success: Redis помечен
+        недоступным (работаем локально) или в свежем кеше CLOSED без ошибок.
+        """
+        return not self._redis_available() or self._cached(name) == BreakerState()
+
+    def _remember(self, name: str, state: BreakerState) -> BreakerState:
+        self._cache[name] = (state, time.monotonic())
+        return state
+
+    @staticmethod
+    def _parse(raw) -> BreakerState:
+        state, failures, last_failure, half_open_calls, half_open_since = raw[:5]
+        if isinstance(state, bytes):
+            state = state.decode()
+        return BreakerState(state, int(failures), float(last_failure),
+                            int(half_open_calls), float(half_open_since))
+
+    def _run(self, script, name: str, args: list):
+        """Выполнить скрипт; None – Redis недоступен, нужно работать локально."""
+        if not self._redis_available():
+            return None
+        try:
+            return script(keys=[self._key(name)], args=args)
+        except redis.RedisError:
+            self._redis_failed()
+            return None
+
+    def get(self, name: str) -> BreakerState:
+        cached = self._cached(name)
+        if cached is not None:
+            return cached
+        if not self._redis_available():
+            return self._local.get(name)
+
+        try:
+            raw = self.client.hmget(self._key(name), *_FIELDS)
+        except redis.RedisError:
+            self._redis_failed()
+            return self._local.get(name)
+
+        if raw[0] is None:
+            return self._remember(name, BreakerState())
+        return self._remember(name, self._parse([value or 0 for value in raw]))
+
+    def record_failure(self, name: str, threshold: int, now: float) -> BreakerState:
+        raw = self._run(self._record_failure, name, [threshold, repr(now), self.key_ttl])
+        if raw is None:
+            return self._local.record_failure(name, threshold, now)
+        return self._remember(name, self._parse(raw))
+
+    def record_success(self, name: str) -> BreakerState:
+        if self._cached(name) == BreakerState():
+            # Горячий путь: свежее чтение показало CLOSED без ошибок – в Redis писать нечего.
+            # Ошибки других воркеров за это время сбросятся первым успехом после истечения
+            # кеша или после чтения, в котором они видны
+            return BreakerState()
+        if not self._redis_available():
+            return self._local.record_success(name)
+        try:
+            self.client.delete(self._key(name))
+        except redis.RedisError:
+            self._redis_failed()
+            return self._local.record_success(name)
+        return self._remember(name, BreakerState())
+
+    def trip(self, name: str, now: float) -> BreakerState:
+        raw = self._run(self._trip, name, [repr(now), self.key_ttl])
+        if raw is None:
+            return self._local.trip(name, now)
+        return self._remember(name, self._parse(raw))
+
+    def acquire_permit(self, name: str, recovery_timeout: float, max_calls: int,
+                       now: float) -> tuple[BreakerState, bool]:
+        current = self.get(name)
+        if current.state == STATE_CLOSED:
+            # Горячий путь: CLOSED – разрешение не нужно, в Redis не ходим
+            return current, True
+        if current.state == STATE_OPEN and now - current.last_failure_time < recovery_timeout:
+            # Ещё рано пробовать – отказываем по кешу
+            return current, False
+
+        raw = self._run(self._acquire_permit, name, [recovery_timeout, max_calls, repr(now)])
+        if raw is None:
+            return self._local.acquire_permit(name, recovery_timeout, max_calls, now)
+        return self._remember(name, self._parse(raw)), bool(int(raw[5]))
+
+    def release_permit(self, name: str) -> BreakerState:
+        raw = self._run(self._release_permit, name, [])
+        if raw is None:
+            return self._local.release_permit(name)
+        return self._remember(name, self._parse(raw))
+
+
+StateStore = Union[LocalStateStore, RedisStateStore]
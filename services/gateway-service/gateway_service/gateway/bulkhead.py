@@ -0,0 +1,131 @@
+"""
+Bulkhead: ограничение числа одновременных вызовов одного нижележащего сервиса.
+
+Когда сервис тормозит, к нему копятся висящие вызовы. Bulkhead не даёт им
+занять весь воркер: не больше max_concurrent вызовов в работе и max_queue
+в очереди, ожидание в очереди – не дольше max_wait. Остальные сразу получают
+BulkheadFull и уходят в фолбэк, а вызовы других сервисов продолжают работать.
+"""
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from .circuit_breaker import ServiceUnavailable
+from .metrics import BULKHEAD_IN_FLIGHT, BULKHEAD_QUEUED, BULKHEAD_REJECTED
+
+
+class BulkheadFull(ServiceUnavailable):
+    """Вызов отклонён локально: все слоты и место в очереди заняты. Сервис при этом может быть здоров."""
+    pass
+
+
+class Bulkhead:
+    def __init__(self, name: str, max_concurrent: int = 50, max_queue: int = 50, max_wait: float = 1.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        self.in_flight = 0
+        self.rejected = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._lock = threading.Lock()
+        self._in_flight_gauge = BULKHEAD_IN_FLIGHT.labels(name)
+        self._queued_gauge = BULKHEAD_QUEUED.labels(name)
+        self._rejected_counter = BULKHEAD_REJECTED.labels(name)
+        self._publish()
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Занять слот на время блока; timeout дополнительно ограничивает ожидание в очереди."""
+        await self._acquire(self.max_wait if timeout is None else min(self.max_wait, timeout))
+        try:
+            yield
+        finally:
+            self.release()
+
+    def try_acquire(self) -> bool:
+        """Занять слот, только если он свободен сейчас (без очереди); вернуть – release()."""
+        with self._lock:
+            if self.in_flight < self.max_concurrent and not self._waiters:
+                self.in_flight += 1
+                self._publish()
+                return True
+            return False
+
+    async def _acquire(self, timeout: float) -> None:
+        with self._lock:
+            if self.in_flight < self.max_concurrent and not self._waiters:
+                self.in_flight += 1
+                self._publish()
+                return
+            if len(self._waiters) >= self.max_queue or timeout <= 0:
+                self._reject()
+                raise BulkheadFull(f"Bulkhead {self.name} is full")
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self._publish()
+
+        try:
+            # Слот передаёт освободивший его вызов (in_flight при этом не меняется)
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            with self._lock:
+                if waiter.done() and not waiter.cancelled():
+                    # Слот успели передать одновременно с таймаутом – возвращаем его
+                    granted = True
+                else:
+                    # Если слот уже в пути (_grant запланирован), _grant вернёт его сам
+                    granted = False
+                    waiter.cancel()
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                        self._publish()
+            if granted:
+                self.release()
+            if isinstance(exc, asyncio.TimeoutError):
+                with self._lock:
+                    self._reject()
+                raise BulkheadFull(f"Bulkhead {self.name}: no free slot within {timeout:.2f}s") from None
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if not waiter.done():
+                    # Передаём слот следующему в очереди
+                    waiter.get_loop().call_soon_threadsafe(self._grant, waiter)
+                    self._publish()
+                    return
+            self.in_flight -= 1
+            self._publish()
+
+    def _reject(self) -> None:
+        # Вызывается под self._lock
+        self.rejected += 1
+        self._rejected_counter.inc()
+
+    def _publish(self) -> None:
+        # Вызывается под self._lock (или до того, как bulkhead кому-то доступен)
+        self._in_flight_gauge.set(self.in_flight)
+        self._queued_gauge.set(len(self._waiters))
+
+    def _grant(self, waiter: asyncio.Future) -> None:
+        if waiter.done():
+            # Ожидающий ушёл по таймауту/отмене, пока слот был в пути – отдаём следующему
+            self.release()
+        else:
+            waiter.set_result(None)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "in_flight": self.in_flight,
+                "queued": len(self._waiters),
+                "rejected": self.rejected,
+            }
+
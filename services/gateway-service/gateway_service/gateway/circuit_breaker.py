@@ -1,6 +1,17 @@
 import time
+import asyncio
+import inspect
+import threading
 import logging
-from typing import Callable, TypeVar, Optional
+from typing import Any, Awaitable, Callable, TypeVar, Optional, Union
+
+from service_common.tracing import start_span
+
+from .breaker_store import (
+    STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN, LocalStateStore, StateStore,
+)
+from .metrics import BREAKER_FALLBACKS, BREAKER_TRANSITIONS
+from .sliding_window import WINDOW_COUNT, make_window
 
 logger = logging.getLogger(__name__)
 T = TypeVar("T")
@@ -12,105 +23,330 @@ class ServiceUnavailable(Exception):
 
 
 class CircuitBreaker:
-    STATE_CLOSED = "closed"
-    STATE_OPEN = "open"
-    STATE_HALF_OPEN = "half_open"
+    """
+    Circuit breaker с двумя условиями открытия:
+    - failure_threshold ошибок подряд (как раньше);
+    - скользящее окно (window_size > 0): по последним window_size вызовам
+      (window_type="count") или секундам (window_type="time"), если в окне
+      не меньше minimum_calls вызовов и доля ошибок >= failure_rate_threshold %
+      или доля медленных (дольше slow_call_duration секунд) >= slow_call_rate_threshold %.
+    Окно считается в рамках процесса, а открытие публикуется в общий store.
+    Исключения из ignore_exceptions (например, исчерпан дедлайн запроса) не говорят
+    о здоровье сервиса: они не считаются ошибкой и пробрасываются без фолбэка.
+    Исключения из reject_exceptions (вызов отклонён локально, например bulkhead
+    переполнен) тоже не считаются ошибкой, но, как и открытый breaker, ведут в фолбэк.
+    В корутинах переходы с удалённым store (Redis) выполняются в потоке, чтобы медленный
+    Redis не останавливал event loop; прямо в loop – только ответы store из памяти.
+    """
+    STATE_CLOSED = STATE_CLOSED
+    STATE_OPEN = STATE_OPEN
+    STATE_HALF_OPEN = STATE_HALF_OPEN
 
-    def __init__(self, name: str, failure_threshold: int = 3, recovery_timeout: int = 10):
+    def __init__(self, name: str, failure_threshold: int = 3, recovery_timeout: int = 10,
+                 store: Optional[StateStore] = None, half_open_max_calls: int = 1,
+                 window_type: str = WINDOW_COUNT, window_size: int = 0, minimum_calls: int = 10,
+                 failure_rate_threshold: float = 50.0,
+                 slow_call_duration: Optional[float] = None, slow_call_rate_threshold: float = 100.0,
+                 ignore_exceptions: tuple[type[BaseException], ...] = (),
+                 reject_exceptions: tuple[type[BaseException], ...] = ()):
         self.name = name
         self.failure_threshold = failure_threshold
         self.recovery_timeout = recovery_timeout
+        # Где хранится состояние: по умолчанию в памяти процесса,
+        # RedisStateStore – общее для всех воркеров
+        self.store = store if store is not None else LocalStateStore()
+        # Сколько пробных вызовов одновременно пропускаем в HALF_OPEN
+        self.half_open_max_calls = half_open_max_calls
+        # Переходы состояния – под блокировкой: breaker общий для потоков и корутин процесса.
+        # С удалённым store её может держать поток, ждущий Redis, поэтому event loop
+        # берёт её только без ожидания (см. _off_loop)
+        self._lock = threading.RLock()
+
+        self.window = make_window(window_type, window_size) if window_size > 0 else None
+        self.minimum_calls = minimum_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.ignore_exceptions = ignore_exceptions
+        self.reject_exceptions = reject_exceptions
+
+    @property
+    def state(self) -> str:
+        return self.store.get(self.name).state
+
+    async def get_state(self) -> str:
+        """state для корутин: чтение из Redis – в потоке."""
+        return await self._off_loop(lambda: self.state, hot=True)
+
+    @property
+    def failure_count(self) -> int:
+        return self.store.get(self.name).failure_count
 
-        self.state = self.STATE_CLOSED
-        self.failure_count = 0
-        self.last_failure_time = 0.0
+    @property
+    def last_failure_time(self) -> float:
+        return self.store.get(self.name).last_failure_time
 
-    def _open(self):
-        """Переводим в OPEN: дальше запросы не ходят какое-то время."""
-        self.state = self.STATE_OPEN
-        self.last_failure_time = time.time()
-        logger.warning("CircuitBreaker[%s] OPEN", self.name)
+    def _is_slow(self, duration: float) -> bool:
+        return self.slow_call_duration is not None and duration >= self.slow_call_duration
 
-    def _reset(self):
-        """Полный сброс в CLOSED."""
-        self.state = self.STATE_CLOSED
-        self.failure_count = 0
-        self.last_failure_time = 0.0
+    def _record_success(self, duration: float = 0.0, trial: bool = False):
+        """
+        Успех сбрасывает счётчик ошибок подряд. Закрывает breaker только быстрый
+        пробный вызов (trial) в HALF_OPEN; медленный пробный вызов считается неуспехом.
+        Поздние ответы вызовов, начатых до открытия, состояние не меняют.
+        """
+        slow = self._is_slow(duration)
+        with self._lock:
+            state = self.state
+
+            if state == self.STATE_OPEN or (state == self.STATE_HALF_OPEN and not trial):
+                logger.debug("CircuitBreaker[%s] late success in %s ignored", self.name, state)
+                return
 
-    def _record_success(self):
-        """На успехе всегда сбрасываемся в CLOSED."""
-        if self.state != self.STATE_CLOSED:
-            logger.info("CircuitBreaker[%s] SUCCESS -> CLOSED", self.name)
-        self._reset()
+            if state == self.STATE_HALF_OPEN and slow:
+                logger.warning("CircuitBreaker[%s] HALF_OPEN slow call (%.2fs)", self.name, duration)
+                self._record_failure()
+                return
+
+            if state == self.STATE_HALF_OPEN:
+                logger.info("CircuitBreaker[%s] SUCCESS -> CLOSED", self.name)
+                BREAKER_TRANSITIONS.labels(self.name, self.STATE_CLOSED).inc()
+                if self.window is not None:
+                    self.window.reset()
+            self.store.record_success(self.name)
+            self._record_outcome(failed=False, slow=slow)
 
     def _record_failure(self):
         """Обработка неуспеха в зависимости от текущего состояния."""
-        now = time.time()
+        with self._lock:
+            previous = self.state
+            current = self.store.record_failure(self.name, self.failure_threshold, time.time())
+
+            if previous == self.STATE_HALF_OPEN:
+                # Пробная попытка провалилась — обратно в OPEN и ждём
+                logger.warning("CircuitBreaker[%s] HALF_OPEN failure -> OPEN", self.name)
+                BREAKER_TRANSITIONS.labels(self.name, self.STATE_OPEN).inc()
+                return
 
-        if self.state == self.STATE_HALF_OPEN:
-            # Пробная попытка провалилась — обратно в OPEN и ждём
-            logger.warning("CircuitBreaker[%s] HALF_OPEN failure -> OPEN", self.name)
-            self.state = self.STATE_OPEN
-            self.failure_count = self.failure_threshold  # логически: достигли порога
-            self.last_failure_time = now
+            logger.warning("CircuitBreaker[%s] failure count=%d", self.name, current.failure_count)
+
+            if current.state == self.STATE_OPEN and previous != self.STATE_OPEN:
+                logger.warning("CircuitBreaker[%s] OPEN", self.name)
+                BREAKER_TRANSITIONS.labels(self.name, self.STATE_OPEN).inc()
+                if self.window is not None:
+                    self.window.reset()
+                return
+
+            self._record_outcome(failed=True, slow=False)
+
+    def _record_outcome(self, failed: bool, slow: bool):
+        """Учёт вызова в скользящем окне и открытие по доле ошибок/медленных вызовов."""
+        if self.window is None:
             return
 
-        # CLOSED или (теоретически) OPEN
-        self.failure_count += 1
-        self.last_failure_time = now
+        snapshot = self.window.record(failed, slow, time.monotonic())
+        if snapshot.calls < self.minimum_calls:
+            return
+
+        if snapshot.failure_rate >= self.failure_rate_threshold:
+            reason = f"failure rate {snapshot.failure_rate:.0f}%"
+        elif self.slow_call_duration is not None and snapshot.slow_call_rate >= self.slow_call_rate_threshold:
+            reason = f"slow call rate {snapshot.slow_call_rate:.0f}%"
+        else:
+            return
 
-        logger.warning("CircuitBreaker[%s] failure count=%d", self.name, self.failure_count)
+        if self.state == self.STATE_CLOSED:
+            logger.warning("CircuitBreaker[%s] %s over %d calls -> OPEN", self.name, reason, snapshot.calls)
+            self._trip()
+            BREAKER_TRANSITIONS.labels(self.name, self.STATE_OPEN).inc()
+            self.window.reset()
 
-        if self.failure_count >= self.failure_threshold:
-            self._open()
+    def _trip(self):
+        """Открыть breaker в store. Из event loop удалённый store пишется в потоке, без ожидания."""
+        now = time.time()
+        if self.store.remote:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+            else:
+                loop.run_in_executor(None, self.store.trip, self.name, now)
+                return
+        self.store.trip(self.name, now)
 
-    def _can_try_call(self) -> bool:
+    def _can_try_call(self) -> tuple[bool, bool]:
         """
-        Решаем, можно ли идти во внешний сервис:
+        Решаем, можно ли идти во внешний сервис. Возвращает (можно, пробный вызов):
         - CLOSED: всегда можно
         - OPEN: можно только если вышли из таймаута → переводим в HALF_OPEN
-        - HALF_OPEN: можно (но это будет пробная попытка)
+        - HALF_OPEN: только при наличии свободного разрешения (half_open_max_calls),
+          остальные сразу получают отказ – восстанавливающийся сервис не заваливаем
         """
-        now = time.time()
-
-        if self.state == self.STATE_OPEN:
-            if now - self.last_failure_time >= self.recovery_timeout:
-                # Разрешаем пробную попытку
-                self.state = self.STATE_HALF_OPEN
+        with self._lock:
+            previous = self.state
+            current, granted = self.store.acquire_permit(
+                self.name, self.recovery_timeout, self.half_open_max_calls, time.time()
+            )
+            trial = granted and current.state == self.STATE_HALF_OPEN
+            if trial and previous == self.STATE_OPEN:
                 logger.info("CircuitBreaker[%s] timeout passed -> HALF_OPEN", self.name)
-                return True
-            else:
-                return False
+                BREAKER_TRANSITIONS.labels(self.name, self.STATE_HALF_OPEN).inc()
+            return granted, trial
 
-        # CLOSED или HALF_OPEN
-        return True
+    def _release_trial(self):
+        """Пробный вызов не дал результата (отменён) – возвращаем разрешение."""
+        with self._lock:
+            self.store.release_permit(self.name)
+
+    def _release_trial_soon(self):
+        """_release_trial без ожидания: для отменённой корутины с удалённым store – в потоке."""
+        if not self.store.remote:
+            self._release_trial()
+            return
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(None, self._release_trial)
+
+    async def _off_loop(self, func: Callable[..., T], *args, hot: bool = False) -> T:
+        """
+        Переход состояния из корутины. Локальный store отвечает из памяти – вызываем сразу.
+        С удалённым store сразу вызываем только горячий путь (hot=True), когда store
+        обещает обойтись без Redis (in_memory) и блокировка свободна, остальное – в потоке.
+        """
+        if not self.store.remote:
+            return func(*args)
+        if hot and self.store.in_memory(self.name) and self._lock.acquire(blocking=False):
+            try:
+                return func(*args)
+            finally:
+                self._lock.release()
+        return await asyncio.to_thread(func, *args)
 
     def call(
         self,
-        func: Callable[..., T],
+        func: Callable[..., Union[T, Awaitable[T]]],
         *args,
-        fallback: Optional[Callable[..., T]] = None,
+        fallback: Optional[Callable[..., Union[T, Awaitable[T]]]] = None,
+        **kwargs
+    ) -> Union[T, Awaitable[T]]:
+        """
+        Вызов через breaker. Для корутинной функции возвращает awaitable
+        (await cb.call(async_func)), для обычной – результат сразу.
+        Фолбэк может быть как обычной функцией, так и корутинной.
+        """
+        if inspect.iscoroutinefunction(func):
+            return self._call_async(func, *args, fallback=fallback, **kwargs)
+
+        with start_span(f"circuit_breaker {self.name}") as span:
+            # Проверяем, можно ли ходить к сервису
+            allowed, trial = self._can_try_call()
+            if not allowed:
+                logger.debug("CircuitBreaker[%s] short-circuit", self.name)
+                span.set("breaker.decision", "short_circuit")
+                if fallback:
+                    BREAKER_FALLBACKS.labels(self.name, "open").inc()
+                    span.set("breaker.fallback", "open")
+                    return fallback(*args, **kwargs)
+                raise ServiceUnavailable(f"Service {self.name} is unavailable (open circuit).")
+
+            if trial:
+                logger.info("CircuitBreaker[%s] HALF_OPEN trial call", self.name)
+            span.set("breaker.decision", "trial" if trial else "allowed")
+
+            started = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except self.ignore_exceptions:
+                if trial:
+                    self._release_trial()
+                raise
+            except self.reject_exceptions:
+                logger.warning("CircuitBreaker[%s] call rejected locally", self.name)
+                if trial:
+                    self._release_trial()
+                if fallback:
+                    BREAKER_FALLBACKS.labels(self.name, "rejected").inc()
+                    span.set("breaker.fallback", "rejected")
+                    return fallback(*args, **kwargs)
+                raise
+            except Exception:
+                logger.exception("CircuitBreaker[%s] call failed", self.name)
+                self._record_failure()
+
+                if fallback:
+                    BREAKER_FALLBACKS.labels(self.name, "error").inc()
+                    span.set("breaker.fallback", "error")
+                    return fallback(*args, **kwargs)
+                raise
+            except BaseException:
+                if trial:
+                    self._release_trial()
+                raise
+            else:
+                self._record_success(time.monotonic() - started, trial)
+                return result
+
+    async def _call_async(
+        self,
+        func: Callable[..., Awaitable[T]],
+        *args,
+        fallback: Optional[Callable[..., Union[T, Awaitable[T]]]] = None,
         **kwargs
     ) -> T:
-        # Проверяем, можно ли ходить к сервису
-        if not self._can_try_call():
-            logger.debug("CircuitBreaker[%s] short-circuit", self.name)
-            if fallback:
-                return fallback(*args, **kwargs)
-            raise ServiceUnavailable(f"Service {self.name} is unavailable (open circuit).")
-
-        if self.state == self.STATE_HALF_OPEN:
-            logger.info("CircuitBreaker[%s] HALF_OPEN trial call", self.name)
-
-        try:
-            result = func(*args, **kwargs)
-        except Exception:
-            logger.exception("CircuitBreaker[%s] call failed", self.name)
-            self._record_failure()
-
-            if fallback:
-                return fallback(*args, **kwargs)
-            raise
-        else:
-            self._record_success()
-            return result
+        with start_span(f"circuit_breaker {self.name}") as span:
+            allowed, trial = await self._off_loop(self._can_try_call, hot=True)
+            if not allowed:
+                logger.debug("CircuitBreaker[%s] short-circuit", self.name)
+                span.set("breaker.decision", "short_circuit")
+                if fallback:
+                    BREAKER_FALLBACKS.labels(self.name, "open").inc()
+                    span.set("breaker.fallback", "open")
+                    return await _maybe_await(fallback(*args, **kwargs))
+                raise ServiceUnavailable(f"Service {self.name} is unavailable (open circuit).")
+
+            if trial:
+                logger.info("CircuitBreaker[%s] HALF_OPEN trial call", self.name)
+            span.set("breaker.decision", "trial" if trial else "allowed")
+
+            started = time.monotonic()
+            try:
+                result = await func(*args, **kwargs)
+            except self.ignore_exceptions:
+                if trial:
+                    await self._off_loop(self._release_trial)
+                raise
+            except self.reject_exceptions:
+                logger.warning("CircuitBreaker[%s] call rejected locally", self.name)
+                if trial:
+                    await self._off_loop(self._release_trial)
+                if fallback:
+                    BREAKER_FALLBACKS.labels(self.name, "rejected").inc()
+                    span.set("breaker.fallback", "rejected")
+                    return await _maybe_await(fallback(*args, **kwargs))
+                raise
+            except Exception:
+                logger.exception("CircuitBreaker[%s] call failed", self.name)
+                await self._off_loop(self._record_failure)
+
+                if fallback:
+                    BREAKER_FALLBACKS.labels(self.name, "error").inc()
+                    span.set("breaker.fallback", "error")
+                    return await _maybe_await(fallback(*args, **kwargs))
+                raise
+            except BaseException:
+                # CancelledError: клиент ушёл, результат пробного вызова неизвестен.
+                # Задача уже отменяется – ждать поток нельзя, возвращаем разрешение в фоне
+                if trial:
+                    self._release_trial_soon()
+                raise
+            else:
+                duration = time.monotonic() - started
+                # Быстрый успех на чистом CLOSED не меняет состояние в Redis – его можно
+                # учесть прямо в loop; медленный может закрыть/открыть breaker – в потоке
+                await self._off_loop(self._record_success, duration, trial, hot=not self._is_slow(duration))
+                return result
+
+
+async def _maybe_await(value: Any) -> Any:
+    if inspect.isawaitable(value):
+        return await value
+    return value
@@ -1,170 +1,631 @@
+import time
+import asyncio
 import logging
+import threading
+from contextlib import nullcontext
 from typing import Any, Optional
 
-import requests
+import httpx
+import redis
 from django.conf import settings
+from service_common.json_codec import dumps, loads
+from service_common.log_pipeline import BodyPreview
+from service_common.tracing import KIND_CLIENT, TRACEPARENT_HEADER, start_span
 
+from .breaker_store import LocalStateStore, RedisStateStore
+from .bulkhead import Bulkhead, BulkheadFull
 from .circuit_breaker import CircuitBreaker, ServiceUnavailable
+from .deadline import (
+    DEADLINE_EXCEEDED_HEADER, DEADLINE_HEADER, DeadlineExceeded, check as check_deadline, get_deadline,
+    remaining as deadline_remaining, to_header,
+)
+from .fallback_cache import STALE_KEY, FallbackCache
+from .hedging import HedgePolicy, route_key
+from .http_pool import PoolConfig, PoolStats
+from .metrics import DOWNSTREAM_SECONDS, BreakerStateCollector, register_scrape_collector
+from .retry import RetryBudget, RetryPolicy
+from .singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+# Предел uid в одном пакетном запросе (max_length сериализаторов car- и payment-service)
+BATCH_MAX_SIZE = 500
 
-class ServiceClient:
-    """Базовый HTTP-клиент для внешних сервисов."""
 
-    def __init__(self, base_url: str, timeout: int = 5):
-        self.base_url = base_url.rstrip("/")
-        self.timeout = timeout
-        self.session = requests.Session()
+class DownstreamRejected(httpx.HTTPStatusError):
+    """Ответ 4xx: сервис жив и отверг запрос – это не сбой сервиса для breaker."""
+    pass
 
-    def _request(self,
-                 method: str, path: str, *, params: Optional[dict[str, Any]] = None,
-                 json: Optional[dict[str, Any]] = None, headers: Optional[dict[str, str]] = None,
-                 **kwargs) -> requests.Response:
+
+class ServiceClient:
+    """
+    Базовый асинхронный HTTP-клиент для внешних сервисов с пулом keep-alive соединений.
+    Размер пула и время жизни простаивающих соединений задаются PoolConfig.
+    Таймауты вызова ограничены остатком дедлайна запроса, сам дедлайн уходит в X-Request-Deadline.
+    Одинаковые конкурентные GET (coalesce=True) склеиваются в один запрос,
+    GET с hedge=True хеджируются по политике hedging (если она задана).
+    Временные ошибки повторяются по политике retry; пока breaker сервиса не CLOSED,
+    повторов нет – сервис и так признан нездоровым.
+    Число одновременных вызовов сервиса ограничено bulkhead.
+    Ответ 4xx поднимается как DownstreamRejected, 504 по дедлайну запроса – как DeadlineExceeded,
+    остальные 5xx – как httpx.HTTPStatusError.
+    """
+    # Куда ходим прогревать пул – у каждого сервиса есть health-check
+    WARMUP_PATH = "/manage/health"
+
+    # Заголовки, от которых зависит ответ нижележащего сервиса, – входят в ключ склейки
+    COALESCE_HEADERS = ("X-User-Name",)
+
+    def __init__(self, name: str, base_url: str, connect_timeout: float = 1.0, read_timeout: float = 5.0,
+                 pool: PoolConfig = PoolConfig(), coalesce: bool = True,
+                 hedging: Optional[HedgePolicy] = None, retry: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None, bulkhead: Optional[Bulkhead] = None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool = pool
+        self.pool_stats = PoolStats()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Клиент может запрашиваться из разных потоков (sync_to_async, management-команды)
+        self._client_lock = threading.Lock()
+        self.singleflight = SingleFlight(name) if coalesce else None
+        self.hedging = hedging
+        self.retry = retry
+        self.breaker = breaker
+        self.bulkhead = bulkhead
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        AsyncClient привязан к event loop, в котором открыты его соединения.
+        В воркере uvicorn loop один на процесс, но management-команды и тесты
+        могут запускать свой loop – тогда создаём новый клиент, а прежний закрываем.
+        """
+        loop = asyncio.get_running_loop()
+        with self._client_lock:
+            if self._client is None or self._loop is not loop:
+                if self._client is not None:
+                    self._discard(self._client, self._loop)
+                transport = self.pool_stats.instrument(httpx.AsyncHTTPTransport(limits=self.pool.limits))
+                self._client = httpx.AsyncClient(
+                    transport=transport,
+                    timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                    follow_redirects=True,
+                )
+                self._loop = loop
+            return self._client
+
+    def _discard(self, client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Закрыть клиент прежнего loop – его соединения можно закрыть только в том loop.
+        Если loop уже остановлен, закрывать негде: владелец loop должен был вызвать
+        aclose() (close_clients) до выхода.
+        """
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        elif not client.is_closed:
+            logger.warning("HTTP pool %s: client of a stopped event loop was not closed", self.name)
+
+    async def warm_up(self) -> None:
+        """
+        Заранее открыть warmup_connections соединений, чтобы первый всплеск не ждал
+        TCP-рукопожатий. Вызывается при старте воркера (ASGI lifespan), до первого запроса.
+        """
+        count = min(self.pool.warmup_connections, self.pool.max_keepalive_connections)
+        if count <= 0:
+            return
+        url = httpx.URL(self.base_url).copy_with(path=self.WARMUP_PATH, query=None)
+        client = self.client
+        results = await asyncio.gather(
+            *(client.get(url, extensions=self.pool_stats.extensions()) for _ in range(count)),
+            return_exceptions=True,
+        )
+        failed = sum(1 for result in results if isinstance(result, Exception))
+        if failed:
+            logger.warning("HTTP pool %s warm-up: %d of %d connections failed", self.name, failed, count)
+        else:
+            logger.info("HTTP pool %s warmed up with %d connections", self.name, count)
+
+    async def aclose(self) -> None:
+        with self._client_lock:
+            client, self._client, self._loop = self._client, None, None
+        if client is not None:
+            await client.aclose()
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Вызов с повторами временных ошибок по политике retry (если она задана)."""
+        if self.retry is None:
+            return await self._send(method, path, **kwargs)
+
+        idempotent = self.retry.is_idempotent(method, route_key(path))
+        budget = self.retry.budget
+        budget.deposit()
+        attempt, delay = 1, 0.0
+        while True:
+            try:
+                return await self._send(method, path, **kwargs)
+            except httpx.HTTPError as exc:
+                if attempt >= self.retry.max_attempts or not self.retry.is_retryable(exc, idempotent):
+                    raise
+                if self.breaker is not None and await self.breaker.get_state() != CircuitBreaker.STATE_CLOSED:
+                    raise
+                delay = self.retry.next_delay(delay)
+                left = deadline_remaining()
+                if left is not None and left <= delay:
+                    # Повтор всё равно не успеет до дедлайна запроса
+                    raise
+                if not budget.try_spend():
+                    logger.warning("Retry budget of %s exhausted, not retrying %s %s", self.name, method, path)
+                    raise
+                logger.warning("Retrying %s %s%s in %.3fs (attempt %d): %r",
+                               method, self.base_url, path, delay, attempt + 1, exc)
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def _send(self, method: str, path: str, *,
+                    headers: Optional[dict[str, str]] = None, **kwargs) -> httpx.Response:
+        """Одна попытка вызова в клиентском спане; сервис продолжает трассу по traceparent."""
+        with start_span(f"{method} {route_key(path)}", KIND_CLIENT, **{"peer.service": self.name}) as span:
+            headers = {**(headers or {}), TRACEPARENT_HEADER: span.traceparent()}
+            response = await self._exchange(method, path, headers=headers, **kwargs)
+            span.set("http.status_code", response.status_code)
+            return response
+
+    async def _exchange(self,
+                        method: str, path: str, *, params: Optional[dict[str, Any]] = None,
+                        json: Optional[dict[str, Any]] = None, headers: Optional[dict[str, str]] = None,
+                        hedge: bool = False, **kwargs) -> httpx.Response:
+        """Одна попытка вызова (при hedge=True – возможно, с хеджем)."""
         url = f"{self.base_url}{path}"
+        # route – по нему SamplingFilter решает, какую долю успешных вызовов выводить
+        extra = {"service": self.name, "route": path, "method": method}
 
-        kwargs.setdefault("timeout", self.timeout)
+        left = check_deadline()
+        if left is not None:
+            # Вызов получает только остаток бюджета запроса
+            kwargs.setdefault("timeout", httpx.Timeout(
+                min(self.read_timeout, left), connect=min(self.connect_timeout, left),
+            ))
+            headers = {**(headers or {}), DEADLINE_HEADER: to_header(get_deadline())}
 
-        logger.info("HTTP %s %s params=%s json=%s headers=%s", method, url, params, json, headers)
+        logger.debug("HTTP %s %s params=%s json=%s headers=%s", method, url, params, json, headers, extra=extra)
 
-        try:
-            response = self.session.request(method, url, params=params, json=json, headers=headers, **kwargs)
-        except requests.RequestException:
-            logger.exception("HTTP %s %s failed", method, url)
-            raise
+        content = None
+        if json is not None:
+            content = dumps(json)
+            headers = {**(headers or {}), "Content-Type": "application/json"}
+
+        def send():
+            return self.client.request(method, url, params=params, content=content, headers=headers,
+                                       extensions=self.pool_stats.extensions(), **kwargs)
 
+        slot = self.bulkhead.slot(timeout=left) if self.bulkhead is not None else nullcontext()
+
+        started = time.monotonic()
         try:
-            text = response.text
-            content_preview = text[:1000] + ("..." if len(text) > 1000 else "")
-        except Exception:
-            content_preview = "<non-text response>"
+            async with slot:
+                if hedge and self.hedging is not None:
+                    response = await self.hedging.run(route_key(path), send, bulkhead=self.bulkhead)
+                else:
+                    response = await send()
+        except httpx.TimeoutException as exc:
+            extra["duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+            self._observe(method, path, "timeout", started)
+            if left is not None and time.monotonic() - started >= left:
+                # Упёрлись в дедлайн запроса, а не в таймаут сервиса
+                logger.warning("HTTP %s %s deadline exceeded", method, url, extra=extra)
+                raise DeadlineExceeded(f"Request deadline exceeded calling {self.name}") from exc
+            logger.exception("HTTP %s %s failed", method, url, extra=extra)
+            raise
+        except httpx.HTTPError:
+            extra["duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+            self._observe(method, path, "error", started)
+            logger.exception("HTTP %s %s failed", method, url, extra=extra)
+            raise
 
-        logger.info("HTTP %s %s -> %s response=%s", method, url, response.status_code, content_preview)
+        extra["duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+        self._observe(method, path, str(response.status_code), started)
+        extra["status"] = response.status_code
+        level = logging.WARNING if response.is_error else logging.INFO
+        if logger.isEnabledFor(level):
+            # Тело декодируется, только если запись пройдёт фильтры и будет выведена
+            logger.log(level, "HTTP %s %s -> %s response=%s", method, url, response.status_code,
+                       BodyPreview(response), extra=extra)
+        if response.status_code == httpx.codes.GATEWAY_TIMEOUT and DEADLINE_EXCEEDED_HEADER in response.headers:
+            # Сервис отказался от запроса по нашему же дедлайну – это не его сбой
+            raise DeadlineExceeded(f"Request deadline exceeded in {self.name}")
+        if response.is_client_error:
+            raise DownstreamRejected(f"{self.name} rejected {method} {path}: {response.status_code}",
+                                     request=response.request, response=response)
         response.raise_for_status()
         return response
 
-    def get(self, path: str, **kwargs) -> requests.Response:
-        return self._request("GET", path, **kwargs)
+    def _observe(self, method: str, path: str, outcome: str, started: float) -> None:
+        DOWNSTREAM_SECONDS.labels(self.name, method, route_key(path), outcome).observe(time.monotonic() - started)
+
+    def _coalesce_key(self, method: str, path: str, params: Optional[dict[str, Any]],
+                      headers: Optional[dict[str, str]]) -> tuple:
+        params_key = tuple(sorted((k, str(v)) for k, v in (params or {}).items()))
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        headers_key = tuple(headers.get(h.lower()) for h in self.COALESCE_HEADERS)
+        return method, path, params_key, headers_key
+
+    async def get(self, path: str, hedge: bool = False, **kwargs) -> httpx.Response:
+        """hedge=True – только для идемпотентных чтений, которым важен хвост задержки."""
+        if self.singleflight is None or kwargs.keys() - {"params", "headers"}:
+            return await self._request("GET", path, hedge=hedge, **kwargs)
+        key = self._coalesce_key("GET", path, kwargs.get("params"), kwargs.get("headers"))
+        return await self.singleflight.do(key, lambda: self._request("GET", path, hedge=hedge, **kwargs))
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self._request("POST", path, **kwargs)
+
+    async def delete(self, path: str, **kwargs) -> httpx.Response:
+        return await self._request("DELETE", path, **kwargs)
+
+
+# Состояние breaker'ов: общее для всех воркеров (Redis) или локальное для процесса.
+# У store свой клиент с короткими таймаутами: зависший Redis быстро переводит его на локальное состояние
+if settings.CIRCUIT_BREAKER_STORE == "redis":
+    breaker_store = RedisStateStore(redis.Redis.from_url(
+        settings.REDIS_URL,
+        socket_connect_timeout=settings.CIRCUIT_BREAKER_REDIS_TIMEOUT,
+        socket_timeout=settings.CIRCUIT_BREAKER_REDIS_TIMEOUT,
+    ))
+else:
+    breaker_store = LocalStateStore()
+
+# Circuit breakers: 3 ошибки подряд или по окну из последних 20 вызовов
+# (>= 50% ошибок либо >= 80% вызовов дольше 2 с при таймауте клиента 5 с)
+BREAKER_OPTIONS = {
+    "failure_threshold": 3,
+    "recovery_timeout": 10,
+    "store": breaker_store,
+    # в HALF_OPEN пропускаем один пробный вызов, остальные сразу уходят в фолбэк
+    "half_open_max_calls": 1,
+    "window_type": "count",
+    "window_size": 20,
+    "minimum_calls": 10,
+    "failure_rate_threshold": 50.0,
+    "slow_call_duration": 2.0,
+    "slow_call_rate_threshold": 80.0,
+    # Исчерпанный дедлайн запроса и 4xx – не сбой сервиса
+    "ignore_exceptions": (DeadlineExceeded, DownstreamRejected),
+    # Переполненный bulkhead – тоже не сбой, но вызов не состоялся: идём в фолбэк
+    "reject_exceptions": (BulkheadFull,),
+}
+car_cb = CircuitBreaker("car_service", **BREAKER_OPTIONS)
+payment_cb = CircuitBreaker("payment_service", **BREAKER_OPTIONS)
+rental_cb = CircuitBreaker("rental_service", **BREAKER_OPTIONS)
+register_scrape_collector(BreakerStateCollector((car_cb, payment_cb, rental_cb)))
+
 
-    def post(self, path: str, **kwargs) -> requests.Response:
-        return self._request("POST", path, **kwargs)
+# Клиенты для сервисов
+CLIENT_TIMEOUTS = {
+    "connect_timeout": settings.DOWNSTREAM_CONNECT_TIMEOUT,
+    "read_timeout": settings.DOWNSTREAM_READ_TIMEOUT,
+}
 
-    def delete(self, path: str, **kwargs) -> requests.Response:
-        return self._request("DELETE", path, **kwargs)
 
+def _retry_policy(*idempotent_routes: str) -> Optional[RetryPolicy]:
+    if settings.RETRY_MAX_ATTEMPTS <= 1:
+        return None
+    return RetryPolicy(
+        max_attempts=settings.RETRY_MAX_ATTEMPTS,
+        base_delay=settings.RETRY_BASE_DELAY,
+        max_delay=settings.RETRY_MAX_DELAY,
+        idempotent_routes=idempotent_routes,
+        budget=RetryBudget(ratio=settings.RETRY_BUDGET_RATIO),
+    )
+
+
+def _bulkhead(name: str) -> Optional[Bulkhead]:
+    options = settings.BULKHEADS[name]
+    if options["max_concurrent"] <= 0:
+        return None
+    return Bulkhead(name, **options)
+
+
+def _hedge_policy(name: str) -> Optional[HedgePolicy]:
+    if settings.HEDGE_BUDGET_RATIO <= 0:
+        return None
+    return HedgePolicy(name, percentile=settings.HEDGE_PERCENTILE, budget_ratio=settings.HEDGE_BUDGET_RATIO)
+
+
+# Пакетное чтение идёт через POST, но ничего не меняет – его можно повторять
+car_client = ServiceClient("car", settings.CAR_SERVICE_URL, pool=PoolConfig(**settings.HTTP_POOLS["car"]),
+                           hedging=_hedge_policy("car"), retry=_retry_policy("/cars/batch/"),
+                           breaker=car_cb, bulkhead=_bulkhead("car"), **CLIENT_TIMEOUTS)
+payment_client = ServiceClient("payment", settings.PAYMENT_SERVICE_URL, pool=PoolConfig(**settings.HTTP_POOLS["payment"]),
+                               hedging=_hedge_policy("payment"), retry=_retry_policy("/payment/batch/"),
+                               breaker=payment_cb, bulkhead=_bulkhead("payment"), **CLIENT_TIMEOUTS)
+rental_client = ServiceClient("rental", settings.RENTAL_SERVICE_URL, pool=PoolConfig(**settings.HTTP_POOLS["rental"]),
+                              hedging=_hedge_policy("rental"), retry=_retry_policy(),
+                              breaker=rental_cb, bulkhead=_bulkhead("rental"), **CLIENT_TIMEOUTS)
+SERVICE_CLIENTS = (car_client, payment_client, rental_client)
+
+
+async def warm_up_clients() -> None:
+    """Прогреть пулы всех сервисов параллельно (ошибки прогрева только логируются)."""
+    await asyncio.gather(*(client.warm_up() for client in SERVICE_CLIENTS))
+
+
+async def close_clients() -> None:
+    """Закрыть пулы всех сервисов – перед остановкой event loop, в котором они открыты."""
+    await asyncio.gather(*(client.aclose() for client in SERVICE_CLIENTS))
+
+
+def stats() -> dict[str, dict]:
+    """Счётчики клиентов по сервисам для /manage/stats."""
+    return {
+        client.name: {
+            "singleflight": client.singleflight.stats() if client.singleflight else None,
+            "pool": client.pool_stats.snapshot(),
+            "hedging": client.hedging.stats() if client.hedging else None,
+            "retry": client.retry.budget.stats() if client.retry else None,
+            "bulkhead": client.bulkhead.stats() if client.bulkhead else None,
+        }
+        for client in SERVICE_CLIENTS
+    }
+
+
+# Последние известные версии авто и оплат для фолбэков
+FALLBACK_CACHE_OPTIONS = {
+    "max_size": settings.FALLBACK_CACHE_SIZE,
+    "ttl": settings.FALLBACK_CACHE_TTL,
+    "refresh_delay": settings.FALLBACK_REFRESH_DELAY,
+}
+car_cache = FallbackCache("car", **FALLBACK_CACHE_OPTIONS)
+payment_cache = FallbackCache("payment", **FALLBACK_CACHE_OPTIONS)
+
+
+class NoCarAvailable(Exception):
+    """Свободных авто по критериям нет – ответ клиенту, а не сбой сервиса."""
+    pass
+
+
+class RentalStateConflict(Exception):
+    """Аренда уже в статусе, из которого переход запрещён (409 от rental-service)."""
+    pass
 
-# Клиенты для сервисов
-car_client = ServiceClient(settings.CAR_SERVICE_URL)
-payment_client = ServiceClient(settings.PAYMENT_SERVICE_URL)
-rental_client = ServiceClient(settings.RENTAL_SERVICE_URL)
 
-# Circuit breakers
-car_cb = CircuitBreaker("car_service", failure_threshold=3, recovery_timeout=10)
-payment_cb = CircuitBreaker("payment_service", failure_threshold=3, recovery_timeout=10)
-rental_cb = CircuitBreaker("rental_service", failure_threshold=3, recovery_timeout=10)
+class RentalNotFound(Exception):
+    """Аренды нет или она чужая (404 от rental-service) – ответ клиенту, а не сбой сервиса."""
+    pass
+
+
+# Курсор следующей страницы списка аренд (keyset-пагинация rental-service)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
 
 
 def _user_headers(username: str) -> dict[str, str]:
     return {"X-User-Name": username}
 
 
-# ==== CAR SERVICE (READ, with CB) ====
-def get_cars(show_all: bool = False, page: int = 0, size: int = 10):
-    params = {"showAll": show_all, "page": page, "size": size}
+async def _post_batch(client: ServiceClient, path: str, field: str, uids: list[str]) -> list[dict]:
+    """Пакетное чтение частями по BATCH_MAX_SIZE uid, части идут параллельно."""
+    chunks = [uids[i:i + BATCH_MAX_SIZE] for i in range(0, len(uids), BATCH_MAX_SIZE)]
+    responses = await asyncio.gather(*(client.post(path, json={field: chunk}) for chunk in chunks))
+    return [item for r in responses for item in loads(r.content)]
+
 
-    def _call():
-        r = car_client.get("/cars", params=params)
-        return r.json()
+# ==== CAR SERVICE (READ, with CB) ====
+async def get_cars(show_all: bool = False, page: int = 0, size: int = 10, cursor: Optional[str] = None):
+    """cursor (в т.ч. пустой – первая страница) включает keyset-пагинацию car-service вместо page."""
+    if cursor is None:
+        params = {"showAll": show_all, "page": page, "size": size}
+    else:
+        params = {"showAll": show_all, "cursor": cursor, "size": size}
+
+    async def _call():
+        r = await car_client.get("/cars", params=params, hedge=True)
+        cars = loads(r.content)
+        car_cache.put_many({car["carUid"]: car for car in cars.get("items", [])})
+        return cars
 
     # Car Service для /cars – критичен, поэтому фолбэка нет → ошибка поднимется вверх
-    return car_cb.call(_call)
+    return await car_cb.call(_call)
 
 
-def get_car(car_uid: str, allow_fallback: bool = False):
-    def _call():
-        r = car_client.get(f"/cars/{car_uid}")
-        return r.json()
+async def get_car(car_uid: str, allow_fallback: bool = False):
+    async def _call():
+        r = await car_client.get(f"/cars/{car_uid}", hedge=True)
+        car = loads(r.content)
+        car_cache.put(car_uid, car)
+        return car
 
     def _fallback():
         if allow_fallback:
-            # Фолбэк: только uid
-            return {"carUid": car_uid}
+            # Фолбэк: последняя известная версия (stale), иначе только uid
+            cached = car_cache.get_stale([car_uid], refresh=_refresh_cars)
+            return cached.get(car_uid, {"carUid": car_uid})
         # Критичный сценарий (например, POST /rental)
         raise ServiceUnavailable("Car service unavailable")
 
-    return car_cb.call(_call, fallback=_fallback if allow_fallback else None)
+    return await car_cb.call(_call, fallback=_fallback if allow_fallback else None)
+
+
+async def get_cars_by_uids(car_uids: list[str]) -> dict[str, dict]:
+    """
+    Пакетное чтение авто одним запросом (частями по BATCH_MAX_SIZE uid).
+    Возвращает словарь carUid -> авто; для недоступных/ненайденных – фолбэк только с uid.
+    """
+    uids = list(dict.fromkeys(car_uids))
+    if not uids:
+        return {}
+
+    async def _call():
+        cars = await _post_batch(car_client, "/cars/batch/", "carUids", uids)
+        return {car["carUid"]: car for car in cars}
 
+    def _fallback():
+        return car_cache.get_stale(uids, refresh=_refresh_cars)
+
+    found = await car_cb.call(_call, fallback=_fallback)
+    if not any(car.get(STALE_KEY) for car in found.values()):
+        car_cache.put_many(found)
+    return {uid: found.get(uid, {"carUid": uid}) for uid in uids}
+
+
+async def _refresh_cars(car_uids: list[str]) -> None:
+    """Фоновое обновление кеша авто: пока breaker открыт, отсекается без запроса."""
+    async def _call():
+        return await _post_batch(car_client, "/cars/batch/", "carUids", car_uids)
 
-def reserve_car(car_uid: str) -> None:
+    cars = await car_cb.call(_call)
+    car_cache.put_many({car["carUid"]: car for car in cars})
+
+
+async def reserve_car(car_uid: str) -> None:
     # запись состояния – без circuit breaker
-    car_client.post(f"/cars/{car_uid}/reserve/")
+    await car_client.post(f"/cars/{car_uid}/reserve/")
+
+
+async def release_car(car_uid: str) -> None:
+    await car_client.post(f"/cars/{car_uid}/release/")
 
 
-def release_car(car_uid: str) -> None:
-    car_client.post(f"/cars/{car_uid}/release/")
+async def reserve_any_car(criteria: dict[str, Any]) -> dict:
+    """Car-service сам выбирает и резервирует свободное авто по критериям; NoCarAvailable, если таких нет."""
+    try:
+        r = await car_client.post("/cars/reserve-any/", json=criteria)
+    except httpx.HTTPStatusError as exc:
+        if exc.response.status_code == httpx.codes.CONFLICT:
+            raise NoCarAvailable("No available car matches the criteria") from exc
+        raise
+    return loads(r.content)
+
+
+async def reserve_cars(car_uids: list[str]) -> dict[str, list]:
+    """Резерв нескольких авто одним запросом: {"items": [зарезервированные], "skipped": [uid]}."""
+    r = await car_client.post("/cars/bulk-reserve/", json={"carUids": car_uids})
+    return loads(r.content)
+
+
+async def release_cars(car_uids: list[str]) -> dict[str, list]:
+    """Снятие резерва с нескольких авто одним запросом (компенсации, операции с парком)."""
+    r = await car_client.post("/cars/bulk-release/", json={"carUids": car_uids})
+    return loads(r.content)
 
 
 # ==== PAYMENT SERVICE (READ, with CB) ====
-def create_payment(price: float):
-    r = payment_client.post("/payment/", json={"price": price})
-    return r.json()
+async def create_payment(price: float):
+    r = await payment_client.post("/payment/", json={"price": price})
+    return loads(r.content)
 
 
-def cancel_payment(paymentUid: str) -> None:
-    payment_client.delete(f"/payment/{paymentUid}/")
+async def cancel_payment(paymentUid: str) -> None:
+    await payment_client.delete(f"/payment/{paymentUid}/")
 
 
-def get_payment(payment_uid: str, allow_fallback: bool = False):
-    def _call():
-        r = payment_client.get(f"/payment/{payment_uid}")
-        return r.json()
+async def get_payment(payment_uid: str, allow_fallback: bool = False):
+    async def _call():
+        r = await payment_client.get(f"/payment/{payment_uid}")
+        payment = loads(r.content)
+        payment_cache.put(payment_uid, payment)
+        return payment
 
     def _fallback():
         if allow_fallback:
-            return {"paymentUid": payment_uid}
+            cached = payment_cache.get_stale([payment_uid], refresh=_refresh_payments)
+            return cached.get(payment_uid, {"paymentUid": payment_uid})
         raise ServiceUnavailable("Payment service unavailable")
 
-    return payment_cb.call(_call, fallback=_fallback if allow_fallback else None)
+    return await payment_cb.call(_call, fallback=_fallback if allow_fallback else None)
+
+
+async def get_payments_by_uids(payment_uids: list[str]) -> dict[str, dict]:
+    """Пакетное чтение оплат одним запросом (частями по BATCH_MAX_SIZE uid), фолбэк по каждой оплате – только uid."""
+    uids = list(dict.fromkeys(payment_uids))
+    if not uids:
+        return {}
+
+    async def _call():
+        payments = await _post_batch(payment_client, "/payment/batch/", "paymentUids", uids)
+        return {payment["paymentUid"]: payment for payment in payments}
+
+    def _fallback():
+        return payment_cache.get_stale(uids, refresh=_refresh_payments)
+
+    found = await payment_cb.call(_call, fallback=_fallback)
+    if not any(payment.get(STALE_KEY) for payment in found.values()):
+        payment_cache.put_many(found)
+    return {uid: found.get(uid, {"paymentUid": uid}) for uid in uids}
+
+
+async def _refresh_payments(payment_uids: list[str]) -> None:
+    async def _call():
+        return await _post_batch(payment_client, "/payment/batch/", "paymentUids", payment_uids)
+
+    payments = await payment_cb.call(_call)
+    payment_cache.put_many({payment["paymentUid"]: payment for payment in payments})
 
 
 # ==== RENTAL SERVICE (READ, with CB) ====
-def create_rental(username: str, car_uid: str, payment_uid: str, date_from: str, date_to: str):
+async def create_rental(username: str, car_uid: str, payment_uid: str, date_from: str, date_to: str):
     data = {
         "carUid": car_uid,
         "paymentUid": payment_uid,
         "dateFrom": date_from,
         "dateTo": date_to}
     headers = _user_headers(username)
-    r = rental_client.post("/rental/", json=data, headers=headers)
-    return r.json()
+    r = await rental_client.post("/rental/", json=data, headers=headers)
+    return loads(r.content)
 
 
-def get_rentals(username: str):
+async def get_rentals(username: str, params: Optional[dict[str, str]] = None) -> dict[str, Any]:
+    """Страница аренд: {"items": [...], "nextCursor": курсор следующей страницы или None}."""
     headers = _user_headers(username)
 
-    def _call():
-        r = rental_client.get("/rental", headers=headers)
-        return r.json()
+    async def _call():
+        r = await rental_client.get("/rental", params=params, headers=headers)
+        return {"items": loads(r.content), "nextCursor": r.headers.get(NEXT_CURSOR_HEADER)}
 
     # Rental Service для списка аренды – критичен → фолбэка нет
-    return rental_cb.call(_call)
+    return await rental_cb.call(_call)
 
 
-def get_rental(username: str, rental_uid: str):
+async def get_rental(username: str, rental_uid: str):
     headers = _user_headers(username)
 
-    def _call():
-        r = rental_client.get(f"/rental/{rental_uid}", headers=headers)
-        return r.json()
+    async def _call():
+        try:
+            r = await rental_client.get(f"/rental/{rental_uid}", headers=headers, hedge=True)
+        except httpx.HTTPStatusError as exc:
+            # 404 – сервис ответил, breaker не должен считать это сбоем
+            if exc.response.status_code == httpx.codes.NOT_FOUND:
+                return None
+            raise
+        return loads(r.content)
 
-    return rental_cb.call(_call)
+    rental = await rental_cb.call(_call)
+    if rental is None:
+        raise RentalNotFound(f"Rental {rental_uid} not found")
+    return rental
 
 
-def finish_rental(username: str, rental_uid: str) -> None:
+async def finish_rental(username: str, rental_uid: str) -> None:
     headers = _user_headers(username)
-    rental_client.post(f"/rental/{rental_uid}/finish/", headers=headers)
+    try:
+        await rental_client.post(f"/rental/{rental_uid}/finish/", headers=headers)
+    except httpx.HTTPStatusError as exc:
+        _raise_transition_error(exc)
 
 
-def cancel_rental(username: str, rentalUid: str) -> None:
+async def cancel_rental(username: str, rentalUid: str) -> None:
     headers = _user_headers(username)
-    rental_client.delete(f"/rental/{rentalUid}/", headers=headers)
+    try:
+        await rental_client.delete(f"/rental/{rentalUid}/", headers=headers)
+    except httpx.HTTPStatusError as exc:
+        _raise_transition_error(exc)
+
+
+def _raise_transition_error(exc: httpx.HTTPStatusError) -> None:
+    # 409 – переход статуса запрещён, 404 – аренды нет: повтор не поможет
+    if exc.response.status_code == httpx.codes.CONFLICT:
+        raise RentalStateConflict(loads(exc.response.content).get("message", "Rental status conflict")) from exc
+    if exc.response.status_code == httpx.codes.NOT_FOUND:
+        raise RentalNotFound("Rental not found") from exc
+    raise exc
@@ -0,0 +1,127 @@
+"""
+Декларативная композиция вызовов к нижележащим сервисам.
+
+Шаги описываются через Call: имя, корутина, зависимости и фолбэк.
+Независимые шаги запускаются конкурентно, зависимый шаг стартует,
+как только готовы все его зависимости, и получает их результаты
+именованными аргументами:
+
+    Composition(
+        Call("rental", lambda: clients.get_rental(username, uid)),
+        Call("car", lambda rental: clients.get_car(rental["carUid"]), depends_on=("rental",)),
+        Call("payment", lambda rental: clients.get_payment(rental["paymentUid"]), depends_on=("rental",)),
+        assemble=lambda rental, car, payment: {...},
+    )
+
+Так время ответа – длина критического пути, а не сумма всех вызовов.
+"""
+import asyncio
+import inspect
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+from service_common.tracing import start_span
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Call:
+    """
+    Шаг композиции.
+    func и fallback получают результаты зависимостей как именованные аргументы;
+    fallback вызывается, если func упала, и может быть как обычной функцией, так и корутинной.
+    """
+    name: str
+    func: Callable[..., Awaitable[Any]]
+    depends_on: tuple[str, ...] = ()
+    fallback: Optional[Callable[..., Any]] = None
+
+
+class CompositionError(Exception):
+    """
+    Шаг без фолбэка завершился ошибкой.
+    failed – имя первого (в порядке объявления) упавшего шага, error – его исключение,
+    results – результаты успешно выполненных шагов (нужны для компенсаций).
+    """
+
+    def __init__(self, failed: str, error: Exception, results: dict[str, Any]):
+        super().__init__(f"Composition step '{failed}' failed: {error!r}")
+        self.failed = failed
+        self.error = error
+        self.results = results
+
+
+class _DependencyFailed(Exception):
+    """Шаг не запускался, потому что упала одна из его зависимостей."""
+
+
+class Composition:
+    def __init__(self, *calls: Call, assemble: Optional[Callable[..., Any]] = None):
+        self.calls: dict[str, Call] = {}
+        for call in calls:
+            if call.name in self.calls:
+                raise ValueError(f"Duplicate composition step '{call.name}'")
+            # Зависимости объявляются раньше зависимого шага – так граф гарантированно без циклов
+            for dep in call.depends_on:
+                if dep not in self.calls:
+                    raise ValueError(f"Step '{call.name}' depends on unknown or later step '{dep}'")
+            self.calls[call.name] = call
+        self.assemble = assemble
+
+    async def run(self) -> Any:
+        """
+        Выполнить все шаги. Упавший шаг не отменяет независимые от него шаги:
+        они доводятся до конца, чтобы вызывающий код знал, что именно нужно компенсировать.
+        """
+        tasks: dict[str, asyncio.Task] = {}
+        for name, call in self.calls.items():
+            deps = {dep: tasks[dep] for dep in call.depends_on}
+            tasks[name] = asyncio.ensure_future(self._run_call(call, deps))
+
+        try:
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+        except asyncio.CancelledError:
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+        results: dict[str, Any] = {}
+        failures: list[tuple[str, Exception]] = []
+        for name, task in tasks.items():
+            error = task.exception()
+            if error is None:
+                results[name] = task.result()
+            elif not isinstance(error, _DependencyFailed):
+                failures.append((name, error))
+
+        if failures:
+            name, error = failures[0]
+            raise CompositionError(name, error, results)
+
+        if self.assemble is not None:
+            return self.assemble(**results)
+        return results
+
+    @staticmethod
+    async def _run_call(call: Call, deps: dict[str, asyncio.Task]) -> Any:
+        kwargs = {}
+        for dep, task in deps.items():
+            try:
+                kwargs[dep] = await task
+            except Exception as exc:
+                raise _DependencyFailed(dep) from exc
+
+        with start_span(f"compose {call.name}") as span:
+            try:
+                return await call.func(**kwargs)
+            except Exception:
+                if call.fallback is None:
+                    raise
+                logger.warning("Composition step '%s' failed, using fallback", call.name, exc_info=True)
+                span.set("compose.fallback", True)
+                result = call.fallback(**kwargs)
+                if inspect.isawaitable(result):
+                    result = await result
+                return result
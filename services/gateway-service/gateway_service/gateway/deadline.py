@@ -0,0 +1,72 @@
+"""
+Дедлайн входящего запроса.
+
+DeadlineMiddleware (gateway/middleware.py) выдаёт каждому запросу к шлюзу бюджет времени
+(REQUEST_DEADLINE_SECONDS). Каждый вызов нижележащего сервиса получает только
+остаток бюджета, а сам дедлайн уходит в заголовке X-Request-Deadline
+(unix-время в миллисекундах), чтобы сервисы не делали работу, результат
+которой уже никто не ждёт.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import ContextManager, Iterator, Optional
+
+# Общие с сервисами заголовки: дедлайн запроса и пометка 504, отданного по нему
+from service_common.deadline import DEADLINE_EXCEEDED_HEADER, DEADLINE_HEADER
+
+# Абсолютный дедлайн (time.time()) текущего запроса; None – без ограничения
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Бюджет времени запроса исчерпан. Это не ошибка сервиса – breaker её не учитывает."""
+    pass
+
+
+def get_deadline() -> Optional[float]:
+    return _deadline.get()
+
+
+def remaining() -> Optional[float]:
+    """Сколько секунд осталось до дедлайна; None – дедлайна нет."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+
+def check() -> Optional[float]:
+    """Остаток бюджета; DeadlineExceeded, если он уже исчерпан."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return left
+
+
+def to_header(deadline: float) -> str:
+    return str(int(deadline * 1000))
+
+
+def from_header(value: Optional[str]) -> Optional[float]:
+    try:
+        return int(value) / 1000 if value else None
+    except ValueError:
+        return None
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]) -> Iterator[None]:
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def detached() -> ContextManager[None]:
+    """
+    Выполнить блок без дедлайна – для компенсаций, которые нужно довести
+    до конца, даже если ответ клиенту уже опоздал.
+    """
+    return deadline_scope(None)
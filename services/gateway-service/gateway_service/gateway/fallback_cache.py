@@ -0,0 +1,113 @@
+"""
+Кеш последних успешно прочитанных представлений (stale-while-revalidate).
+
+Когда breaker открыт или вызов упал, фолбэк отдаёт последнюю известную версию
+объекта (с пометкой stale) вместо одного uid, не тратя сетевой запрос.
+Заодно планируется фоновое обновление – через refresh_delay секунд, а не сразу:
+только что упавший сервис не получает второй запрос вдогонку, а breaker не
+считает одну неудачу дважды. Пока обновление ключа ждёт своей очереди, новые
+фолбэки его не повторяют, так что на ключ приходится не больше одного обновления
+за refresh_delay. Пока сервис лежит, обновление отсекается breaker'ом, после
+восстановления – подтягивает свежие данные.
+"""
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+STALE_KEY = "stale"
+
+
+class FallbackCache:
+    """Ограниченный по размеру (LRU) и времени жизни (TTL) кеш объектов по uid."""
+
+    def __init__(self, name: str, max_size: int = 10000, ttl: float = 3600, refresh_delay: float = 5.0):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.refresh_delay = refresh_delay
+
+        self._items: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        # uid, которые уже обновляются в фоне, и сами задачи (asyncio держит на них только слабые ссылки)
+        self._refreshing: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    def put(self, key: str, value: dict) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._items[key] = (value, time.monotonic())
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def put_many(self, values: dict[str, dict]) -> None:
+        for key, value in values.items():
+            self.put(key, value)
+
+    def get(self, key: str) -> Optional[dict]:
+        """Последняя известная версия с пометкой stale или None, если её нет / устарела по TTL."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, stored_at = item
+            if time.monotonic() - stored_at > self.ttl:
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+        return {**value, STALE_KEY: True}
+
+    def get_stale(self, keys: Iterable[str],
+                  refresh: Callable[[list[str]], Awaitable[None]]) -> dict[str, dict]:
+        """
+        Отдать то, что есть в кеше, и запланировать фоновое обновление найденных ключей.
+        refresh получает список uid и сам кладёт свежие данные в кеш.
+        """
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        if found:
+            self.schedule_refresh(list(found), refresh)
+        return found
+
+    def schedule_refresh(self, keys: list[str], refresh: Callable[[list[str]], Awaitable[None]]) -> None:
+        with self._lock:
+            pending = [key for key in keys if key not in self._refreshing]
+            self._refreshing.update(pending)
+        if not pending:
+            return
+
+        try:
+            task = asyncio.get_running_loop().create_task(self._refresh(pending, refresh))
+        except RuntimeError:
+            # Нет event loop (синхронный контекст) – обновим при следующем успешном чтении
+            with self._lock:
+                self._refreshing.difference_update(pending)
+            return
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, keys: list[str], refresh: Callable[[list[str]], Awaitable[None]]) -> None:
+        try:
+            if self.refresh_delay > 0:
+                await asyncio.sleep(self.refresh_delay)
+            await refresh(keys)
+        except Exception:
+            logger.debug("FallbackCache[%s] background refresh failed", self.name, exc_info=True)
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(keys)
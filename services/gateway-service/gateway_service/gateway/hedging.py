@@ -0,0 +1,166 @@
+"""
+Хеджирование идемпотентных чтений.
+
+Если первая попытка не ответила за p-й перцентиль задержки этого маршрута,
+отправляем вторую и берём ту, что завершится первой; вторая отменяется.
+Число хеджей ограничено бюджетом: каждый обычный запрос добавляет budget_ratio
+токена, хедж тратит один – так дополнительная нагрузка не превышает budget_ratio.
+Хедж занимает свой слот bulkhead сервиса; если свободного нет, хеджа не будет.
+"""
+import re
+import time
+import asyncio
+import logging
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Optional
+
+from .bulkhead import Bulkhead
+
+logger = logging.getLogger(__name__)
+
+_UUID_RE = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+
+
+def route_key(path: str) -> str:
+    """/cars/<uuid> -> /cars/{uid}: задержка копится по шаблону маршрута, а не по объекту."""
+    return _UUID_RE.sub("{uid}", path)
+
+
+class LatencyTracker:
+    """
+    Последние size задержек маршрута в кольцевом буфере и они же по возрастанию:
+    запись вытесняет старый замер из упорядоченного списка, а перцентиль –
+    просто индекс в нём, без сортировки на каждый вызов.
+    """
+
+    def __init__(self, size: int = 200):
+        self.size = size
+        self._samples = [0.0] * size
+        self._ordered: list[float] = []
+        self._pos = 0
+
+    def record(self, seconds: float) -> None:
+        if len(self._ordered) == self.size:
+            del self._ordered[bisect_left(self._ordered, self._samples[self._pos])]
+        self._samples[self._pos] = seconds
+        insort(self._ordered, seconds)
+        self._pos = (self._pos + 1) % self.size
+
+    def percentile(self, p: float, min_samples: int) -> Optional[float]:
+        count = len(self._ordered)
+        if count < min_samples or count == 0:
+            return None
+        return self._ordered[min(int(count * p / 100), count - 1)]
+
+
+class HedgeBudget:
+    """Токены на хеджи: обычный запрос даёт ratio токена (не больше max_tokens), хедж стоит 1."""
+
+    def __init__(self, ratio: float, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.max_tokens)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+class HedgePolicy:
+    """
+    percentile – после какого перцентиля задержки маршрута отправлять хедж;
+    min_samples – пока замеров меньше, не хеджируем (перцентиль ещё не показателен);
+    min_delay – нижняя граница задержки хеджа в секундах.
+    """
+
+    def __init__(self, name: str, percentile: float = 95.0, budget_ratio: float = 0.1,
+                 min_samples: int = 20, min_delay: float = 0.01, window: int = 200):
+        self.name = name
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.budget = HedgeBudget(budget_ratio)
+        self._trackers: dict[str, LatencyTracker] = defaultdict(lambda: LatencyTracker(window))
+
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+        self.bulkhead_denied = 0
+
+    def delay(self, route: str) -> Optional[float]:
+        value = self._trackers[route].percentile(self.percentile, self.min_samples)
+        return None if value is None else max(value, self.min_delay)
+
+    async def run(self, route: str, send: Callable[[], Awaitable[Any]],
+                  bulkhead: Optional[Bulkhead] = None) -> Any:
+        """send() первой попытки уже занимает слот bulkhead, хедж берёт ещё один – без ожидания."""
+        async def attempt():
+            started = time.monotonic()
+            result = await send()
+            self._trackers[route].record(time.monotonic() - started)
+            return result
+
+        delay = self.delay(route)
+        first = asyncio.ensure_future(attempt())
+        if delay is None:
+            self.budget.deposit()
+            return await first
+
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                self.budget.deposit()
+                return first.result()
+            if bulkhead is not None and not bulkhead.try_acquire():
+                # Сервис и так занят под завязку – второй вызов только добавит ему нагрузки
+                self.bulkhead_denied += 1
+                return await first
+            if not self.budget.try_spend():
+                self.budget_denied += 1
+                if bulkhead is not None:
+                    bulkhead.release()
+                return await first
+
+            self.hedged += 1
+            logger.debug("Hedging %s %s after %.3fs", self.name, route, delay)
+            hedge = asyncio.ensure_future(attempt())
+            if bulkhead is not None:
+                # Слот свободен, когда хедж действительно завершился (в т.ч. отменой)
+                hedge.add_done_callback(lambda _: bulkhead.release())
+            tasks.append(hedge)
+
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Берём первый успешный ответ; ошибку отдаём, только если упали обе попытки
+                for task in sorted(done, key=tasks.index):
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "budget_denied": self.budget_denied,
+            "bulkhead_denied": self.bulkhead_denied,
+            "delays": {route: self.delay(route) for route in list(self._trackers)},
+        }
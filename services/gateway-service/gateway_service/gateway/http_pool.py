@@ -0,0 +1,87 @@
+"""
+Пул HTTP-соединений к нижележащему сервису и его статистика.
+
+httpx держит соединения в пуле httpcore; здесь транспорт собирается с нужными
+лимитами (размер пула, число keep-alive соединений, время жизни простаивающего
+соединения), а создание соединений подсчитывается, чтобы по /manage/stats можно
+было подобрать размер пула под WEB_CONCURRENCY.
+
+Новые соединения считаются через публичное расширение запроса trace (httpcore
+сообщает о каждом TCP-подключении), снимок in_use/idle – по pool.connections.
+"""
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Событие trace httpcore: соединение открыто
+CONNECTION_CREATED_EVENTS = ("connection.connect_tcp.complete", "connection.connect_unix_socket.complete")
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    # Через сколько секунд простаивающее keep-alive соединение закрывается
+    keepalive_expiry: float = 30.0
+    # Сколько соединений открыть заранее при создании клиента
+    warmup_connections: int = 0
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+class PoolStats:
+    """
+    in_use / idle – снимок текущего пула, created – сколько соединений открыто
+    за жизнь процесса, discarded – сколько из них уже закрыто (истёк keep-alive,
+    ошибка, сервер закрыл соединение, пул пересоздан).
+    Запросы должны передавать extensions() – иначе created не растёт.
+    """
+
+    def __init__(self):
+        self.created = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def instrument(self, transport: httpx.AsyncHTTPTransport) -> httpx.AsyncHTTPTransport:
+        """Запомнить пул транспорта для снимка in_use/idle."""
+        # Публичного доступа к пулу httpcore у транспорта httpx нет. Если внутреннее
+        # поле изменится, снимок просто останется без in_use/idle
+        pool = getattr(transport, "_pool", None)
+        if pool is None or not hasattr(pool, "connections"):
+            logger.warning("HTTP pool stats: httpx transport has no connection pool, in_use/idle unavailable")
+            pool = None
+        self._pool = pool
+        return transport
+
+    async def _trace(self, event_name: str, info: dict[str, Any]) -> None:
+        if event_name in CONNECTION_CREATED_EVENTS:
+            with self._lock:
+                self.created += 1
+
+    def extensions(self) -> dict[str, Any]:
+        """Расширения запроса httpx, через которые считаются новые соединения."""
+        return {"trace": self._trace}
+
+    def snapshot(self) -> dict[str, int]:
+        connections = list(self._pool.connections) if self._pool is not None else []
+        idle = sum(1 for conn in connections if conn.is_idle())
+        in_use = sum(1 for conn in connections if not conn.is_idle() and not conn.is_closed())
+        with self._lock:
+            created = self.created
+        return {
+            "in_use": in_use,
+            "idle": idle,
+            "created": created,
+            "discarded": max(created - in_use - idle, 0),
+        }
@@ -0,0 +1,84 @@
+import json
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import JSONRenderer
+from service_common.json_codec import FastJSONRenderer, dumps, loads
+
+from ... import views
+
+
+def _sample_page(size: int) -> tuple[list, list, list]:
+    """Страница аренд и ответы car/payment batch – как их отдают сервисы."""
+    rentals, cars, payments = [], [], []
+    start = date(2025, 1, 1)
+    for i in range(size):
+        car_uid, payment_uid = str(uuid.uuid4()), str(uuid.uuid4())
+        rentals.append({
+            "rentalUid": str(uuid.uuid4()), "status": "IN_PROGRESS",
+            "dateFrom": (start + timedelta(days=i)).isoformat(),
+            "dateTo": (start + timedelta(days=i + 3)).isoformat(),
+            "carUid": car_uid, "paymentUid": payment_uid,
+        })
+        cars.append({
+            "carUid": car_uid, "brand": "Mercedes Benz", "model": "GLA 250",
+            "registrationNumber": "ЛО777Х799", "power": 249, "type": "SEDAN", "price": 3500, "available": False,
+        })
+        payments.append({"paymentUid": payment_uid, "status": "PAID", "price": 10500})
+    return rentals, cars, payments
+
+
+class Command(BaseCommand):
+    help = (
+        "CPU на JSON в одном GET /api/v1/rental: рендер ответов rental/car/payment в сервисах, "
+        "их разбор в шлюзе и рендер итогового ответа – stdlib json против json_codec (orjson)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=100, help="аренд на странице")
+        parser.add_argument("--requests", type=int, default=2000, help="сколько запросов прогнать")
+
+    def handle(self, *args, size, requests, **options):
+        page = _sample_page(size)
+
+        stdlib_renderer = JSONRenderer()
+
+        def stdlib():
+            bodies = [stdlib_renderer.render(data) for data in page]
+            rentals, cars, payments = (json.loads(body) for body in bodies)
+            return json.dumps(self._assemble(rentals, cars, payments), cls=DjangoJSONEncoder).encode()
+
+        fast_renderer = FastJSONRenderer()
+
+        def fast():
+            bodies = [fast_renderer.render(data) for data in page]
+            rentals, cars, payments = (loads(body) for body in bodies)
+            return dumps(self._assemble(rentals, cars, payments))
+
+        if loads(stdlib()) != loads(fast()):
+            self.stderr.write("Ответы stdlib и json_codec различаются")
+            return
+
+        results = {name: self._measure(func, requests) for name, func in (("stdlib", stdlib), ("orjson", fast))}
+        for name, per_request in results.items():
+            self.stdout.write(f"{name:>7}: {per_request * 1e6:9.1f} мкс CPU на запрос")
+        saving = results["stdlib"] - results["orjson"]
+        self.stdout.write(f"экономия: {saving * 1e6:.1f} мкс CPU на запрос "
+                          f"({saving / results['stdlib'] * 100:.0f}%), страница из {size} аренд")
+
+    @staticmethod
+    def _assemble(rentals: list, cars: list, payments: list) -> list:
+        cars = {car["carUid"]: car for car in cars}
+        payments = {payment["paymentUid"]: payment for payment in payments}
+        return [views._rental_response(r, cars[r["carUid"]], payments[r["paymentUid"]]) for r in rentals]
+
+    @staticmethod
+    def _measure(func, requests: int) -> float:
+        func()  # прогрев
+        started = time.process_time()
+        for _ in range(requests):
+            func()
+        return (time.process_time() - started) / requests
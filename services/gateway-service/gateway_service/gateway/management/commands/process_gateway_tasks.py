@@ -1,30 +1,63 @@
 import json
-import time
+import asyncio
 import logging
+from typing import Optional
 
 from django.core.management.base import BaseCommand
-from ...task_queue import redis_client, QUEUE_KEY, RETRY_DELAY, enqueue_task
+from ...task_queue import redis_client, BLPOP_TIMEOUT, QUEUE_KEY, RETRY_DELAY, enqueue_task
 from ... import clients
 
 logger = logging.getLogger(__name__)
 
 
+async def cancel_rental(username: str, rentalUid: str, paymentUid: Optional[str] = None) -> None:
+    """
+    Отмена аренды из очереди, затем её оплаты (paymentUid). RentalStateConflict –
+    аренду уже завершили (RentalNotFound – её нет): задача снимается целиком,
+    оплата такой аренды остаётся.
+    """
+    await clients.cancel_rental(username, rentalUid)
+    if paymentUid is None:
+        return
+    try:
+        await clients.cancel_payment(paymentUid)
+    except Exception:
+        logger.exception("Cancel payment %s after rental %s failed, enqueue", paymentUid, rentalUid)
+        await asyncio.to_thread(enqueue_task, "cancel_payment", {"paymentUid": paymentUid})
+
+
 class Command(BaseCommand):
     help = "Process async gateway tasks from Redis queue"
     TASK_HANDLERS = {
-        "cancel_rental": clients.cancel_rental,
+        "cancel_rental": cancel_rental,
         "cancel_payment": clients.cancel_payment,
     }
 
     def handle(self, *args, **options):
         self.stdout.write("Starting gateway task worker...")
+        # Один event loop на всё время работы воркера: клиенты держат в нём пул соединений
+        asyncio.run(self._run())
+
+    async def _run(self):
+        try:
+            await self._loop()
+        finally:
+            # Пулы соединений открыты в этом loop – закрываем их до его остановки
+            await clients.close_clients()
+
+    async def _loop(self):
         while True:
             try:
-                _, raw = redis_client.blpop(QUEUE_KEY)
+                # BLPOP блокирующий – уводим в поток, чтобы не держать event loop
+                popped = await asyncio.to_thread(redis_client.blpop, QUEUE_KEY, timeout=BLPOP_TIMEOUT)
             except Exception:
                 logger.exception("Redis BLPOP failed, sleep 5s")
-                time.sleep(5)
+                await asyncio.sleep(5)
+                continue
+            if popped is None:
+                # очередь пуста – ждём снова
                 continue
+            _, raw = popped
 
             try:
                 task = json.loads(raw)
@@ -32,10 +65,10 @@ class Command(BaseCommand):
                 logger.exception("Failed to decode task: %r", raw)
                 continue
 
-            self._process_task(task)
+            await self._process_task(task)
 
     @staticmethod
-    def _process_task(task: dict):
+    async def _process_task(task: dict):
         task_type = task.get("type")
         payload = task.get("payload", {})
         retry = task.get("retry", 0)
@@ -45,13 +78,17 @@ class Command(BaseCommand):
         try:
             handler = Command.TASK_HANDLERS.get(task_type)
             if handler:
-                handler(**payload)
+                await handler(**payload)
             else:
                 logger.warning("Unknown task type: %s", task_type)
                 return
+        except (clients.RentalStateConflict, clients.RentalNotFound):
+            # Переход уже невозможен (например, аренду завершили) – повторять бессмысленно,
+            # отмена оплаты в той же задаче тоже снимается
+            logger.warning("Task %s dropped: rental status conflict or not found: %s", task_type, payload)
         except Exception:
             logger.exception("Task %s failed, will retry", task_type)
-            time.sleep(RETRY_DELAY)
-            enqueue_task(task_type, payload, retry=retry + 1)
+            await asyncio.sleep(RETRY_DELAY)
+            await asyncio.to_thread(enqueue_task, task_type, payload, retry=retry + 1)
         else:
             logger.info("Task %s succeeded", task_type)
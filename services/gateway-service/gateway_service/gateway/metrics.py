@@ -0,0 +1,91 @@
+"""
+Метрики шлюза: вызовы нижележащих сервисов, circuit breaker'ы, bulkhead'ы,
+адаптивный лимит и очередь задач. Общие метрики запросов и БД – в service_common/metrics.py.
+
+Bulkhead и лимит у каждого воркера свои, поэтому их gauge'и обновляются при
+изменении (в multiprocess-режиме – сумма по живым воркерам), а не читаются
+коллектором при сборе – тот видел бы только воркер, обслуживший /manage/metrics.
+"""
+from typing import Iterable
+
+import redis
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+
+from service_common.metrics import SCRAPE_REGISTRY
+
+DOWNSTREAM_SECONDS = Histogram(
+    "gateway_downstream_request_duration_seconds", "Время вызова нижележащего сервиса",
+    ["service", "method", "route", "status"],
+)
+BREAKER_TRANSITIONS = Counter(
+    "gateway_circuit_breaker_transitions_total", "Переходы circuit breaker'а между состояниями",
+    ["breaker", "state"],
+)
+BREAKER_FALLBACKS = Counter(
+    "gateway_circuit_breaker_fallbacks_total", "Ответы фолбэком вместо вызова сервиса",
+    ["breaker", "reason"],
+)
+BULKHEAD_IN_FLIGHT = Gauge(
+    "gateway_bulkhead_in_flight", "Вызовы сервиса, занявшие слот bulkhead", ["service"],
+    multiprocess_mode="livesum",
+)
+BULKHEAD_QUEUED = Gauge(
+    "gateway_bulkhead_queued", "Вызовы сервиса в очереди bulkhead", ["service"],
+    multiprocess_mode="livesum",
+)
+BULKHEAD_REJECTED = Counter(
+    "gateway_bulkhead_rejected_total", "Вызовы, отклонённые bulkhead (BulkheadFull)", ["service"],
+)
+ADAPTIVE_LIMIT = Gauge(
+    "gateway_adaptive_limit", "Текущий адаптивный лимит одновременных запросов", ["limiter"],
+    multiprocess_mode="livesum",
+)
+ADAPTIVE_IN_FLIGHT = Gauge(
+    "gateway_adaptive_in_flight", "Запросы, принятые в пределах адаптивного лимита", ["limiter"],
+    multiprocess_mode="livesum",
+)
+ADAPTIVE_SHED = Counter(
+    "gateway_adaptive_shed_total", "Запросы, сброшенные сверх адаптивного лимита (503)", ["limiter"],
+)
+ADAPTIVE_DECREASES = Counter(
+    "gateway_adaptive_limit_decreases_total", "Мультипликативные уменьшения адаптивного лимита", ["limiter"],
+)
+
+
+class BreakerStateCollector:
+    """Текущее состояние breaker'ов (1 – в этом состоянии) – читается из store при сборе метрик."""
+
+    def __init__(self, breakers: Iterable):
+        self.breakers = tuple(breakers)
+
+    def collect(self):
+        gauge = GaugeMetricFamily(
+            "gateway_circuit_breaker_state", "Текущее состояние circuit breaker'а", labels=["breaker", "state"],
+        )
+        for breaker in self.breakers:
+            current = breaker.state
+            for state in (breaker.STATE_CLOSED, breaker.STATE_OPEN, breaker.STATE_HALF_OPEN):
+                gauge.add_metric([breaker.name, state], 1.0 if current == state else 0.0)
+        yield gauge
+
+
+class QueueDepthCollector:
+    """Длина Redis-очереди отложенных задач (LLEN при сборе метрик)."""
+
+    def __init__(self, client: redis.Redis, key: str):
+        self.client = client
+        self.key = key
+
+    def collect(self):
+        try:
+            depth = self.client.llen(self.key)
+        except redis.RedisError:
+            return
+        gauge = GaugeMetricFamily("gateway_task_queue_depth", "Число задач в очереди", labels=["queue"])
+        gauge.add_metric([self.key], float(depth))
+        yield gauge
+
+
+def register_scrape_collector(collector) -> None:
+    SCRAPE_REGISTRY.register(collector)
@@ -0,0 +1,77 @@
+import time
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework import status
+
+from .adaptive_limit import AIMDLimiter
+from .deadline import DEADLINE_HEADER, deadline_scope, from_header
+
+# Один лимит на процесс: все запросы воркера делят одну ёмкость
+edge_limiter = AIMDLimiter(
+    initial_limit=settings.ADAPTIVE_LIMIT_INITIAL,
+    min_limit=settings.ADAPTIVE_LIMIT_MIN,
+    max_limit=settings.ADAPTIVE_LIMIT_MAX,
+    target_latency=settings.ADAPTIVE_LIMIT_TARGET_LATENCY,
+)
+
+
+class AdaptiveConcurrencyMiddleware:
+    """
+    Сбрасывает нагрузку сверх адаптивного лимита (edge_limiter) ответом 503 с Retry-After
+    до того, как запрос доберётся до нижележащих сервисов. Служебные /manage/* не ограничиваются.
+    """
+    sync_capable = False
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = settings.ADAPTIVE_LIMIT_ENABLED
+        self.retry_after = str(settings.ADAPTIVE_LIMIT_RETRY_AFTER)
+        markcoroutinefunction(self)
+
+    async def __call__(self, request):
+        if not self.enabled or request.path.startswith("/manage/"):
+            return await self.get_response(request)
+
+        if not edge_limiter.try_acquire():
+            response = JsonResponse({"message": "Gateway is overloaded, retry later"},
+                                    status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response["Retry-After"] = self.retry_after
+            return response
+
+        started = time.monotonic()
+        overloaded = True
+        try:
+            response = await self.get_response(request)
+            overloaded = response.status_code == status.HTTP_504_GATEWAY_TIMEOUT
+            return response
+        finally:
+            edge_limiter.release(time.monotonic() - started, overloaded=overloaded)
+
+
+class DeadlineMiddleware:
+    """
+    Выставляет дедлайн (REQUEST_DEADLINE_SECONDS) на время обработки запроса.
+    Если клиент сам прислал X-Request-Deadline, берём более ранний из двух.
+    """
+    sync_capable = False
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.budget = settings.REQUEST_DEADLINE_SECONDS
+        markcoroutinefunction(self)
+
+    async def __call__(self, request):
+        if self.budget <= 0:
+            return await self.get_response(request)
+
+        deadline = time.time() + self.budget
+        incoming = from_header(request.headers.get(DEADLINE_HEADER))
+        if incoming is not None:
+            deadline = min(deadline, incoming)
+
+        with deadline_scope(deadline):
+            return await self.get_response(request)
@@ -0,0 +1,97 @@
+"""
+Повторы вызовов нижележащих сервисов.
+
+- Повторяются только безопасные операции: идемпотентные методы и явно
+  объявленные идемпотентными маршруты. Остальные – только если запрос
+  гарантированно не ушёл (не удалось установить соединение).
+- Повторяются только временные ошибки: сетевые и 502/503/504.
+- Пауза – экспоненциальная с decorrelated jitter, чтобы повторы разных
+  клиентов не приходили к сервису одновременно.
+- RetryBudget на каждый сервис: повтор тратит токен, обычный запрос добавляет
+  ratio токена. Когда сервис лежит, бюджет быстро кончается и повторы
+  не превращают сбой в шторм.
+"""
+import time
+import random
+import threading
+from typing import Iterable, Optional
+
+import httpx
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRYABLE_STATUSES = frozenset({502, 503, 504})
+
+
+class RetryBudget:
+    """
+    Токен-бакет повторов: каждый первый вызов добавляет ratio токена,
+    плюс min_per_second токенов в секунду, чтобы редкие вызовы тоже могли повторяться.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.spent = 0
+        self.denied = 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < 1.0:
+                self.denied += 1
+                return False
+            self._tokens -= 1.0
+            self.spent += 1
+            return True
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            return {"tokens": round(self._tokens, 2), "retries": self.spent, "denied": self.denied}
+
+
+class RetryPolicy:
+    """
+    max_attempts – всего попыток, включая первую;
+    base_delay/max_delay – границы паузы между попытками в секундах;
+    idempotent_routes – маршруты (шаблоны, см. hedging.route_key) не идемпотентных
+    методов, которые тем не менее безопасно повторять, например пакетное чтение через POST.
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.05, max_delay: float = 1.0,
+                 idempotent_routes: Iterable[str] = (), budget: Optional[RetryBudget] = None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.idempotent_routes = frozenset(idempotent_routes)
+        self.budget = budget if budget is not None else RetryBudget()
+
+    def is_idempotent(self, method: str, route: str) -> bool:
+        return method in IDEMPOTENT_METHODS or route in self.idempotent_routes
+
+    def is_retryable(self, error: Exception, idempotent: bool) -> bool:
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            # Запрос не ушёл к сервису – повторять безопасно всегда
+            return True
+        if not idempotent:
+            return False
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRYABLE_STATUSES
+        return isinstance(error, httpx.TransportError)
+
+    def next_delay(self, previous: float) -> float:
+        """Decorrelated jitter: случайно между base_delay и утроенной прошлой паузой."""
+        return min(self.max_delay, random.uniform(self.base_delay, max(previous, self.base_delay) * 3))
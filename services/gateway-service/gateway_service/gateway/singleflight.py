@@ -0,0 +1,71 @@
+"""
+Склейка одинаковых конкурентных запросов (single-flight).
+
+Пока запрос с ключом key выполняется, все остальные вызывающие с тем же ключом
+не идут в сеть, а ждут тот же результат (или то же исключение).
+Так десяток аренд с одной популярной машиной дают один GET /cars/{uid}.
+
+Общий запрос выполняется в контексте первого вызывающего (лидера): с его
+дедлайном (deadline) и в его трассе (tracing) – спан сетевого вызова дочерний
+к спану лидера. Присоединившийся, у которого бюджет ещё есть, на DeadlineExceeded
+лидера не падает, а повторяет вызов сам.
+"""
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Hashable
+
+from .deadline import DeadlineExceeded, remaining
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    hits – вызовы, которые присоединились к уже летящему запросу,
+    misses – вызовы, которые сами пошли в сеть.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self._lock = threading.Lock()
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._inflight.get(key)
+            joined = task is not None and task.get_loop() is loop
+            if joined:
+                self.hits += 1
+            else:
+                self.misses += 1
+                task = loop.create_task(func())
+                self._inflight[key] = task
+                task.add_done_callback(lambda done: self._forget(key, done))
+
+        try:
+            # shield: отмена одного ожидающего (клиент ушёл) не отменяет запрос для остальных
+            return await asyncio.shield(task)
+        except DeadlineExceeded:
+            left = remaining()
+            if not joined or (left is not None and left <= 0):
+                raise
+            # Общий запрос упёрся в дедлайн лидера, а наш бюджет не исчерпан – идём сами
+            logger.debug("SingleFlight[%s] leader deadline exceeded, retrying %r", self.name, key)
+            return await self.do(key, func)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        with self._lock:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+        if not task.cancelled():
+            # Исключение уже получили ожидающие; помечаем как извлечённое,
+            # чтобы asyncio не ругался, если все ожидающие были отменены
+            task.exception()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "inflight": len(self._inflight)}
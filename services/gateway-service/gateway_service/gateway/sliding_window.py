@@ -0,0 +1,112 @@
+"""
+Скользящие окна статистики вызовов для CircuitBreaker.
+
+Оба окна – кольцевые буферы фиксированного размера, поэтому запись вызова
+стоит O(1) по памяти независимо от нагрузки.
+"""
+import threading
+from dataclasses import dataclass
+
+WINDOW_COUNT = "count"
+WINDOW_TIME = "time"
+
+
+@dataclass(frozen=True)
+class WindowSnapshot:
+    calls: int = 0
+    failures: int = 0
+    slow_calls: int = 0
+
+    @property
+    def failure_rate(self) -> float:
+        """Доля неуспешных вызовов в процентах."""
+        return 100.0 * self.failures / self.calls if self.calls else 0.0
+
+    @property
+    def slow_call_rate(self) -> float:
+        """Доля медленных вызовов в процентах."""
+        return 100.0 * self.slow_calls / self.calls if self.calls else 0.0
+
+
+class CountBasedWindow:
+    """Исходы последних size вызовов."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._failed = bytearray(size)
+        self._slow = bytearray(size)
+        self._pos = 0
+        self._calls = 0
+        self._failures = 0
+        self._slow_calls = 0
+        self._lock = threading.Lock()
+
+    def record(self, failed: bool, slow: bool, now: float) -> WindowSnapshot:
+        with self._lock:
+            if self._calls == self.size:
+                # Буфер полон – вытесняем самый старый исход
+                self._failures -= self._failed[self._pos]
+                self._slow_calls -= self._slow[self._pos]
+            else:
+                self._calls += 1
+
+            self._failed[self._pos] = failed
+            self._slow[self._pos] = slow
+            self._failures += failed
+            self._slow_calls += slow
+            self._pos = (self._pos + 1) % self.size
+            return WindowSnapshot(self._calls, self._failures, self._slow_calls)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._failed = bytearray(self.size)
+            self._slow = bytearray(self.size)
+            self._pos = self._calls = self._failures = self._slow_calls = 0
+
+
+class TimeBasedWindow:
+    """Агрегаты за последние size секунд: кольцо из size посекундных корзин."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._epochs = [-1] * size
+        self._calls = [0] * size
+        self._failures = [0] * size
+        self._slow_calls = [0] * size
+        self._lock = threading.Lock()
+
+    def record(self, failed: bool, slow: bool, now: float) -> WindowSnapshot:
+        second = int(now)
+        idx = second % self.size
+        with self._lock:
+            if self._epochs[idx] != second:
+                # Корзина осталась от прошлого круга – переиспользуем
+                self._epochs[idx] = second
+                self._calls[idx] = self._failures[idx] = self._slow_calls[idx] = 0
+            self._calls[idx] += 1
+            self._failures[idx] += failed
+            self._slow_calls[idx] += slow
+
+            oldest = second - self.size
+            calls = failures = slow_calls = 0
+            for i in range(self.size):
+                if self._epochs[i] > oldest:
+                    calls += self._calls[i]
+                    failures += self._failures[i]
+                    slow_calls += self._slow_calls[i]
+            return WindowSnapshot(calls, failures, slow_calls)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._epochs = [-1] * self.size
+            self._calls = [0] * self.size
+            self._failures = [0] * self.size
+            self._slow_calls = [0] * self.size
+
+
+def make_window(window_type: str, size: int):
+    if window_type == WINDOW_COUNT:
+        return CountBasedWindow(size)
+    if window_type == WINDOW_TIME:
+        return TimeBasedWindow(size)
+    raise ValueError(f"Unknown sliding window type: {window_type}")
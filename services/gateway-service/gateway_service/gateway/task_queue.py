@@ -5,13 +5,23 @@ from typing import Dict, Any
 import redis
 from django.conf import settings
 
+from .metrics import QueueDepthCollector, register_scrape_collector
+
 logger = logging.getLogger(__name__)
 
 
-redis_client = redis.Redis.from_url(settings.REDIS_URL)
+redis_client = redis.Redis.from_url(
+    settings.REDIS_URL,
+    socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+)
 
 QUEUE_KEY = "gateway:tasks"
 RETRY_DELAY = 10  # секунд
+# Сколько воркер ждёт задачу в одном BLPOP – меньше REDIS_SOCKET_TIMEOUT
+BLPOP_TIMEOUT = 1  # секунд
+
+register_scrape_collector(QueueDepthCollector(redis_client, QUEUE_KEY))
 
 
 def enqueue_task(task_type: str, payload: Dict[str, Any], retry: int = 0) -> None:
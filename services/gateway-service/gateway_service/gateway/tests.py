@@ -0,0 +1,1661 @@
+import asyncio
+import random
+import threading
+import time
+import uuid
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import redis
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+from prometheus_client import REGISTRY
+from service_common import tracing
+from service_common.testing import MetricsEndpointTestsMixin
+from service_common.tracing import (
+    KIND_CLIENT, KIND_SERVER, TRACEPARENT_HEADER, InMemoryExporter, parse_traceparent, tracing_middleware,
+)
+
+from . import clients
+from .adaptive_limit import AIMDLimiter
+from .breaker_store import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, BreakerState, LocalStateStore, RedisStateStore
+from .bulkhead import Bulkhead, BulkheadFull
+from .circuit_breaker import CircuitBreaker, ServiceUnavailable
+from .composition import Call, Composition, CompositionError
+from .hedging import HedgeBudget, HedgePolicy, LatencyTracker, route_key
+from .http_pool import PoolConfig
+from .fallback_cache import STALE_KEY, FallbackCache
+from .deadline import (
+    DEADLINE_EXCEEDED_HEADER, DEADLINE_HEADER, DeadlineExceeded, check as check_deadline, deadline_scope, detached,
+    from_header, get_deadline, remaining, to_header,
+)
+from .middleware import AdaptiveConcurrencyMiddleware, DeadlineMiddleware
+from .retry import RetryBudget, RetryPolicy
+from .singleflight import SingleFlight
+from .sliding_window import CountBasedWindow, TimeBasedWindow, WindowSnapshot, make_window
+from .views import _rental_list_params
+from .management.commands.process_gateway_tasks import Command as TaskWorker
+
+
+def _rental(status: str = "IN_PROGRESS") -> dict:
+    return {"rentalUid": str(uuid.uuid4()), "status": status, "carUid": str(uuid.uuid4()),
+            "paymentUid": str(uuid.uuid4()), "dateFrom": "2025-01-01", "dateTo": "2025-01-04"}
+
+
+def _status_error(status_code: int, body: bytes = b"{}") -> httpx.HTTPStatusError:
+    request = httpx.Request("DELETE", "http://rental-service/api/v1/rental/x/")
+    response = httpx.Response(status_code, content=body, request=request)
+    return httpx.HTTPStatusError(f"{status_code}", request=request, response=response)
+
+
+class RentalTransitionViewTests(SimpleTestCase):
+    """Отмена и завершение аренды в шлюзе: 204, 404/503 и 409 без побочных эффектов."""
+
+    def setUp(self):
+        self.rental = _rental()
+        self.calls = {name: AsyncMock() for name in (
+            "get_rental", "release_car", "cancel_rental", "finish_rental", "cancel_payment")}
+        self.calls["get_rental"].return_value = self.rental
+        for name, mock in self.calls.items():
+            patcher = patch.object(clients, name, mock)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch("gateway_service.gateway.views.enqueue_task")
+        self.enqueue = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def delete(self):
+        return self.client.delete(f"/api/v1/rental/{self.rental['rentalUid']}", HTTP_X_USER_NAME="user")
+
+    def finish(self):
+        return self.client.post(f"/api/v1/rental/{self.rental['rentalUid']}/finish",
+                                content_type="application/json", HTTP_X_USER_NAME="user")
+
+    def test_cancel(self):
+        self.assertEqual(self.delete().status_code, 204)
+        self.calls["release_car"].assert_awaited_once_with(self.rental["carUid"])
+        self.calls["cancel_rental"].assert_awaited_once_with("user", self.rental["rentalUid"])
+        self.calls["cancel_payment"].assert_awaited_once_with(self.rental["paymentUid"])
+
+    def test_cancel_already_canceled(self):
+        self.rental["status"] = "CANCELED"
+        self.assertEqual(self.delete().status_code, 204)
+        self.calls["release_car"].assert_not_awaited()
+        self.calls["cancel_payment"].assert_not_awaited()
+
+    def test_cancel_finished(self):
+        self.rental["status"] = "FINISHED"
+        self.assertEqual(self.delete().status_code, 409)
+        self.calls["release_car"].assert_not_awaited()
+        self.calls["cancel_rental"].assert_not_awaited()
+        self.calls["cancel_payment"].assert_not_awaited()
+
+    def test_cancel_finished_concurrently(self):
+        # Проверка статуса прошла, но аренду успели завершить: rental-service ответил 409
+        self.calls["cancel_rental"].side_effect = clients.RentalStateConflict("finished")
+        self.assertEqual(self.delete().status_code, 409)
+        self.calls["cancel_payment"].assert_not_awaited()
+        self.enqueue.assert_not_called()
+
+    def test_cancel_unknown_rental(self):
+        self.calls["get_rental"].side_effect = clients.RentalNotFound("no")
+        self.assertEqual(self.delete().status_code, 404)
+        self.calls["release_car"].assert_not_awaited()
+
+    def test_cancel_rental_service_down(self):
+        self.calls["get_rental"].side_effect = httpx.ConnectError("down")
+        self.assertEqual(self.delete().status_code, 503)
+        self.calls["release_car"].assert_not_awaited()
+
+    def test_cancel_rental_failure_queues_payment_with_rental(self):
+        self.calls["cancel_rental"].side_effect = httpx.ConnectError("down")
+        self.assertEqual(self.delete().status_code, 204)
+        self.calls["cancel_payment"].assert_not_awaited()
+        self.enqueue.assert_called_once_with("cancel_rental", {
+            "username": "user", "rentalUid": self.rental["rentalUid"], "paymentUid": self.rental["paymentUid"],
+        })
+
+    def test_cancel_payment_failure_is_queued(self):
+        self.calls["cancel_payment"].side_effect = httpx.ConnectError("down")
+        self.assertEqual(self.delete().status_code, 204)
+        self.enqueue.assert_called_once_with("cancel_payment", {"paymentUid": self.rental["paymentUid"]})
+
+    def test_finish(self):
+        self.assertEqual(self.finish().status_code, 204)
+        self.calls["release_car"].assert_awaited_once_with(self.rental["carUid"])
+        self.calls["finish_rental"].assert_awaited_once_with("user", self.rental["rentalUid"])
+
+    def test_finish_already_finished(self):
+        self.rental["status"] = "FINISHED"
+        self.assertEqual(self.finish().status_code, 204)
+        self.calls["release_car"].assert_not_awaited()
+        self.calls["finish_rental"].assert_not_awaited()
+
+    def test_finish_canceled(self):
+        self.rental["status"] = "CANCELED"
+        self.assertEqual(self.finish().status_code, 409)
+        self.calls["release_car"].assert_not_awaited()
+
+    def test_finish_unknown_rental(self):
+        self.calls["get_rental"].side_effect = clients.RentalNotFound("no")
+        self.assertEqual(self.finish().status_code, 404)
+        self.calls["release_car"].assert_not_awaited()
+
+    def test_finish_canceled_concurrently(self):
+        self.calls["finish_rental"].side_effect = clients.RentalStateConflict("canceled")
+        self.assertEqual(self.finish().status_code, 409)
+
+
+class RentalErrorMappingTests(SimpleTestCase):
+    """409/404 от rental-service – RentalStateConflict/RentalNotFound, остальные ошибки – как есть."""
+
+    async def test_conflict(self):
+        with patch.object(clients.rental_client, "delete",
+                          AsyncMock(side_effect=_status_error(409, b'{"message": "no"}'))):
+            with self.assertRaisesMessage(clients.RentalStateConflict, "no"):
+                await clients.cancel_rental("user", str(uuid.uuid4()))
+
+    async def test_not_found_is_not_a_breaker_failure(self):
+        with patch.object(clients.rental_client, "get", AsyncMock(side_effect=_status_error(404))), \
+                patch.object(clients.rental_cb, "_record_failure") as record_failure:
+            with self.assertRaises(clients.RentalNotFound):
+                await clients.get_rental("user", str(uuid.uuid4()))
+        record_failure.assert_not_called()
+
+    async def test_other_errors(self):
+        with patch.object(clients.rental_client, "post", AsyncMock(side_effect=_status_error(500))):
+            with self.assertRaises(httpx.HTTPStatusError):
+                await clients.finish_rental("user", str(uuid.uuid4()))
+
+
+class RentalListViewTests(SimpleTestCase):
+    """Список аренд в шлюзе: параметры проверяются до rental-service, курсор – из X-Next-Cursor."""
+
+    def setUp(self):
+        self.rental = _rental()
+        self.get_rentals = AsyncMock(return_value={"items": [self.rental], "nextCursor": "MTI="})
+        for name, mock in (("get_rentals", self.get_rentals),
+                           ("get_cars_by_uids", AsyncMock(return_value={
+                               self.rental["carUid"]: {"carUid": self.rental["carUid"]}})),
+                           ("get_payments_by_uids", AsyncMock(return_value={
+                               self.rental["paymentUid"]: {"paymentUid": self.rental["paymentUid"]}}))):
+            patcher = patch.object(clients, name, mock)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get(self, **params):
+        return self.client.get("/api/v1/rental", params, HTTP_X_USER_NAME="user")
+
+    def test_params_are_passed_through(self):
+        params = {"cursor": "MTI=", "limit": "20", "status": "FINISHED", "dateFrom": "2025-01-01", "dateTo": "2025-01-31"}
+        self.assertEqual(_rental_list_params(params), params)
+        # Пустые и неизвестные параметры отбрасываются
+        self.assertEqual(_rental_list_params({"cursor": "", "limit": "1", "page": "2"}), {"limit": "1"})
+
+    def test_invalid_params(self):
+        for params in ({"limit": "0"}, {"limit": "101"}, {"limit": "-1"}, {"limit": "ten"},
+                       {"status": "in_progress"}, {"dateFrom": "2025-13-01"}, {"dateTo": "01.01.2025"}):
+            with self.assertRaises(ValueError):
+                _rental_list_params(params)
+            self.assertEqual(self.get(**params).status_code, 400, params)
+        self.get_rentals.assert_not_awaited()
+
+    def test_next_cursor_header(self):
+        response = self.get(limit="1", status="IN_PROGRESS")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Next-Cursor"], "MTI=")
+        self.assertEqual([rental["rentalUid"] for rental in response.json()], [self.rental["rentalUid"]])
+        self.get_rentals.assert_awaited_once_with("user", {"limit": "1", "status": "IN_PROGRESS"})
+
+    def test_last_page_has_no_header(self):
+        self.get_rentals.return_value = {"items": [], "nextCursor": None}
+        response = self.get(cursor="MTI=")
+        self.assertEqual(response.json(), [])
+        self.assertNotIn("X-Next-Cursor", response)
+
+
+
+class RentalListClientTests(SimpleTestCase):
+    """get_rentals: тело – страница аренд, курсор следующей – из заголовка ответа rental-service."""
+
+    async def test_cursor_header(self):
+        request = httpx.Request("GET", "http://rental-service/api/v1/rental")
+        rental = _rental()
+        pages = [httpx.Response(200, json=[rental], headers={"X-Next-Cursor": "MTI="}, request=request),
+                 httpx.Response(200, json=[], request=request)]
+        with patch.object(clients.rental_client, "get", AsyncMock(side_effect=pages)) as get:
+            self.assertEqual(await clients.get_rentals("user", {"limit": "1"}),
+                             {"items": [rental], "nextCursor": "MTI="})
+            self.assertEqual(await clients.get_rentals("user", {"limit": "1", "cursor": "MTI="}),
+                             {"items": [], "nextCursor": None})
+        self.assertEqual(get.await_args.kwargs["params"], {"limit": "1", "cursor": "MTI="})
+
+
+
+class BatchEnrichmentTests(SimpleTestCase):
+    """Список аренд: авто и оплаты – одним пакетным POST на сервис, фолбэк – по каждой записи."""
+
+    def setUp(self):
+        self.rentals = [_rental(), _rental(), _rental()]
+        # Две аренды одного авто – в пакет uid попадает один раз
+        self.rentals[1]["carUid"] = self.rentals[0]["carUid"]
+        self.cars = {r["carUid"]: {"carUid": r["carUid"], "brand": "Lada", "model": "Vesta",
+                                   "registrationNumber": r["carUid"][:6]} for r in self.rentals}
+        self.payments = {r["paymentUid"]: {"paymentUid": r["paymentUid"], "status": "PAID", "price": 300}
+                         for r in self.rentals}
+        self.requests = []
+        self.car_status = self.payment_status = 200
+        breaker_options = {**clients.BREAKER_OPTIONS, "store": LocalStateStore()}
+        self.car_cb = CircuitBreaker("car", **breaker_options)
+        self.car_cache = FallbackCache("car", refresh_delay=60)
+        for name, value in (("get_rentals", AsyncMock(return_value={"items": self.rentals, "nextCursor": None})),
+                            ("car_cb", self.car_cb),
+                            ("payment_cb", CircuitBreaker("payment", **breaker_options)),
+                            ("car_cache", self.car_cache),
+                            ("payment_cache", FallbackCache("payment", refresh_delay=60))):
+            patcher = patch.object(clients, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def handler(self, request):
+        self.requests.append(request)
+        uids = clients.loads(request.content)
+        if request.url.path == "/api/v1/cars/batch/":
+            found = [self.cars[uid] for uid in uids["carUids"] if uid in self.cars]
+            return httpx.Response(self.car_status, json=found if self.car_status == 200 else {})
+        found = [self.payments[uid] for uid in uids["paymentUids"] if uid in self.payments]
+        return httpx.Response(self.payment_status, json=found if self.payment_status == 200 else {})
+
+    def mock_clients(self):
+        for name, base_url in (("car_client", "http://car/api/v1"), ("payment_client", "http://payment/api/v1")):
+            client = clients.ServiceClient(name, base_url, coalesce=False)
+            client._client = httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+            client._loop = asyncio.get_running_loop()
+            patcher = patch.object(clients, name, client)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def posts(self, path: str) -> list[list[str]]:
+        return [next(iter(clients.loads(r.content).values())) for r in self.requests if r.url.path == path]
+
+    async def run_list(self) -> list[dict]:
+        from .views import rental_list_composition
+        return (await rental_list_composition("user", {}).run())["items"]
+
+    async def test_one_post_per_downstream(self):
+        self.mock_clients()
+        missing = self.rentals[2]["carUid"]
+        del self.cars[missing]
+        items = await self.run_list()
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(sorted(self.posts("/api/v1/cars/batch/")[0]),
+                         sorted({r["carUid"] for r in self.rentals}))
+        self.assertEqual(len(self.posts("/api/v1/payment/batch/")[0]), 3)
+        for rental, item in zip(self.rentals, items):
+            self.assertEqual(item["rentalUid"], rental["rentalUid"])
+            self.assertEqual(item["payment"], self.payments[rental["paymentUid"]])
+        self.assertEqual(items[0]["car"], self.cars[self.rentals[0]["carUid"]])
+        self.assertEqual(items[1]["car"], items[0]["car"])
+        # Ненайденное авто – только uid
+        self.assertEqual(items[2]["car"], {"carUid": missing})
+
+    async def test_failed_batch_falls_back_per_item(self):
+        self.mock_clients()
+        cached = self.cars[self.rentals[0]["carUid"]]
+        self.car_cache.put(cached["carUid"], cached)
+        self.car_status = 503
+        items = await self.run_list()
+        self.assertEqual(len(self.posts("/api/v1/cars/batch/")), 1)
+        self.assertEqual(self.car_cb.failure_count, 1)
+        # Из кеша – последняя известная версия, остальное – только uid
+        self.assertEqual(items[0]["car"], {**cached, STALE_KEY: True})
+        self.assertEqual(items[2]["car"], {"carUid": self.rentals[2]["carUid"]})
+        self.assertEqual(items[2]["payment"], self.payments[self.rentals[2]["paymentUid"]])
+        for task in self.car_cache._tasks:
+            task.cancel()
+
+    async def test_client_error_is_not_breaker_failure(self):
+        self.mock_clients()
+        self.car_status = 400
+        with self.assertRaises(clients.DownstreamRejected):
+            await clients.get_cars_by_uids([r["carUid"] for r in self.rentals])
+        items = await self.run_list()
+        self.assertEqual((self.car_cb.state, self.car_cb.failure_count), (STATE_CLOSED, 0))
+        self.assertEqual([item["car"] for item in items], [{"carUid": r["carUid"]} for r in self.rentals])
+
+    async def test_batches_are_chunked(self):
+        self.mock_clients()
+        uids = [str(uuid.uuid4()) for _ in range(clients.BATCH_MAX_SIZE * 2 + 1)]
+        self.cars = {uid: {"carUid": uid} for uid in uids}
+        found = await clients.get_cars_by_uids(uids)
+        self.assertEqual([len(chunk) for chunk in self.posts("/api/v1/cars/batch/")],
+                         [clients.BATCH_MAX_SIZE, clients.BATCH_MAX_SIZE, 1])
+        self.assertEqual(list(found), uids)
+        self.assertEqual(len(self.car_cache._items), len(uids))
+
+
+
+class RentalCreateByCriteriaTests(SimpleTestCase):
+    """Оформление аренды по carCriteria: авто выбирает car-service, компенсации – по выбранному авто."""
+
+    def setUp(self):
+        self.car = {"carUid": str(uuid.uuid4()), "price": 1000, "available": False}
+        self.payment = {"paymentUid": str(uuid.uuid4()), "status": "PAID", "price": 3000}
+        self.calls = {name: AsyncMock() for name in (
+            "reserve_any_car", "create_payment", "create_rental", "release_car", "cancel_payment")}
+        self.calls["reserve_any_car"].return_value = self.car
+        self.calls["create_payment"].return_value = self.payment
+        self.calls["create_rental"].return_value = {"rentalUid": str(uuid.uuid4()), "status": "IN_PROGRESS"}
+        for name, mock in self.calls.items():
+            patcher = patch.object(clients, name, mock)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, **data):
+        return self.client.post("/api/v1/rental", {"dateFrom": "2025-01-01", "dateTo": "2025-01-04", **data},
+                                content_type="application/json", HTTP_X_USER_NAME="user")
+
+    def test_create(self):
+        response = self.post(carCriteria={"type": "SUV", "brand": None, "maxPrice": 2000, "unknown": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["carUid"], self.car["carUid"])
+        self.assertEqual(response.json()["payment"], self.payment)
+        # В car-service уходят только известные и непустые критерии
+        self.calls["reserve_any_car"].assert_awaited_once_with({"type": "SUV", "maxPrice": 2000})
+        self.calls["create_payment"].assert_awaited_once_with(3000)
+        self.calls["create_rental"].assert_awaited_once_with(
+            "user", self.car["carUid"], self.payment["paymentUid"], "2025-01-01", "2025-01-04")
+
+    def test_car_uid_or_criteria_required(self):
+        for data in ({}, {"carUid": ""}, {"carCriteria": None}, {"carCriteria": ["SUV"]}):
+            response = self.post(**data)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {"message": "carUid or carCriteria is required"})
+        self.calls["reserve_any_car"].assert_not_awaited()
+
+    def test_no_car_available(self):
+        self.calls["reserve_any_car"].side_effect = clients.NoCarAvailable("No available car matches the criteria")
+        response = self.post(carCriteria={})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {"message": "No available car matches the criteria"})
+        self.calls["create_payment"].assert_not_awaited()
+        self.calls["release_car"].assert_not_awaited()
+
+    def test_payment_failure_releases_reserved_car(self):
+        self.calls["create_payment"].side_effect = httpx.ConnectError("down")
+        self.assertEqual(self.post(carCriteria={"type": "SUV"}).status_code, 503)
+        self.calls["release_car"].assert_awaited_once_with(self.car["carUid"])
+        self.calls["cancel_payment"].assert_not_awaited()
+
+    def test_rental_failure_releases_car_and_cancels_payment(self):
+        self.calls["create_rental"].side_effect = httpx.ConnectError("down")
+        response = self.post(carCriteria={"type": "SUV"})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {"message": "Failed to create rental"})
+        self.calls["release_car"].assert_awaited_once_with(self.car["carUid"])
+        self.calls["cancel_payment"].assert_awaited_once_with(self.payment["paymentUid"])
+
+
+
+class ReserveAnyCarClientTests(SimpleTestCase):
+    """409 от car-service на reserve-any – NoCarAvailable, остальные ошибки – как есть."""
+
+    async def test_conflict(self):
+        error = _status_error(409, b'{"message": "no"}')
+        with patch.object(clients.car_client, "post", AsyncMock(side_effect=error)):
+            with self.assertRaises(clients.NoCarAvailable):
+                await clients.reserve_any_car({"type": "SUV"})
+        with patch.object(clients.car_client, "post", AsyncMock(side_effect=_status_error(500))):
+            with self.assertRaises(httpx.HTTPStatusError):
+                await clients.reserve_any_car({})
+
+
+@patch("gateway_service.gateway.management.commands.process_gateway_tasks.asyncio.sleep", AsyncMock())
+@patch("gateway_service.gateway.management.commands.process_gateway_tasks.enqueue_task")
+class TaskWorkerTests(SimpleTestCase):
+    """Воркер очереди: отмена оплаты идёт только после отмены аренды."""
+
+    def task(self, **payload):
+        return {"type": "cancel_rental", "retry": 0,
+                "payload": {"username": "user", "rentalUid": "r", "paymentUid": "p", **payload}}
+
+    async def test_cancel_rental_then_payment(self, enqueue):
+        with patch.object(clients, "cancel_rental", AsyncMock()), \
+                patch.object(clients, "cancel_payment", AsyncMock()) as cancel_payment:
+            await TaskWorker._process_task(self.task())
+        cancel_payment.assert_awaited_once_with("p")
+        enqueue.assert_not_called()
+
+    async def test_conflict_drops_payment_cancel(self, enqueue):
+        with patch.object(clients, "cancel_rental", AsyncMock(side_effect=clients.RentalStateConflict("x"))), \
+                patch.object(clients, "cancel_payment", AsyncMock()) as cancel_payment:
+            await TaskWorker._process_task(self.task())
+        cancel_payment.assert_not_awaited()
+        enqueue.assert_not_called()
+
+    async def test_missing_rental_drops_payment_cancel(self, enqueue):
+        with patch.object(clients, "cancel_rental", AsyncMock(side_effect=clients.RentalNotFound("x"))), \
+                patch.object(clients, "cancel_payment", AsyncMock()) as cancel_payment:
+            await TaskWorker._process_task(self.task())
+        cancel_payment.assert_not_awaited()
+        enqueue.assert_not_called()
+
+    async def test_rental_failure_is_retried_with_payment(self, enqueue):
+        with patch.object(clients, "cancel_rental", AsyncMock(side_effect=httpx.ConnectError("down"))), \
+                patch.object(clients, "cancel_payment", AsyncMock()) as cancel_payment:
+            await TaskWorker._process_task(self.task())
+        cancel_payment.assert_not_awaited()
+        enqueue.assert_called_once_with("cancel_rental", self.task()["payload"], retry=1)
+
+    async def test_payment_failure_is_queued_separately(self, enqueue):
+        with patch.object(clients, "cancel_rental", AsyncMock()), \
+                patch.object(clients, "cancel_payment", AsyncMock(side_effect=httpx.ConnectError("down"))):
+            await TaskWorker._process_task(self.task())
+        enqueue.assert_called_once_with("cancel_payment", {"paymentUid": "p"})
+
+
+class RedisStateStoreTests(SimpleTestCase):
+    """Общее состояние breaker'ов: сброс ошибок других воркеров и работа с медленным Redis."""
+
+    def setUp(self):
+        self.redis = MagicMock()
+        self.redis.hmget.return_value = [None] * 5
+        self.store = RedisStateStore(self.redis, cache_ttl=1.0)
+
+    def test_success_after_clean_read_skips_redis(self):
+        self.store.get("svc")
+        self.store.record_success("svc")
+        self.redis.delete.assert_not_called()
+
+    def test_success_resets_failures_seen_in_redis(self):
+        # Другие воркеры насчитали 2 ошибки подряд – наш успех их сбрасывает
+        self.redis.hmget.return_value = [b"closed", b"2", b"1.0", b"0", b"0"]
+        self.assertEqual(self.store.get("svc").failure_count, 2)
+        self.store.record_success("svc")
+        self.redis.delete.assert_called_once_with("gateway:cb:svc")
+        self.assertEqual(self.store.get("svc"), BreakerState())
+
+    def test_success_after_cache_expired_resets_redis(self):
+        self.store.get("svc")
+        self.store._cache["svc"] = (BreakerState(), time.monotonic() - 2)
+        self.store.record_success("svc")
+        self.redis.delete.assert_called_once_with("gateway:cb:svc")
+
+    def test_redis_error_falls_back_to_local_state(self):
+        self.redis.hmget.side_effect = redis.TimeoutError()
+        self.assertEqual(self.store.get("svc"), BreakerState())
+        self.assertTrue(self.store.in_memory("svc"))
+        self.redis.hmget.reset_mock()
+        self.store.get("svc")
+        self.redis.hmget.assert_not_called()
+
+    async def test_hot_path_stays_on_loop(self):
+        breaker = CircuitBreaker("svc", store=self.store)
+        self.store.get("svc")
+        with patch("gateway_service.gateway.circuit_breaker.asyncio.to_thread") as to_thread:
+            self.assertEqual(await breaker.call(AsyncMock(return_value="ok")), "ok")
+        to_thread.assert_not_called()
+        self.redis.delete.assert_not_called()
+
+    async def test_slow_redis_does_not_stall_event_loop(self):
+        def slow_hmget(*args):
+            time.sleep(0.3)
+            return [None] * 5
+        self.redis.hmget.side_effect = slow_hmget
+        breaker = CircuitBreaker("svc", store=self.store)
+
+        gaps = []
+
+        async def ticker():
+            last = time.monotonic()
+            for _ in range(10):
+                await asyncio.sleep(0.02)
+                gaps.append(time.monotonic() - last)
+                last = time.monotonic()
+
+        result, _ = await asyncio.gather(breaker.call(AsyncMock(return_value="ok")), ticker())
+        self.assertEqual(result, "ok")
+        self.redis.hmget.assert_called()
+        self.assertLess(max(gaps), 0.2)
+
+    async def test_failure_is_recorded_in_redis_off_loop(self):
+        script = self.redis.register_script.return_value
+        script.return_value = [b"open", 3, b"1.0", 0, b"0", 0]
+        breaker = CircuitBreaker("svc", store=self.store, failure_threshold=3)
+        with patch("gateway_service.gateway.circuit_breaker.asyncio.to_thread",
+                   side_effect=asyncio.to_thread) as to_thread:
+            with self.assertRaises(RuntimeError):
+                await breaker.call(AsyncMock(side_effect=RuntimeError("down")))
+        self.assertIn(breaker._record_failure, [c.args[0] for c in to_thread.call_args_list])
+        self.assertEqual(self.store.get("svc").state, STATE_OPEN)
+
+
+class CompositionTests(SimpleTestCase):
+    """Композиция: порядок по зависимостям, параллельные шаги, фолбэки и результаты для компенсаций."""
+
+    async def test_dependencies_run_after_and_receive_results(self):
+        order = []
+
+        async def step(name, value, **deps):
+            order.append(name)
+            return value, deps
+
+        result = await Composition(
+            Call("rental", lambda: step("rental", 1)),
+            Call("car", lambda rental: step("car", 2, rental=rental), depends_on=("rental",)),
+            Call("total", lambda rental, car: step("total", 3, rental=rental, car=car),
+                 depends_on=("rental", "car")),
+        ).run()
+
+        self.assertEqual(order, ["rental", "car", "total"])
+        self.assertEqual(result["car"], (2, {"rental": (1, {})}))
+        self.assertEqual(result["total"][1]["car"][0], 2)
+
+    async def test_independent_steps_run_concurrently(self):
+        # Каждый шаг ждёт, пока стартует другой: последовательно это бы зависло
+        started = {"car": asyncio.Event(), "payment": asyncio.Event()}
+
+        async def step(name, other):
+            started[name].set()
+            await started[other].wait()
+            return name
+
+        result = await asyncio.wait_for(Composition(
+            Call("car", lambda: step("car", "payment")),
+            Call("payment", lambda: step("payment", "car")),
+        ).run(), timeout=1)
+        self.assertEqual(result, {"car": "car", "payment": "payment"})
+
+    async def test_assemble(self):
+        result = await Composition(
+            Call("a", AsyncMock(return_value=2)),
+            Call("b", AsyncMock(return_value=3)),
+            assemble=lambda a, b: a * b,
+        ).run()
+        self.assertEqual(result, 6)
+
+    async def test_fallback_gets_dependency_results(self):
+        async def async_fallback(rental):
+            return {"carUid": rental["carUid"], "async": True}
+
+        result = await Composition(
+            Call("rental", AsyncMock(return_value={"carUid": "c", "paymentUid": "p"})),
+            Call("car", AsyncMock(side_effect=RuntimeError("down")), depends_on=("rental",),
+                 fallback=async_fallback),
+            Call("payment", AsyncMock(side_effect=RuntimeError("down")), depends_on=("rental",),
+                 fallback=lambda rental: {"paymentUid": rental["paymentUid"]}),
+        ).run()
+        self.assertEqual(result["car"], {"carUid": "c", "async": True})
+        self.assertEqual(result["payment"], {"paymentUid": "p"})
+
+    async def test_failed_step_lets_independent_siblings_finish(self):
+        async def slow_reserve():
+            await asyncio.sleep(0.05)
+            return "reserved"
+
+        payment = AsyncMock()
+        with self.assertRaises(CompositionError) as ctx:
+            await Composition(
+                Call("car", AsyncMock(side_effect=RuntimeError("car down"))),
+                Call("reserve", slow_reserve),
+                Call("payment", payment, depends_on=("car", "reserve")),
+            ).run()
+
+        # Резерв довели до конца – его есть чем компенсировать; зависимый шаг не запускался
+        self.assertEqual(ctx.exception.failed, "car")
+        self.assertIsInstance(ctx.exception.error, RuntimeError)
+        self.assertEqual(ctx.exception.results, {"reserve": "reserved"})
+        payment.assert_not_awaited()
+
+    async def test_first_declared_failure_is_reported(self):
+        async def late_failure():
+            await asyncio.sleep(0.02)
+            raise ValueError("first")
+
+        with self.assertRaises(CompositionError) as ctx:
+            await Composition(
+                Call("a", late_failure),
+                Call("b", AsyncMock(side_effect=KeyError("second"))),
+            ).run()
+        self.assertEqual(ctx.exception.failed, "a")
+
+    async def test_cancel_cancels_steps(self):
+        cancelled = asyncio.Event()
+
+        async def hang():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        task = asyncio.ensure_future(Composition(Call("a", hang)).run())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertTrue(cancelled.is_set())
+
+    def test_invalid_graph(self):
+        with self.assertRaises(ValueError):
+            Composition(Call("a", AsyncMock()), Call("a", AsyncMock()))
+        with self.assertRaises(ValueError):
+            Composition(Call("a", AsyncMock(), depends_on=("b",)), Call("b", AsyncMock()))
+
+
+class SlidingWindowTests(SimpleTestCase):
+    """Окна по числу вызовов и по времени, открытие breaker по доле ошибок и медленных вызовов."""
+
+    def test_count_window_evicts_oldest(self):
+        window = CountBasedWindow(3)
+        for failed, slow in ((True, True), (False, False), (False, True)):
+            snapshot = window.record(failed, slow, 0)
+        self.assertEqual(snapshot, WindowSnapshot(3, 1, 2))
+        # Четвёртый вызов вытесняет первый (ошибка и медленный)
+        self.assertEqual(window.record(False, False, 0), WindowSnapshot(3, 0, 1))
+        window.reset()
+        self.assertEqual(window.record(True, False, 0), WindowSnapshot(1, 1, 0))
+
+    def test_time_window_expires_old_seconds(self):
+        window = TimeBasedWindow(3)
+        window.record(True, False, 100.2)
+        window.record(True, True, 101.9)
+        self.assertEqual(window.record(False, False, 102.5), WindowSnapshot(3, 2, 1))
+        # Секунда 100 выпала из окна [101, 103], корзина 103 переиспользует её место
+        self.assertEqual(window.record(False, False, 103.0), WindowSnapshot(3, 1, 1))
+        self.assertEqual(window.record(False, False, 110.0), WindowSnapshot(1, 0, 0))
+
+    def test_snapshot_rates(self):
+        self.assertEqual(WindowSnapshot().failure_rate, 0.0)
+        self.assertEqual(WindowSnapshot(4, 1, 3).failure_rate, 25.0)
+        self.assertEqual(WindowSnapshot(4, 1, 3).slow_call_rate, 75.0)
+        with self.assertRaises(ValueError):
+            make_window("sessions", 10)
+
+    def breaker(self, **kwargs):
+        # Ошибки подряд не открывают breaker – только окно
+        return CircuitBreaker("svc", store=LocalStateStore(), failure_threshold=100,
+                              window_size=10, minimum_calls=4, **kwargs)
+
+    @staticmethod
+    def record(breaker, *outcomes):
+        for failed in outcomes:
+            if failed:
+                breaker._record_failure()
+            else:
+                breaker._record_success()
+
+    def test_failure_rate_trips(self):
+        breaker = self.breaker(failure_rate_threshold=50)
+        self.record(breaker, True, False, True)
+        # Меньше minimum_calls вызовов – доля ошибок ещё не учитывается
+        self.assertEqual(breaker.state, STATE_CLOSED)
+        breaker._record_success()
+        self.assertEqual(breaker.state, STATE_OPEN)
+
+    def test_failure_rate_below_threshold(self):
+        breaker = self.breaker(failure_rate_threshold=50)
+        self.record(breaker, False, False, True, False, False, True, False, False)
+        self.assertEqual(breaker.state, STATE_CLOSED)
+
+    def test_slow_call_rate_trips(self):
+        breaker = self.breaker(slow_call_duration=1.0, slow_call_rate_threshold=75)
+        for duration in (2.0, 0.1, 1.0):
+            breaker._record_success(duration)
+        self.assertEqual(breaker.state, STATE_CLOSED)
+        breaker._record_success(5.0)
+        self.assertEqual(breaker.state, STATE_OPEN)
+
+    def test_slow_calls_ignored_without_duration(self):
+        breaker = self.breaker()
+        for _ in range(10):
+            breaker._record_success(60.0)
+        self.assertEqual(breaker.state, STATE_CLOSED)
+
+    def test_window_starts_over_after_recovery(self):
+        breaker = self.breaker(failure_rate_threshold=50, recovery_timeout=0)
+        self.record(breaker, True, True, True, True)
+        self.assertEqual(breaker.state, STATE_OPEN)
+        self.assertEqual(breaker._can_try_call(), (True, True))
+        breaker._record_success(trial=True)
+        self.assertEqual(breaker.state, STATE_CLOSED)
+        # Ошибки до открытия не перешли в новое окно
+        self.record(breaker, True, False, False)
+        self.assertEqual(breaker.state, STATE_CLOSED)
+
+    async def test_late_slow_successes_keep_breaker_open(self):
+        breaker = self.breaker(slow_call_duration=0.05, slow_call_rate_threshold=50)
+
+        async def slow():
+            await asyncio.sleep(0.06)
+            return "ok"
+
+        results = await asyncio.gather(*(breaker.call(slow) for _ in range(22)))
+        # Первые minimum_calls медленных ответов открыли breaker, остальные пришли уже в OPEN
+        self.assertEqual(results, ["ok"] * 22)
+        self.assertEqual(breaker.state, STATE_OPEN)
+        breaker._record_success(0.01)
+        self.assertEqual(breaker.state, STATE_OPEN)
+
+    def test_only_trial_success_closes(self):
+        breaker = self.breaker(recovery_timeout=0)
+        breaker.store.trip("svc", time.time())
+        self.assertEqual(breaker._can_try_call(), (True, True))
+        # Ответ вызова, начатого до открытия, – не пробный
+        breaker._record_success(0.01)
+        self.assertEqual(breaker.state, STATE_HALF_OPEN)
+        breaker._record_success(0.01, trial=True)
+        self.assertEqual(breaker.state, STATE_CLOSED)
+
+
+class HalfOpenPermitTests(SimpleTestCase):
+    """HALF_OPEN: не больше half_open_max_calls пробных вызовов, возврат и перевыдача разрешений."""
+
+    def setUp(self):
+        self.store = LocalStateStore()
+        self.breaker = CircuitBreaker("svc", store=self.store, failure_threshold=1, recovery_timeout=10,
+                                      half_open_max_calls=2, slow_call_duration=0.05)
+        # Открыт давно – таймаут восстановления прошёл
+        self.store._states["svc"] = BreakerState(STATE_OPEN, 1, time.time() - 60)
+
+    async def test_at_most_max_calls_trials(self):
+        release = asyncio.Event()
+        entered = 0
+
+        async def trial():
+            nonlocal entered
+            entered += 1
+            await release.wait()
+            return "ok"
+
+        calls = [asyncio.ensure_future(self.breaker.call(trial, fallback=lambda: "fallback")) for _ in range(4)]
+        await asyncio.sleep(0.01)
+        self.assertEqual(entered, 2)
+        self.assertEqual(self.store.get("svc").half_open_calls, 2)
+        release.set()
+        self.assertEqual(sorted(await asyncio.gather(*calls)), ["fallback", "fallback", "ok", "ok"])
+        self.assertEqual(self.breaker.state, STATE_CLOSED)
+
+    async def test_rejected_without_fallback(self):
+        self.store._states["svc"] = BreakerState(STATE_HALF_OPEN, 1, time.time() - 60, 2, time.time())
+        with self.assertRaises(ServiceUnavailable):
+            await self.breaker.call(AsyncMock())
+
+    async def test_cancelled_trial_returns_permit(self):
+        async def hang():
+            await asyncio.sleep(10)
+
+        task = asyncio.ensure_future(self.breaker.call(hang))
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.store.get("svc").half_open_calls, 1)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        state = self.store.get("svc")
+        self.assertEqual((state.state, state.half_open_calls), (STATE_HALF_OPEN, 0))
+        # Разрешение снова можно получить
+        self.assertEqual(await self.breaker.call(AsyncMock(return_value="ok")), "ok")
+
+    def test_lost_permits_are_reissued_after_recovery_timeout(self):
+        now = time.time()
+        self.assertTrue(self.store.acquire_permit("svc", 10, 1, now)[1])
+        # Держатель разрешения пропал (например, упал воркер) – до таймаута отказываем
+        self.assertFalse(self.store.acquire_permit("svc", 10, 1, now + 5)[1])
+        state, granted = self.store.acquire_permit("svc", 10, 1, now + 11)
+        self.assertTrue(granted)
+        self.assertEqual((state.half_open_calls, state.half_open_since), (1, now + 11))
+
+    async def test_trial_failure_returns_to_open(self):
+        with self.assertRaises(RuntimeError):
+            await self.breaker.call(AsyncMock(side_effect=RuntimeError("still down")))
+        state = self.store.get("svc")
+        self.assertEqual(state.state, STATE_OPEN)
+        self.assertEqual(state.half_open_calls, 0)
+        # Ждём recovery_timeout заново
+        with self.assertRaises(ServiceUnavailable):
+            await self.breaker.call(AsyncMock())
+
+    async def test_slow_trial_reopens(self):
+        async def slow():
+            await asyncio.sleep(0.06)
+            return "late"
+
+        self.assertEqual(await self.breaker.call(slow), "late")
+        self.assertEqual(self.breaker.state, STATE_OPEN)
+
+    async def test_fast_trial_closes(self):
+        self.assertEqual(await self.breaker.call(AsyncMock(return_value="ok")), "ok")
+        self.assertEqual(self.store.get("svc"), BreakerState())
+
+
+class FallbackCacheTests(SimpleTestCase):
+    """Stale-while-revalidate: LRU и TTL, пометка stale, одно фоновое обновление на ключ."""
+
+    def test_lru_and_ttl(self):
+        cache = FallbackCache("car", max_size=2, ttl=60)
+        with patch("gateway_service.gateway.fallback_cache.time.monotonic", return_value=100.0) as now:
+            cache.put_many({"a": {"carUid": "a"}, "b": {"carUid": "b"}})
+            self.assertEqual(cache.get("a"), {"carUid": "a", STALE_KEY: True})
+            # "a" только что прочитан – вытесняется "b"
+            cache.put("c", {"carUid": "c"})
+            self.assertIsNone(cache.get("b"))
+            now.return_value = 161.0
+            self.assertIsNone(cache.get("a"))
+            self.assertIsNone(cache.get("c"))
+
+    def test_disabled(self):
+        for cache in (FallbackCache("car", max_size=0), FallbackCache("car", ttl=0)):
+            cache.put("a", {"carUid": "a"})
+            self.assertIsNone(cache.get("a"))
+
+    async def test_get_stale_refreshes_found_keys_once(self):
+        cache = FallbackCache("car", refresh_delay=0)
+        cache.put("a", {"carUid": "a", "price": 1})
+        release = asyncio.Event()
+        refreshed = []
+
+        async def refresh(keys):
+            refreshed.append(keys)
+            await release.wait()
+            cache.put("a", {"carUid": "a", "price": 2})
+
+        self.assertEqual(cache.get_stale(["a", "missing"], refresh), {"a": {"carUid": "a", "price": 1, STALE_KEY: True}})
+        cache.get_stale(["a"], refresh)
+        await asyncio.sleep(0)
+        self.assertEqual(refreshed, [["a"]])
+        release.set()
+        await asyncio.gather(*cache._tasks)
+        self.assertEqual(cache.get("a")["price"], 2)
+        # Обновление закончилось – следующий промах снова его запускает
+        cache.get_stale(["a"], refresh)
+        await asyncio.gather(*cache._tasks)
+        self.assertEqual(refreshed, [["a"], ["a"]])
+
+    async def test_failed_refresh_is_retried(self):
+        cache = FallbackCache("car", refresh_delay=0)
+        cache.put("a", {"carUid": "a"})
+        refresh = AsyncMock(side_effect=httpx.ConnectError("down"))
+        for _ in range(2):
+            cache.get_stale(["a"], refresh)
+            await asyncio.gather(*cache._tasks)
+        self.assertEqual(refresh.await_count, 2)
+
+    def test_no_refresh_without_event_loop(self):
+        cache = FallbackCache("car")
+        cache.put("a", {"carUid": "a"})
+        self.assertIn("a", cache.get_stale(["a"], AsyncMock()))
+        self.assertEqual((cache._tasks, cache._refreshing), (set(), set()))
+
+    async def test_clients_serve_last_known_car(self):
+        car = {"carUid": "a", "brand": "Lada"}
+        breaker = CircuitBreaker("car", store=LocalStateStore(), failure_threshold=100)
+        request = httpx.Request("GET", "http://car-service/api/v1/cars/a")
+        get = AsyncMock(side_effect=[httpx.Response(200, json=car, request=request)] + [httpx.ConnectError("down")] * 2)
+        with patch.object(clients, "car_cache", FallbackCache("car", refresh_delay=0)), \
+                patch.object(clients, "car_cb", breaker), \
+                patch.object(clients.car_client, "get", get), \
+                patch.object(clients.car_client, "post", AsyncMock(side_effect=httpx.ConnectError("down"))):
+            self.assertEqual(await clients.get_car("a", allow_fallback=True), car)
+            self.assertEqual(await clients.get_car("a", allow_fallback=True), {**car, STALE_KEY: True})
+            # Неизвестное авто – только uid, критичный сценарий – без фолбэка
+            self.assertEqual(await clients.get_cars_by_uids(["a", "b"]),
+                             {"a": {**car, STALE_KEY: True}, "b": {"carUid": "b"}})
+            with self.assertRaises(httpx.ConnectError):
+                await clients.get_car("a")
+            await asyncio.gather(*clients.car_cache._tasks)
+
+    async def test_refresh_waits_for_delay(self):
+        cache = FallbackCache("car", refresh_delay=0.05)
+        cache.put("a", {"carUid": "a"})
+        refresh = AsyncMock()
+        cache.get_stale(["a"], refresh)
+        await asyncio.sleep(0.01)
+        # Пока обновление ждёт, новые фолбэки его не повторяют
+        cache.get_stale(["a"], refresh)
+        refresh.assert_not_awaited()
+        await asyncio.gather(*cache._tasks)
+        refresh.assert_awaited_once_with(["a"])
+
+    async def test_failed_read_is_not_refreshed_at_once(self):
+        car = {"carUid": "a", "brand": "Lada"}
+        breaker = CircuitBreaker("car", store=LocalStateStore(), failure_threshold=3)
+        cache = FallbackCache("car", refresh_delay=60)
+        cache.put("a", car)
+        get = AsyncMock(side_effect=httpx.ConnectError("down"))
+        post = AsyncMock(side_effect=httpx.ConnectError("down"))
+        with patch.object(clients, "car_cache", cache), patch.object(clients, "car_cb", breaker), \
+                patch.object(clients.car_client, "get", get), patch.object(clients.car_client, "post", post):
+            self.assertEqual(await clients.get_car("a", allow_fallback=True), {**car, STALE_KEY: True})
+            await asyncio.sleep(0.01)
+            # Одно неудачное чтение – один вызов сервиса и одна ошибка в breaker
+            self.assertEqual((get.await_count, post.await_count), (1, 0))
+            self.assertEqual(breaker.failure_count, 1)
+            await clients.get_car("a", allow_fallback=True)
+            await asyncio.sleep(0.01)
+            self.assertEqual((get.await_count, post.await_count), (2, 0))
+            self.assertEqual((breaker.state, breaker.failure_count), (STATE_CLOSED, 2))
+        for task in cache._tasks:
+            task.cancel()
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Склейка одинаковых конкурентных вызовов: счётчики, общее исключение, отмена и дедлайны."""
+
+    def setUp(self):
+        self.flight = SingleFlight("svc")
+        self.release = asyncio.Event()
+        self.calls = 0
+
+    async def fetch(self, result="ok"):
+        self.calls += 1
+        await self.release.wait()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def test_concurrent_calls_share_one_request(self):
+        waiters = [asyncio.ensure_future(self.flight.do("k", self.fetch)) for _ in range(3)]
+        other = asyncio.ensure_future(self.flight.do("other", self.fetch))
+        await asyncio.sleep(0)
+        self.assertEqual(self.flight.stats(), {"hits": 2, "misses": 2, "inflight": 2})
+        self.release.set()
+        self.assertEqual(await asyncio.gather(*waiters, other), ["ok"] * 4)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.flight.stats()["inflight"], 0)
+
+        # Завершённый запрос не переиспользуется
+        await self.flight.do("k", self.fetch)
+        self.assertEqual(self.flight.stats()["misses"], 3)
+
+    async def test_exception_is_shared(self):
+        error = RuntimeError("down")
+        waiters = [asyncio.ensure_future(self.flight.do("k", lambda: self.fetch(error))) for _ in range(2)]
+        await asyncio.sleep(0)
+        self.release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        self.assertEqual(results, [error, error])
+        self.assertEqual(self.calls, 1)
+
+    async def test_cancelled_waiter_does_not_cancel_shared_request(self):
+        leader = asyncio.ensure_future(self.flight.do("k", self.fetch))
+        joiner = asyncio.ensure_future(self.flight.do("k", self.fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.release.set()
+        self.assertEqual(await joiner, "ok")
+        self.assertEqual(self.calls, 1)
+
+    async def test_joiner_with_later_deadline_retries_after_leader_deadline(self):
+        async def fetch():
+            self.calls += 1
+            await asyncio.sleep(0.03)
+            check_deadline()
+            return "ok"
+
+        with deadline_scope(time.time() + 0.01):
+            leader = asyncio.ensure_future(self.flight.do("k", fetch))
+        with deadline_scope(time.time() + 5):
+            joiner = asyncio.ensure_future(self.flight.do("k", fetch))
+        await asyncio.sleep(0)
+
+        with self.assertRaises(DeadlineExceeded):
+            await leader
+        self.assertEqual(await joiner, "ok")
+        self.assertEqual(self.calls, 2)
+
+    async def test_joiner_with_spent_deadline_gets_deadline_exceeded(self):
+        async def fetch():
+            await asyncio.sleep(0.02)
+            check_deadline()
+
+        with deadline_scope(time.time() + 0.01):
+            leader = asyncio.ensure_future(self.flight.do("k", fetch))
+            joiner = asyncio.ensure_future(self.flight.do("k", fetch))
+        results = await asyncio.gather(leader, joiner, return_exceptions=True)
+        self.assertTrue(all(isinstance(result, DeadlineExceeded) for result in results))
+        self.assertEqual(self.flight.stats()["misses"], 1)
+
+
+class TracingPropagationTests(SimpleTestCase):
+    """Шлюз продолжает трассу клиента: traceparent уходит в каждый вызов сервиса."""
+
+    async def test_traceparent_is_propagated_downstream(self):
+        trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+        sent = []
+
+        def handler(request):
+            sent.append(parse_traceparent(request.headers[TRACEPARENT_HEADER]))
+            return httpx.Response(200, json={})
+
+        client = clients.ServiceClient("svc", "http://svc/api/v1", coalesce=False)
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        client._loop = asyncio.get_running_loop()
+
+        async def view(request):
+            await asyncio.gather(client.get("/a"), client.get("/b"))
+            return HttpResponse()
+
+        exporter = InMemoryExporter()
+        request = RequestFactory().get("/api/v1/cars", HTTP_TRACEPARENT=f"00-{trace_id}-{parent_id}-01")
+        with patch.object(tracing, "EXPORTER", exporter):
+            await tracing_middleware(view)(request)
+
+        (server,) = [span for span in exporter.trace(trace_id) if span.kind == KIND_SERVER]
+        calls = [span for span in exporter.trace(trace_id) if span.kind == KIND_CLIENT]
+        self.assertEqual(server.parent_id, parent_id)
+        self.assertEqual(len(calls), 2)
+        # Каждый вызов – дочерний спан входящего запроса, сервис продолжит трассу от него
+        self.assertEqual({span.parent_id for span in calls}, {server.span_id})
+        self.assertCountEqual(sent, [(trace_id, span.span_id) for span in calls])
+
+
+class DeadlineTests(SimpleTestCase):
+    """Бюджет запроса: остаток уходит в таймауты и X-Request-Deadline, исчерпанный – 504."""
+
+    def client_with(self, handler):
+        client = clients.ServiceClient("svc", "http://svc/api/v1", coalesce=False)
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        client._loop = asyncio.get_running_loop()
+        return client
+
+    def test_helpers(self):
+        self.assertIsNone(remaining())
+        self.assertIsNone(check_deadline())
+        with deadline_scope(time.time() + 5):
+            self.assertAlmostEqual(remaining(), 5, delta=0.5)
+            with detached():
+                self.assertIsNone(get_deadline())
+        with deadline_scope(time.time() - 1):
+            with self.assertRaises(DeadlineExceeded):
+                check_deadline()
+        self.assertIsNone(get_deadline())
+        self.assertEqual(from_header(to_header(1700000000.123)), 1700000000.123)
+        for value in (None, "", "soon"):
+            self.assertIsNone(from_header(value))
+
+    async def test_remaining_budget_is_sent(self):
+        seen = {}
+
+        def handler(request):
+            seen["deadline"] = request.headers.get(DEADLINE_HEADER)
+            seen["timeout"] = request.extensions["timeout"]
+            return httpx.Response(200, json={})
+
+        client = self.client_with(handler)
+        deadline = time.time() + 0.5
+        with deadline_scope(deadline):
+            await client.get("/cars")
+        self.assertEqual(seen["deadline"], to_header(deadline))
+        self.assertLessEqual(seen["timeout"]["read"], 0.5)
+        self.assertLessEqual(seen["timeout"]["connect"], 0.5)
+
+        await client.get("/cars")
+        self.assertIsNone(seen["deadline"])
+        self.assertEqual(seen["timeout"]["read"], client.read_timeout)
+
+    async def test_exhausted_budget_skips_call(self):
+        handler = MagicMock()
+        client = self.client_with(handler)
+        with deadline_scope(time.time() - 0.001):
+            with self.assertRaises(DeadlineExceeded):
+                await client.get("/cars")
+        handler.assert_not_called()
+
+    async def test_timeout_at_deadline(self):
+        async def handler(request):
+            await asyncio.sleep(0.05)
+            raise httpx.ReadTimeout("slow", request=request)
+
+        client = self.client_with(handler)
+        with deadline_scope(time.time() + 0.02):
+            with self.assertRaises(DeadlineExceeded):
+                await client.get("/cars")
+        # Без дедлайна это таймаут самого сервиса
+        with self.assertRaises(httpx.ReadTimeout):
+            await client.get("/cars")
+
+    async def test_downstream_deadline_504_is_not_breaker_failure(self):
+        breaker = CircuitBreaker("svc", store=LocalStateStore(),
+                                 ignore_exceptions=clients.BREAKER_OPTIONS["ignore_exceptions"])
+        expired = self.client_with(lambda request: httpx.Response(
+            504, json={"message": "Request deadline exceeded"}, headers={DEADLINE_EXCEEDED_HEADER: "1"}))
+        with self.assertRaises(DeadlineExceeded):
+            await breaker.call(expired.get, "/cars")
+        self.assertEqual(breaker.failure_count, 0)
+        # 504 без пометки – таймаут самого сервиса или прокси перед ним, это сбой
+        timed_out = self.client_with(lambda request: httpx.Response(504))
+        with self.assertRaises(httpx.HTTPStatusError):
+            await breaker.call(timed_out.get, "/cars")
+        self.assertEqual(breaker.failure_count, 1)
+
+    async def test_middleware_takes_earlier_deadline(self):
+        seen = []
+
+        async def get_response(request):
+            seen.append(get_deadline())
+            return HttpResponse()
+
+        middleware = DeadlineMiddleware(get_response)
+        factory = RequestFactory()
+        incoming = time.time() + 1
+        await middleware(factory.get("/api/v1/cars", HTTP_X_REQUEST_DEADLINE=to_header(incoming)))
+        await middleware(factory.get("/api/v1/cars", HTTP_X_REQUEST_DEADLINE=to_header(time.time() + 3600)))
+        self.assertAlmostEqual(seen[0], incoming, delta=0.001)
+        self.assertAlmostEqual(seen[1], time.time() + middleware.budget, delta=1)
+        self.assertIsNone(get_deadline())
+
+    def test_exceeded_deadline_is_504(self):
+        with patch.object(clients, "get_cars", AsyncMock(side_effect=DeadlineExceeded("late"))):
+            response = self.client.get("/api/v1/cars")
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(response.json(), {"message": "Request deadline exceeded"})
+
+
+class HedgingTests(SimpleTestCase):
+    """Хедж после перцентиля задержки маршрута: первый успешный ответ, бюджет на хеджи."""
+
+    ROUTE = "/cars/{uid}"
+
+    def policy(self, tokens: int = 1) -> HedgePolicy:
+        policy = HedgePolicy("svc", percentile=50, min_samples=1, min_delay=0.02, budget_ratio=1.0)
+        policy._trackers[self.ROUTE].record(0.001)
+        for _ in range(tokens):
+            policy.budget.deposit()
+        return policy
+
+    @staticmethod
+    def sends(*behaviours):
+        """send(), которая на i-й вызов спит и отвечает (или падает) по behaviours[i]."""
+        calls = []
+
+        async def send():
+            delay, result = behaviours[len(calls)]
+            calls.append(asyncio.current_task())
+            await asyncio.sleep(delay)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        return send, calls
+
+    def test_route_key_and_percentile(self):
+        self.assertEqual(route_key(f"/cars/{uuid.uuid4()}/reserve/"), "/cars/{uid}/reserve/")
+        tracker = LatencyTracker(size=4)
+        self.assertIsNone(tracker.percentile(50, min_samples=1))
+        for seconds in (0.4, 0.1, 0.3, 0.2, 0.5):
+            tracker.record(seconds)
+        # 0.4 вытеснен, в окне 0.1–0.5 без него
+        self.assertEqual(tracker.percentile(50, min_samples=4), 0.3)
+        self.assertEqual(tracker.percentile(99, min_samples=4), 0.5)
+        self.assertIsNone(tracker.percentile(50, min_samples=5))
+
+    def test_percentile_matches_sorted_window(self):
+        tracker = LatencyTracker(size=50)
+        samples = [random.random() for _ in range(500)]
+        for i, seconds in enumerate(samples, 1):
+            tracker.record(seconds)
+            window = sorted(samples[max(0, i - 50):i])
+            for p in (50, 95, 99):
+                expected = window[min(int(len(window) * p / 100), len(window) - 1)]
+                self.assertEqual(tracker.percentile(p, min_samples=1), expected)
+
+    def test_budget(self):
+        budget = HedgeBudget(ratio=0.5, max_tokens=1.0)
+        self.assertFalse(budget.try_spend())
+        for _ in range(5):
+            budget.deposit()
+        self.assertTrue(budget.try_spend())
+        self.assertFalse(budget.try_spend())
+
+    async def test_no_hedge_without_samples(self):
+        policy = HedgePolicy("svc", min_samples=5)
+        send, calls = self.sends((0.05, "first"))
+        self.assertEqual(await policy.run(self.ROUTE, send), "first")
+        self.assertEqual((len(calls), policy.hedged), (1, 0))
+
+    async def test_fast_first_attempt(self):
+        policy = self.policy()
+        send, calls = self.sends((0, "first"))
+        self.assertEqual(await policy.run(self.ROUTE, send), "first")
+        self.assertEqual((len(calls), policy.hedged), (1, 0))
+
+    async def test_hedge_wins_and_first_is_cancelled(self):
+        policy = self.policy()
+        send, calls = self.sends((10, "first"), (0, "hedge"))
+        self.assertEqual(await policy.run(self.ROUTE, send), "hedge")
+        await asyncio.sleep(0)
+        self.assertTrue(calls[0].cancelled())
+        self.assertEqual((policy.hedged, policy.hedge_wins), (1, 1))
+
+    async def test_failed_attempt_waits_for_the_other(self):
+        policy = self.policy()
+        send, _ = self.sends((0.05, "first"), (0, httpx.ConnectError("down")))
+        self.assertEqual(await policy.run(self.ROUTE, send), "first")
+        self.assertEqual((policy.hedged, policy.hedge_wins), (1, 0))
+
+    async def test_both_failed(self):
+        policy = self.policy()
+        send, _ = self.sends((0.03, httpx.ReadTimeout("first")), (0, httpx.ConnectError("hedge")))
+        with self.assertRaises(httpx.HTTPError):
+            await policy.run(self.ROUTE, send)
+
+    async def test_no_budget(self):
+        policy = self.policy(tokens=0)
+        send, calls = self.sends((0.05, "first"))
+        self.assertEqual(await policy.run(self.ROUTE, send), "first")
+        self.assertEqual((len(calls), policy.hedged, policy.budget_denied), (1, 0, 1))
+
+    async def test_hedge_takes_own_bulkhead_slot(self):
+        policy = self.policy()
+        bulkhead = Bulkhead("svc", max_concurrent=2, max_queue=0)
+        send, calls = self.sends((10, "first"), (0.03, "hedge"))
+        async with bulkhead.slot():
+            hedged = asyncio.ensure_future(policy.run(self.ROUTE, send, bulkhead=bulkhead))
+            while len(calls) < 2:
+                await asyncio.sleep(0.005)
+            # Первая попытка и хедж – два слота, третьему вызову места нет
+            self.assertEqual(bulkhead.stats()["in_flight"], 2)
+            self.assertFalse(bulkhead.try_acquire())
+            self.assertEqual(await hedged, "hedge")
+            await asyncio.sleep(0)
+            self.assertEqual(bulkhead.stats()["in_flight"], 1)
+        self.assertEqual(bulkhead.stats()["in_flight"], 0)
+
+    async def test_no_hedge_without_free_slot(self):
+        policy = self.policy()
+        bulkhead = Bulkhead("svc", max_concurrent=1, max_queue=0)
+        send, calls = self.sends((0.05, "first"))
+        async with bulkhead.slot():
+            self.assertEqual(await policy.run(self.ROUTE, send, bulkhead=bulkhead), "first")
+        self.assertEqual((len(calls), policy.hedged, policy.bulkhead_denied), (1, 0, 1))
+        # Токен бюджета не потрачен, bulkhead не считает хедж отклонённым вызовом
+        self.assertTrue(policy.budget.try_spend())
+        self.assertEqual(bulkhead.stats()["rejected"], 0)
+
+    async def test_slot_is_returned_when_budget_denies(self):
+        policy = self.policy(tokens=0)
+        bulkhead = Bulkhead("svc", max_concurrent=2, max_queue=0)
+        send, _ = self.sends((0.05, "first"))
+        async with bulkhead.slot():
+            self.assertEqual(await policy.run(self.ROUTE, send, bulkhead=bulkhead), "first")
+            self.assertEqual(bulkhead.stats()["in_flight"], 1)
+        self.assertEqual(policy.budget_denied, 1)
+
+
+class RetryTests(SimpleTestCase):
+    """Повторы: только временные ошибки и безопасные запросы, в пределах бюджета, breaker и дедлайна."""
+
+    def client_with(self, *responses, breaker=None, budget=None, **policy):
+        """ServiceClient, отвечающий по очереди responses (код ответа или исключение)."""
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            result = responses[len(requests) - 1]
+            if isinstance(result, Exception):
+                raise result
+            return httpx.Response(result, json={})
+
+        retry = RetryPolicy(**{"base_delay": 0.001, "max_delay": 0.001, **policy}, budget=budget or RetryBudget())
+        client = clients.ServiceClient("svc", "http://svc/api/v1", coalesce=False, retry=retry, breaker=breaker)
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        client._loop = asyncio.get_running_loop()
+        return client, requests
+
+    def test_is_retryable(self):
+        policy = RetryPolicy()
+        request = httpx.Request("GET", "http://svc/")
+        for status_code, expected in ((502, True), (503, True), (504, True), (500, False), (409, False)):
+            error = httpx.HTTPStatusError("", request=request, response=httpx.Response(status_code, request=request))
+            self.assertEqual(policy.is_retryable(error, idempotent=True), expected, status_code)
+            self.assertFalse(policy.is_retryable(error, idempotent=False))
+        # Соединение не установлено – запрос не ушёл, повторять можно и POST
+        self.assertTrue(policy.is_retryable(httpx.ConnectError("down"), idempotent=False))
+        self.assertTrue(policy.is_retryable(httpx.ReadError("reset"), idempotent=True))
+        self.assertFalse(policy.is_retryable(httpx.ReadError("reset"), idempotent=False))
+
+    def test_is_idempotent(self):
+        policy = RetryPolicy(idempotent_routes=("/cars/batch/",))
+        self.assertTrue(policy.is_idempotent("GET", "/cars"))
+        self.assertTrue(policy.is_idempotent("POST", "/cars/batch/"))
+        self.assertFalse(policy.is_idempotent("POST", "/payment/"))
+
+    def test_next_delay(self):
+        policy = RetryPolicy(base_delay=0.1, max_delay=1.0)
+        delay = 0.0
+        for _ in range(50):
+            delay = policy.next_delay(delay)
+            self.assertGreaterEqual(delay, 0.1)
+            self.assertLessEqual(delay, 1.0)
+
+    def test_budget(self):
+        with patch("gateway_service.gateway.retry.time.monotonic", return_value=100.0) as now:
+            budget = RetryBudget(ratio=0.5, min_per_second=1.0, max_tokens=2.0)
+            self.assertTrue(budget.try_spend())
+            self.assertTrue(budget.try_spend())
+            self.assertFalse(budget.try_spend())
+            budget.deposit()
+            budget.deposit()
+            self.assertTrue(budget.try_spend())
+            self.assertFalse(budget.try_spend())
+            # Редкие вызовы: токен в секунду
+            now.return_value = 101.0
+            self.assertTrue(budget.try_spend())
+            self.assertEqual(budget.stats(), {"tokens": 0.0, "retries": 4, "denied": 2})
+
+    async def test_retries_transient_errors(self):
+        client, requests = self.client_with(503, httpx.ConnectError("down"), 200)
+        self.assertEqual((await client.get("/cars")).status_code, 200)
+        self.assertEqual(len(requests), 3)
+
+    async def test_gives_up_after_max_attempts(self):
+        client, requests = self.client_with(503, 503, 503, max_attempts=2)
+        with self.assertRaises(httpx.HTTPStatusError):
+            await client.get("/cars")
+        self.assertEqual(len(requests), 2)
+
+    async def test_unsafe_requests_are_not_retried(self):
+        client, requests = self.client_with(503, 500, 200, idempotent_routes=("/cars/batch/",))
+        with self.assertRaises(httpx.HTTPStatusError):
+            await client.post("/payment/", json={"price": 1})
+        # 500 – не временная ошибка даже для идемпотентного маршрута
+        with self.assertRaises(httpx.HTTPStatusError):
+            await client.post("/cars/batch/", json={"carUids": []})
+        self.assertEqual(len(requests), 2)
+
+    async def test_post_is_retried_when_not_sent(self):
+        client, requests = self.client_with(httpx.ConnectError("down"), 201)
+        self.assertEqual((await client.post("/payment/", json={"price": 1})).status_code, 201)
+        self.assertEqual(len(requests), 2)
+
+    async def test_budget_exhausted(self):
+        client, requests = self.client_with(503, 503, 200, budget=RetryBudget(ratio=0, min_per_second=0, max_tokens=1))
+        with self.assertRaises(httpx.HTTPStatusError):
+            await client.get("/cars")
+        self.assertEqual(len(requests), 2)
+
+    async def test_no_retries_unless_breaker_closed(self):
+        breaker = CircuitBreaker("svc", store=LocalStateStore())
+        breaker.store._states["svc"] = BreakerState(STATE_HALF_OPEN, 1, time.time())
+        client, requests = self.client_with(503, 200, breaker=breaker)
+        with self.assertRaises(httpx.HTTPStatusError):
+            await client.get("/cars")
+        self.assertEqual(len(requests), 1)
+
+    async def test_no_retry_past_deadline(self):
+        client, requests = self.client_with(503, 200, base_delay=0.5, max_delay=0.5)
+        with deadline_scope(time.time() + 0.2):
+            with self.assertRaises(httpx.HTTPStatusError):
+                await client.get("/cars")
+        self.assertEqual(len(requests), 1)
+
+
+class BulkheadTests(SimpleTestCase):
+    """Не больше max_concurrent вызовов в работе, очередь по порядку, переполнение – BulkheadFull."""
+
+    async def hold(self, bulkhead, release, entered, timeout=None):
+        async with bulkhead.slot(timeout):
+            entered.append(asyncio.current_task())
+            await release.wait()
+
+    async def test_slots_are_handed_over_in_order(self):
+        bulkhead = Bulkhead("svc", max_concurrent=2, max_queue=5, max_wait=5)
+        release, entered = asyncio.Event(), []
+        tasks = [asyncio.ensure_future(self.hold(bulkhead, release, entered)) for _ in range(4)]
+        await asyncio.sleep(0.01)
+        self.assertEqual(entered, tasks[:2])
+        self.assertEqual(bulkhead.stats(), {"max_concurrent": 2, "in_flight": 2, "queued": 2, "rejected": 0})
+        release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(entered, tasks)
+        self.assertEqual(bulkhead.stats()["in_flight"], 0)
+
+    async def test_full_queue_rejects_at_once(self):
+        bulkhead = Bulkhead("svc", max_concurrent=1, max_queue=1, max_wait=5)
+        release, entered = asyncio.Event(), []
+        tasks = [asyncio.ensure_future(self.hold(bulkhead, release, entered)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with self.assertRaises(BulkheadFull):
+            async with bulkhead.slot():
+                pass
+        release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual((bulkhead.in_flight, bulkhead.rejected), (0, 1))
+
+    async def test_wait_is_limited(self):
+        bulkhead = Bulkhead("svc", max_concurrent=1, max_queue=5, max_wait=5)
+        release, entered = asyncio.Event(), []
+        holder = asyncio.ensure_future(self.hold(bulkhead, release, entered))
+        await asyncio.sleep(0)
+        started = time.monotonic()
+        # Остаток дедлайна меньше max_wait – ждём не дольше него
+        with self.assertRaises(BulkheadFull):
+            await self.hold(bulkhead, release, entered, timeout=0.02)
+        self.assertLess(time.monotonic() - started, 1)
+        with self.assertRaises(BulkheadFull):
+            await self.hold(bulkhead, release, entered, timeout=0)
+        release.set()
+        await holder
+        self.assertEqual(bulkhead.stats(), {"max_concurrent": 1, "in_flight": 0, "queued": 0, "rejected": 2})
+
+    async def test_cancelled_waiter_does_not_leak_slot(self):
+        bulkhead = Bulkhead("svc", max_concurrent=1, max_queue=5, max_wait=5)
+        release, entered = asyncio.Event(), []
+        holder = asyncio.ensure_future(self.hold(bulkhead, release, entered))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(self.hold(bulkhead, release, entered))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        release.set()
+        await holder
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.assertEqual((bulkhead.in_flight, len(entered)), (0, 1))
+        async with bulkhead.slot():
+            self.assertEqual(bulkhead.in_flight, 1)
+
+    async def test_rejection_is_not_a_breaker_failure(self):
+        breaker = CircuitBreaker("svc", store=LocalStateStore(), failure_threshold=1,
+                                 reject_exceptions=(BulkheadFull,))
+        rejected = AsyncMock(side_effect=BulkheadFull("full"))
+        self.assertEqual(await breaker.call(rejected, fallback=lambda: "fallback"), "fallback")
+        with self.assertRaises(ServiceUnavailable):
+            await breaker.call(rejected)
+        self.assertEqual((breaker.state, breaker.failure_count), (STATE_CLOSED, 0))
+
+
+    async def test_prometheus_metrics(self):
+        bulkhead = Bulkhead("metrics-test", max_concurrent=1, max_queue=1, max_wait=5)
+        labels = {"service": "metrics-test"}
+        release, entered = asyncio.Event(), []
+        tasks = [asyncio.ensure_future(self.hold(bulkhead, release, entered)) for _ in range(2)]
+        await asyncio.sleep(0)
+        self.assertEqual(REGISTRY.get_sample_value("gateway_bulkhead_in_flight", labels), 1)
+        self.assertEqual(REGISTRY.get_sample_value("gateway_bulkhead_queued", labels), 1)
+        with self.assertRaises(BulkheadFull):
+            async with bulkhead.slot():
+                pass
+        release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(REGISTRY.get_sample_value("gateway_bulkhead_in_flight", labels), 0)
+        self.assertEqual(REGISTRY.get_sample_value("gateway_bulkhead_queued", labels), 0)
+        self.assertEqual(REGISTRY.get_sample_value("gateway_bulkhead_rejected_total", labels), 1)
+
+
+class AdaptiveLimitTests(SimpleTestCase):
+    """AIMD: лимит растёт при быстрых ответах под нагрузкой, падает при медленных и 504, сверх него – 503."""
+
+    def limiter(self, limit=10, **kwargs):
+        return AIMDLimiter(initial_limit=limit, min_limit=2, max_limit=12, target_latency=0.5, **kwargs)
+
+    def test_sheds_over_limit(self):
+        limiter = self.limiter(limit=2)
+        self.assertEqual([limiter.try_acquire() for _ in range(3)], [True, True, False])
+        limiter.release(0.1)
+        self.assertTrue(limiter.try_acquire())
+        self.assertEqual(limiter.stats(), {"limit": 2, "in_flight": 2, "accepted": 3, "shed": 1, "decreases": 0})
+
+    def test_prometheus_metrics(self):
+        limiter = self.limiter(limit=2, name="metrics-test")
+        labels = {"limiter": "metrics-test"}
+        for _ in range(3):
+            limiter.try_acquire()
+        self.assertEqual(REGISTRY.get_sample_value("gateway_adaptive_in_flight", labels), 2)
+        self.assertEqual(REGISTRY.get_sample_value("gateway_adaptive_shed_total", labels), 1)
+        limiter.release(1.0)
+        self.assertEqual(REGISTRY.get_sample_value("gateway_adaptive_limit", labels), limiter.limit)
+        self.assertEqual(REGISTRY.get_sample_value("gateway_adaptive_limit_decreases_total", labels), 1)
+        self.assertEqual(REGISTRY.get_sample_value("gateway_adaptive_in_flight", labels), 1)
+        body = self.client.get("/manage/metrics").content.decode()
+        self.assertIn('gateway_adaptive_limit{limiter="edge"}', body)
+        self.assertIn('gateway_bulkhead_in_flight{service="car"}', body)
+
+    def test_additive_increase_under_load(self):
+        limiter = self.limiter(limit=4)
+        # Загружена четверть лимита – не растёт
+        for _ in range(20):
+            limiter.try_acquire()
+            limiter.release(0.1)
+        self.assertEqual(limiter.limit, 4)
+        # Загружена половина: +1 примерно за limit быстрых ответов, не выше max_limit
+        for _ in range(200):
+            for _ in range(limiter.limit // 2 + 1):
+                limiter.try_acquire()
+            for _ in range(limiter.limit // 2 + 1):
+                limiter.release(0.1)
+        self.assertEqual(limiter.limit, 12)
+
+    def test_multiplicative_decrease_is_rate_limited(self):
+        with patch("gateway_service.gateway.adaptive_limit.time.monotonic", return_value=100.0) as now:
+            limiter = self.limiter(limit=10, backoff=0.5)
+            for _ in range(3):
+                limiter.try_acquire()
+            limiter.release(2.0)
+            # Та же волна медленных ответов – лимит не падает повторно
+            limiter.release(2.0)
+            self.assertEqual((limiter.limit, limiter.decreases), (5, 1))
+            now.return_value = 100.6
+            limiter.release(0.1, overloaded=True)
+            self.assertEqual((limiter.limit, limiter.decreases), (2, 2))
+            for second in range(3):
+                now.return_value = 102.0 + second
+                limiter.try_acquire()
+                limiter.release(2.0)
+            self.assertEqual(limiter.limit, 2)
+
+    async def test_middleware(self):
+        limiter = self.limiter(limit=2)
+        responses = {"/api/v1/cars": HttpResponse(), "/api/v1/rental": HttpResponse(status=504)}
+
+        async def get_response(request):
+            return responses.get(request.path, HttpResponse())
+
+        factory = RequestFactory()
+        with patch("gateway_service.gateway.middleware.edge_limiter", limiter):
+            middleware = AdaptiveConcurrencyMiddleware(get_response)
+            self.assertEqual((await middleware(factory.get("/api/v1/rental"))).status_code, 504)
+            self.assertEqual((limiter.limit, limiter.in_flight), (2, 0))
+            self.assertEqual(limiter.decreases, 1)
+
+            limiter.try_acquire()
+            limiter.try_acquire()
+            response = await middleware(factory.get("/api/v1/cars"))
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response["Retry-After"], middleware.retry_after)
+            # Служебные ручки не ограничиваются
+            self.assertEqual((await middleware(factory.get("/manage/health"))).status_code, 200)
+            self.assertEqual(limiter.stats()["shed"], 1)
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Прогрев пула при старте воркера, счётчики соединений и закрытие клиента прежнего loop."""
+
+    @staticmethod
+    async def handle(reader, writer):
+        # keep-alive: отвечаем на каждый запрос, пока клиент не закроет соединение
+        try:
+            while await reader.readuntil(b"\r\n\r\n"):
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    async def with_server(self, test):
+        server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        client = clients.ServiceClient("svc", f"http://127.0.0.1:{port}/api/v1", coalesce=False,
+                                       pool=PoolConfig(max_keepalive_connections=5, warmup_connections=3))
+        try:
+            await test(client)
+        finally:
+            await client.aclose()
+            server.close()
+
+    async def test_warm_up_opens_connections(self):
+        async def test(client):
+            await client.warm_up()
+            self.assertEqual(client.pool_stats.snapshot(), {"in_use": 0, "idle": 3, "created": 3, "discarded": 0})
+            # Запрос идёт по уже открытому соединению
+            await client.get("/cars")
+            self.assertEqual(client.pool_stats.snapshot()["created"], 3)
+
+        await self.with_server(test)
+
+    async def test_requests_count_new_connections(self):
+        async def test(client):
+            await asyncio.gather(*(client.get("/cars") for _ in range(2)))
+            snapshot = client.pool_stats.snapshot()
+            self.assertEqual((snapshot["created"], snapshot["idle"]), (2, 2))
+
+        await self.with_server(test)
+
+    async def test_client_of_other_running_loop_is_closed(self):
+        client = clients.ServiceClient("svc", "http://127.0.0.1:1/api/v1", coalesce=False)
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        try:
+            async def get_client():
+                return client.client
+
+            old = asyncio.run_coroutine_threadsafe(get_client(), loop).result(timeout=1)
+            self.assertIsNot(client.client, old)
+            for _ in range(50):
+                if old.is_closed:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertTrue(old.is_closed)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=1)
+            loop.close()
+            await client.aclose()
+
+
+class LifespanTests(SimpleTestCase):
+    """ASGI lifespan: прогрев пулов при старте воркера и закрытие при остановке."""
+
+    async def test_startup_and_shutdown(self):
+        from .. import asgi
+
+        messages = iter([{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}])
+        sent = []
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        with patch.object(asgi, "warm_up_clients", AsyncMock()) as warm_up, \
+                patch.object(asgi, "close_clients", AsyncMock()) as close:
+            await asgi.application({"type": "lifespan"}, receive, send)
+        warm_up.assert_awaited_once()
+        close.assert_awaited_once()
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+
+
+class MetricsTests(MetricsEndpointTestsMixin, SimpleTestCase):
+    """/manage/metrics сервиса: гистограмма запросов и multiprocess-режим."""
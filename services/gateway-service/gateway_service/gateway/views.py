@@ -1,270 +1,443 @@
-from rest_framework.views import APIView
-from rest_framework.response import Response
+import asyncio
+from datetime import date
+from typing import Any
+
+from django.http import HttpResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
+from service_common.json_codec import dumps, loads
+
 from . import clients
 from .circuit_breaker import ServiceUnavailable
+from .composition import Call, Composition, CompositionError
+from .deadline import DeadlineExceeded, detached
+from .fallback_cache import STALE_KEY
+from .middleware import edge_limiter
 from .task_queue import enqueue_task
 
 
-class CarsView(APIView):
-    def get(self, request):
-        show_all = request.query_params.get("showAll") == "true"
-        page = int(request.query_params.get("page", 0))
-        size = int(request.query_params.get("size", 10))
+def json_response(data: Any = None, status: int = status.HTTP_200_OK) -> HttpResponse:
+    if data is None:
+        return HttpResponse(status=status)
+    return HttpResponse(dumps(data), status=status, content_type="application/json")
+
+
+class AsyncAPIView(View):
+    """
+    Базовый асинхронный view: обработчики – корутины, поэтому Django не гоняет их
+    через thread-sensitive executor. Тело запроса разбирается как JSON в request.data,
+    CSRF отключён, как и в APIView. Исчерпанный дедлайн запроса отдаётся как 504.
+    """
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.data = loads(request.body) if request.body else {}
+        except ValueError:
+            return json_response({"message": "Malformed JSON"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except DeadlineExceeded:
+            return json_response({"message": "Request deadline exceeded"}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+
+
+def _car_block(car: dict) -> dict:
+    car_block = {"carUid": car["carUid"]}
+    if "brand" in car:
+        car_block.update({
+            "brand": car["brand"],
+            "model": car["model"],
+            "registrationNumber": car["registrationNumber"],
+        })
+    if car.get(STALE_KEY):
+        car_block[STALE_KEY] = True
+    return car_block
+
+
+def _payment_block(payment: dict) -> dict:
+    payment_block = {"paymentUid": payment["paymentUid"]}
+    if "status" in payment:
+        payment_block.update({
+            "status": payment["status"],
+            "price": payment["price"],
+        })
+    if payment.get(STALE_KEY):
+        payment_block[STALE_KEY] = True
+    return payment_block
+
+
+def _rental_response(rental: dict, car: dict, payment: dict) -> dict:
+    return {
+        "rentalUid": rental["rentalUid"],
+        "status": rental["status"],
+        "dateFrom": rental["dateFrom"],
+        "dateTo": rental["dateTo"],
+        "car": _car_block(car),
+        "payment": _payment_block(payment),
+    }
+
+
+def rental_list_composition(username: str, params: dict[str, str]) -> Composition:
+    """Страница аренд: после rental-service авто и оплаты только этой страницы грузятся параллельно."""
+    return Composition(
+        Call("rentals", lambda: clients.get_rentals(username, params)),
+        Call("cars",
+             lambda rentals: clients.get_cars_by_uids([r["carUid"] for r in rentals["items"]]),
+             depends_on=("rentals",),
+             fallback=lambda rentals: {r["carUid"]: {"carUid": r["carUid"]} for r in rentals["items"]}),
+        Call("payments",
+             lambda rentals: clients.get_payments_by_uids([r["paymentUid"] for r in rentals["items"]]),
+             depends_on=("rentals",),
+             fallback=lambda rentals: {r["paymentUid"]: {"paymentUid": r["paymentUid"]} for r in rentals["items"]}),
+        assemble=lambda rentals, cars, payments: {
+            "items": [
+                _rental_response(r, cars[r["carUid"]], payments[r["paymentUid"]])
+                for r in rentals["items"]
+            ],
+            "nextCursor": rentals["nextCursor"],
+        },
+    )
+
+
+RENTAL_LIST_PARAMS = ("cursor", "limit", "status", "dateFrom", "dateTo")
+RENTAL_STATUSES = ("IN_PROGRESS", "FINISHED", "CANCELED")
+RENTAL_MAX_LIMIT = 100
+
+
+def _rental_list_params(query) -> dict[str, str]:
+    """
+    Параметры страницы аренд для rental-service. Проверяются здесь же: 400 от сервиса
+    breaker посчитал бы сбоем, а ошибка в запросе клиента – не сбой сервиса.
+    """
+    params = {name: query[name] for name in RENTAL_LIST_PARAMS if query.get(name)}
+    if "limit" in params and not (params["limit"].isdigit() and 1 <= int(params["limit"]) <= RENTAL_MAX_LIMIT):
+        raise ValueError(f"limit must be between 1 and {RENTAL_MAX_LIMIT}")
+    if "status" in params and params["status"] not in RENTAL_STATUSES:
+        raise ValueError(f"status must be one of {', '.join(RENTAL_STATUSES)}")
+    for name in ("dateFrom", "dateTo"):
+        if name in params:
+            date.fromisoformat(params[name])
+    return params
+
+
+def rental_detail_composition(username: str, rental_uid: str) -> Composition:
+    """Одна аренда: авто и оплата – независимые некритичные вызовы, идут параллельно."""
+    return Composition(
+        Call("rental", lambda: clients.get_rental(username, rental_uid)),
+        Call("car",
+             lambda rental: clients.get_car(rental["carUid"], allow_fallback=True),
+             depends_on=("rental",),
+             fallback=lambda rental: {"carUid": rental["carUid"]}),
+        Call("payment",
+             lambda rental: clients.get_payment(rental["paymentUid"], allow_fallback=True),
+             depends_on=("rental",),
+             fallback=lambda rental: {"paymentUid": rental["paymentUid"]}),
+        assemble=_rental_response,
+    )
+
+
+def rental_create_composition(username: str, car_uid: str, date_from: str, date_to: str) -> Composition:
+    """
+    Оформление аренды: чтение авто и резерв идут параллельно,
+    оплата – после них (нужна цена и успешный резерв), запись аренды – последней.
+    """
+    days = (date.fromisoformat(date_to) - date.fromisoformat(date_from)).days
+
+    return Composition(
+        Call("car", lambda: clients.get_car(car_uid)),
+        Call("reserve", lambda: clients.reserve_car(car_uid)),
+        Call("payment",
+             lambda car, reserve: clients.create_payment(car["price"] * days),
+             depends_on=("car", "reserve")),
+        Call("rental",
+             lambda reserve, payment: clients.create_rental(
+                 username, car_uid, payment["paymentUid"], date_from, date_to),
+             depends_on=("reserve", "payment")),
+    )
+
+
+def rental_create_by_criteria_composition(username: str, criteria: dict[str, Any],
+                                          date_from: str, date_to: str) -> Composition:
+    """
+    Оформление аренды по критериям: car-service одним вызовом выбирает и резервирует
+    свободное авто (его цена нужна оплате), запись аренды – последней.
+    """
+    days = (date.fromisoformat(date_to) - date.fromisoformat(date_from)).days
+
+    return Composition(
+        Call("reserve", lambda: clients.reserve_any_car(criteria)),
+        Call("payment",
+             lambda reserve: clients.create_payment(reserve["price"] * days),
+             depends_on=("reserve",)),
+        Call("rental",
+             lambda reserve, payment: clients.create_rental(
+                 username, reserve["carUid"], payment["paymentUid"], date_from, date_to),
+             depends_on=("reserve", "payment")),
+    )
+
+
+# Критерии выбора авто для POST /api/v1/rental без carUid
+CAR_CRITERIA = ("type", "brand", "maxPrice", "minPower")
+
+
+# Сообщения об ошибке по шагу, на котором упало оформление аренды
+RENTAL_CREATE_ERRORS = {
+    "car": "Car Service is unavailable or car not found",
+    "reserve": "Failed to reserve car",
+    "payment": "Payment Service unavailable",
+    "rental": "Failed to create rental",
+}
+
+
+def manage_stats(request):
+    """GET /manage/stats – служебные счётчики шлюза: адаптивный лимит процесса и нижележащие сервисы."""
+    return json_response({"edge": edge_limiter.stats(), **clients.stats()})
+
+
+class CarsView(AsyncAPIView):
+    async def get(self, request):
+        show_all = request.GET.get("showAll") == "true"
+        page = int(request.GET.get("page", 0))
+        size = int(request.GET.get("size", 10))
+        cursor = request.GET.get("cursor")
 
         try:
-            cars = clients.get_cars(show_all, page, size)
+            cars = await clients.get_cars(show_all, page, size, cursor)
         except ServiceUnavailable:
             # Car Service критичен
-            return Response(
+            return json_response(
                 {"message": "Car Service is unavailable"},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
+        except DeadlineExceeded:
+            raise
         except Exception:
-            return Response(
+            return json_response(
                 {"message": "Failed to load cars"},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
 
-        return Response(cars)
+        return json_response(cars)
 
 
-class RentalListView(APIView):
-    def get(self, request):
+class RentalListView(AsyncAPIView):
+    async def get(self, request):
         username = request.headers.get("X-User-Name")
+        try:
+            params = _rental_list_params(request.GET)
+        except ValueError as exc:
+            return json_response({"message": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            rentals = clients.get_rentals(username)
-        except ServiceUnavailable:
-            return Response(
-                {"message": "Rental Service is unavailable"},
-                status=status.HTTP_503_SERVICE_UNAVAILABLE
-            )
-        except Exception:
-            return Response(
+            page = await rental_list_composition(username, params).run()
+        except CompositionError as exc:
+            if isinstance(exc.error, DeadlineExceeded):
+                raise exc.error
+            if isinstance(exc.error, ServiceUnavailable):
+                return json_response(
+                    {"message": "Rental Service is unavailable"},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE
+                )
+            return json_response(
                 {"message": "Failed to load rentals"},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
 
-        enriched = []
-        for r in rentals:
-            car = clients.get_car(r["carUid"], allow_fallback=True)
-            payment = clients.get_payment(r["paymentUid"], allow_fallback=True)
-
-            car_block = {"carUid": car["carUid"]}
-            if "brand" in car:
-                car_block.update({
-                    "brand": car["brand"],
-                    "model": car["model"],
-                    "registrationNumber": car["registrationNumber"],
-                })
-
-            payment_block = {"paymentUid": payment["paymentUid"]}
-            if "status" in payment:
-                payment_block.update({
-                    "status": payment["status"],
-                    "price": payment["price"],
-                })
-
-            enriched.append({
-                "rentalUid": r["rentalUid"],
-                "status": r["status"],
-                "dateFrom": r["dateFrom"],
-                "dateTo": r["dateTo"],
-                "car": car_block,
-                "payment": payment_block,
-            })
-        return Response(enriched)
-
-    def post(self, request):
+        response = json_response(page["items"])
+        if page["nextCursor"]:
+            response[clients.NEXT_CURSOR_HEADER] = page["nextCursor"]
+        return response
+
+    async def post(self, request):
+        """
+        Оформление аренды: {"carUid", "dateFrom", "dateTo"} – конкретное авто,
+        {"carCriteria": {"type", "brand", "maxPrice", "minPower"}, ...} вместо carUid –
+        любое свободное авто по критериям (409, если такого нет).
+        """
         username = request.headers.get("X-User-Name")
 
-        car_uid = request.data["carUid"]
+        car_uid = request.data.get("carUid")
+        criteria = request.data.get("carCriteria")
         date_from = request.data["dateFrom"]
         date_to = request.data["dateTo"]
 
-        # 1. Проверяем авто (критично, без фолбэка)
-        try:
-            car = clients.get_car(car_uid)
-        except Exception:
-            return Response(
-                {"message": "Car Service is unavailable or car not found"},
-                status=status.HTTP_503_SERVICE_UNAVAILABLE
-            )
-
-        price_per_day = car["price"]
-
-        from datetime import date
-        d1, d2 = date.fromisoformat(date_from), date.fromisoformat(date_to)
-        total_days = (d2 - d1).days
-        total_price = price_per_day * total_days
+        if car_uid:
+            composition = rental_create_composition(username, car_uid, date_from, date_to)
+        elif isinstance(criteria, dict):
+            criteria = {key: criteria[key] for key in CAR_CRITERIA if criteria.get(key) is not None}
+            composition = rental_create_by_criteria_composition(username, criteria, date_from, date_to)
+        else:
+            return json_response({"message": "carUid or carCriteria is required"},
+                                 status=status.HTTP_400_BAD_REQUEST)
 
-        # 2. Резервируем автомобиль
         try:
-            clients.reserve_car(car_uid)
-        except Exception:
-            return Response(
-                {"message": "Failed to reserve car"},
-                status=status.HTTP_503_SERVICE_UNAVAILABLE
-            )
-
-        # 3. Создаём оплату
-        try:
-            payment = clients.create_payment(total_price)
-            payment_uid = payment['paymentUid']
-        except Exception:
-            try:
-                # снимаем резерв авто
-                clients.release_car(car_uid)
-            except Exception:
-                pass
-
-            return Response(
-                {"message": "Payment Service unavailable"},
-                status=status.HTTP_503_SERVICE_UNAVAILABLE
-            )
-
-        try:
-            # 4. Создаём запись аренды
-            rental = clients.create_rental(username, car_uid, payment_uid, date_from, date_to)
-            rental_uid = rental["rentalUid"]
-        except Exception:
-            try:
-                # снимаем резерв авто
-                clients.release_car(car_uid)
-            except Exception:
-                pass
-            try:
-                # отменяем оплату
-                clients.cancel_payment(payment_uid)
-            except Exception:
-                pass
-
-            return Response(
-                {"message": "Failed to create rental"},
+            results = await composition.run()
+        except CompositionError as exc:
+            # Компенсации: откатываем только то, что успело выполниться,
+            # даже если бюджет запроса уже исчерпан
+            with detached():
+                if "reserve" in exc.results:
+                    try:
+                        # снимаем резерв авто (при выборе по критериям uid знает только ответ резерва)
+                        await clients.release_car(car_uid or exc.results["reserve"]["carUid"])
+                    except Exception:
+                        pass
+                if "payment" in exc.results:
+                    try:
+                        # отменяем оплату
+                        await clients.cancel_payment(exc.results["payment"]["paymentUid"])
+                    except Exception:
+                        pass
+
+            if isinstance(exc.error, DeadlineExceeded):
+                raise exc.error
+            if isinstance(exc.error, clients.NoCarAvailable):
+                return json_response({"message": str(exc.error)}, status=status.HTTP_409_CONFLICT)
+
+            return json_response(
+                {"message": RENTAL_CREATE_ERRORS[exc.failed]},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
 
         # если всё прошло успешно:
-        return Response({
-            "rentalUid": rental_uid,
+        rental = results["rental"]
+        return json_response({
+            "rentalUid": rental["rentalUid"],
             "status": rental["status"],
-            "carUid": car_uid,
+            "carUid": car_uid or results["reserve"]["carUid"],
             "dateFrom": date_from,
             "dateTo": date_to,
-            "payment": payment
+            "payment": results["payment"]
         }, status=status.HTTP_200_OK)
 
 
-class RentalDetailView(APIView):
+class RentalDetailView(AsyncAPIView):
     """GET/DELETE /api/v1/rental/{rentalUid}"""
 
-    def get(self, request, rentalUid):
+    async def get(self, request, rentalUid):
         username = request.headers.get("X-User-Name")
 
         try:
-            r = clients.get_rental(username, str(rentalUid))
-        except ServiceUnavailable:
-            return Response(
-                {"message": "Rental Service is unavailable"},
-                status=status.HTTP_503_SERVICE_UNAVAILABLE
-            )
-        except Exception:
-            return Response(
+            rental = await rental_detail_composition(username, str(rentalUid)).run()
+        except CompositionError as exc:
+            if isinstance(exc.error, DeadlineExceeded):
+                raise exc.error
+            if isinstance(exc.error, clients.RentalNotFound):
+                return json_response({"message": "Rental not found"}, status=status.HTTP_404_NOT_FOUND)
+            if isinstance(exc.error, ServiceUnavailable):
+                return json_response(
+                    {"message": "Rental Service is unavailable"},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE
+                )
+            return json_response(
                 {"message": "Failed to load rental"},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
 
-        car = clients.get_car(r["carUid"], allow_fallback=True)
-        payment = clients.get_payment(r["paymentUid"], allow_fallback=True)
-
-        car_block = {"carUid": car["carUid"]}
-        if "brand" in car:
-            car_block.update({
-                "brand": car["brand"],
-                "model": car["model"],
-                "registrationNumber": car["registrationNumber"],
-            })
-
-        payment_block = {"paymentUid": payment["paymentUid"]}
-        if "status" in payment:
-            payment_block.update({
-                "status": payment["status"],
-                "price": payment["price"],
-            })
-
-        return Response({
-            "rentalUid": r["rentalUid"],
-            "status": r["status"],
-            "dateFrom": r["dateFrom"],
-            "dateTo": r["dateTo"],
-            "car": car_block,
-            "payment": payment_block
-        })
+        return json_response(rental)
 
-    def delete(self, request, rentalUid):
-        """Отмена аренды: release car + cancel rental + cancel payment (часть – через очередь)"""
+    async def delete(self, request, rentalUid):
+        """
+        Отмена аренды: release car + cancel rental + cancel payment (часть – через очередь).
+        Оплата отменяется только после отмены аренды: если аренду успели завершить (409),
+        деньги за неё не возвращаются.
+        """
         username = request.headers.get("X-User-Name")
 
         # 1. Читаем аренду (критично)
         try:
-            r = clients.get_rental(username, str(rentalUid))
+            r = await clients.get_rental(username, str(rentalUid))
+        except clients.RentalNotFound:
+            return json_response({"message": "Rental not found"}, status=status.HTTP_404_NOT_FOUND)
         except Exception:
-            return Response(
+            return json_response(
                 {"message": "Failed to load rental"},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
 
+        # Повторная отмена – 204 без побочных эффектов, отмена завершённой – 409
+        if r["status"] == "CANCELED":
+            return json_response(status=status.HTTP_204_NO_CONTENT)
+        if r["status"] != "IN_PROGRESS":
+            return json_response({"message": f"Rental in status {r['status']} cannot be canceled"},
+                                 status=status.HTTP_409_CONFLICT)
+
         # 2. Снимаем резерв с автомобиля
         try:
-            clients.release_car(r["carUid"])
+            await clients.release_car(r["carUid"])
         except Exception:
-            return Response(
+            return json_response(
                 {"message": "Failed to release car"},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
 
-        # 3. Cancel rental – если не получилось, ставим в очередь
+        # 3. Cancel rental – если не получилось, ставим в очередь вместе с отменой оплаты:
+        # воркер отменит оплату только после аренды
         try:
-            clients.cancel_rental(username, str(rentalUid))
+            await clients.cancel_rental(username, str(rentalUid))
+        except clients.RentalStateConflict as exc:
+            # Аренду успели завершить параллельно – отмена не состоялась, оплату не трогаем
+            return json_response({"message": str(exc)}, status=status.HTTP_409_CONFLICT)
+        except clients.RentalNotFound:
+            return json_response({"message": "Rental not found"}, status=status.HTTP_404_NOT_FOUND)
         except Exception:
-            enqueue_task("cancel_rental", {
+            await asyncio.to_thread(enqueue_task, "cancel_rental", {
                 "username": username,
                 "rentalUid": str(rentalUid),
+                "paymentUid": r["paymentUid"],
             })
+            return json_response(status=status.HTTP_204_NO_CONTENT)
 
-        # 4. Cancel payment – аналогично
+        # 4. Cancel payment – если не получилось, ставим в очередь
         try:
-            clients.cancel_payment(r["paymentUid"])
+            await clients.cancel_payment(r["paymentUid"])
         except Exception:
-            enqueue_task("cancel_payment", {
+            await asyncio.to_thread(enqueue_task, "cancel_payment", {
                 "paymentUid": r["paymentUid"],
             })
 
         # Пользователь всегда видит "успешно"
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return json_response(status=status.HTTP_204_NO_CONTENT)
 
 
-class RentalFinishView(APIView):
+class RentalFinishView(AsyncAPIView):
     """POST /api/v1/rental/{rentalUid}/finish"""
 
-    def post(self, request, rentalUid):
+    async def post(self, request, rentalUid):
         username = request.headers.get("X-User-Name")
         try:
-            r = clients.get_rental(username, str(rentalUid))
+            r = await clients.get_rental(username, str(rentalUid))
+        except clients.RentalNotFound:
+            return json_response({"message": "Rental not found"}, status=status.HTTP_404_NOT_FOUND)
         except Exception:
-            return Response(
+            return json_response(
                 {"message": "Failed to load rental"},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
 
+        # Повторное завершение – 204 без побочных эффектов, завершение отменённой – 409
+        if r["status"] == "FINISHED":
+            return json_response(status=status.HTTP_204_NO_CONTENT)
+        if r["status"] != "IN_PROGRESS":
+            return json_response({"message": f"Rental in status {r['status']} cannot be finished"},
+                                 status=status.HTTP_409_CONFLICT)
+
         try:
-            clients.release_car(r["carUid"])
-            clients.finish_rental(username, str(rentalUid))
+            await clients.release_car(r["carUid"])
+            await clients.finish_rental(username, str(rentalUid))
+        except clients.RentalStateConflict as exc:
+            return json_response({"message": str(exc)}, status=status.HTTP_409_CONFLICT)
+        except clients.RentalNotFound:
+            return json_response({"message": "Rental not found"}, status=status.HTTP_404_NOT_FOUND)
         except Exception:
-            return Response(
+            return json_response(
                 {"message": "Failed to finish rental"},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
 
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return json_response(status=status.HTTP_204_NO_CONTENT)
@@ -18,6 +18,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 import os
 from dotenv import load_dotenv
 
+from service_common.log_pipeline import build_logging
+
 load_dotenv()
 SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
 MODE = os.environ['MODE']
@@ -27,7 +29,91 @@ CAR_SERVICE_URL = os.getenv("CAR_SERVICE_URL", "http://car-service:8000/api/v1")
 RENTAL_SERVICE_URL = os.getenv("RENTAL_SERVICE_URL", "http://rental-service:8000/api/v1")
 PAYMENT_SERVICE_URL = os.getenv("PAYMENT_SERVICE_URL", "http://payment-service:8000/api/v1")
 
+
+def _http_pool(prefix: str) -> dict:
+    """
+    Пул соединений к нижележащему сервису: общие HTTP_POOL_* и переопределения
+    <prefix>_POOL_* для конкретного сервиса. Лимиты – на один воркер gunicorn,
+    итого к сервису до WEB_CONCURRENCY * MAX_CONNECTIONS соединений.
+    """
+    def env(name: str, default: str) -> str:
+        return os.environ.get(f"{prefix}_POOL_{name}", os.environ.get(f"HTTP_POOL_{name}", default))
+
+    return {
+        "max_connections": int(env("MAX_CONNECTIONS", "100")),
+        "max_keepalive_connections": int(env("MAX_KEEPALIVE", "20")),
+        "keepalive_expiry": float(env("KEEPALIVE_EXPIRY", "30")),
+        "warmup_connections": int(env("WARMUP", "4")),
+    }
+
+
+HTTP_POOLS = {
+    "car": _http_pool("CAR_SERVICE"),
+    "rental": _http_pool("RENTAL_SERVICE"),
+    "payment": _http_pool("PAYMENT_SERVICE"),
+}
+
+
+def _bulkhead(prefix: str) -> dict:
+    """
+    Bulkhead сервиса: общие BULKHEAD_* и переопределения <prefix>_BULKHEAD_*.
+    MAX_CONCURRENT=0 – без ограничения; MAX_WAIT – сколько секунд вызов ждёт в очереди.
+    """
+    def env(name: str, default: str) -> str:
+        return os.environ.get(f"{prefix}_BULKHEAD_{name}", os.environ.get(f"BULKHEAD_{name}", default))
+
+    return {
+        "max_concurrent": int(env("MAX_CONCURRENT", "50")),
+        "max_queue": int(env("MAX_QUEUE", "50")),
+        "max_wait": float(env("MAX_WAIT", "1")),
+    }
+
+
+BULKHEADS = {
+    "car": _bulkhead("CAR_SERVICE"),
+    "rental": _bulkhead("RENTAL_SERVICE"),
+    "payment": _bulkhead("PAYMENT_SERVICE"),
+}
+
+# Бюджет времени на запрос к шлюзу (0 – без дедлайна) и таймауты одного вызова сервиса
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", "10"))
+DOWNSTREAM_CONNECT_TIMEOUT = float(os.environ.get("DOWNSTREAM_CONNECT_TIMEOUT", "1"))
+DOWNSTREAM_READ_TIMEOUT = float(os.environ.get("DOWNSTREAM_READ_TIMEOUT", "5"))
+
+# Хеджирование чтений: второй запрос после HEDGE_PERCENTILE перцентиля задержки маршрута,
+# не больше HEDGE_BUDGET_RATIO дополнительных запросов (0 – выключить)
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "95"))
+HEDGE_BUDGET_RATIO = float(os.environ.get("HEDGE_BUDGET_RATIO", "0.1"))
+
+# Повторы временных ошибок: всего попыток (1 – без повторов), границы паузы в секундах
+# и доля повторов от обычных вызовов в бюджете
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", "0.05"))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", "1.0"))
+RETRY_BUDGET_RATIO = float(os.environ.get("RETRY_BUDGET_RATIO", "0.2"))
+
+# Адаптивный лимит одновременных запросов на воркер (AIMD по задержке) и сброс нагрузки сверх него
+ADAPTIVE_LIMIT_ENABLED = os.environ.get("ADAPTIVE_LIMIT_ENABLED", "true") == "true"
+ADAPTIVE_LIMIT_INITIAL = int(os.environ.get("ADAPTIVE_LIMIT_INITIAL", "20"))
+ADAPTIVE_LIMIT_MIN = int(os.environ.get("ADAPTIVE_LIMIT_MIN", "5"))
+ADAPTIVE_LIMIT_MAX = int(os.environ.get("ADAPTIVE_LIMIT_MAX", "200"))
+ADAPTIVE_LIMIT_TARGET_LATENCY = float(os.environ.get("ADAPTIVE_LIMIT_TARGET_LATENCY", "0.5"))
+ADAPTIVE_LIMIT_RETRY_AFTER = int(os.environ.get("ADAPTIVE_LIMIT_RETRY_AFTER", "1"))
+
 REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+# Таймауты Redis (секунды): очередь задач и метрики; таймаут чтения больше ожидания BLPOP воркера
+REDIS_CONNECT_TIMEOUT = float(os.environ.get("REDIS_CONNECT_TIMEOUT", "1"))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get("REDIS_SOCKET_TIMEOUT", "5"))
+# Где хранить состояние circuit breaker'ов: redis (общее для всех воркеров) | memory
+CIRCUIT_BREAKER_STORE = os.environ.get("CIRCUIT_BREAKER_STORE", "redis")
+# Таймаут обращений breaker'ов к Redis: дольше – считаем Redis недоступным и работаем локально
+CIRCUIT_BREAKER_REDIS_TIMEOUT = float(os.environ.get("CIRCUIT_BREAKER_REDIS_TIMEOUT", "0.2"))
+# Кеш последних известных авто/оплат для фолбэков (0 – выключить)
+FALLBACK_CACHE_SIZE = int(os.environ.get("FALLBACK_CACHE_SIZE", "10000"))
+FALLBACK_CACHE_TTL = int(os.environ.get("FALLBACK_CACHE_TTL", "3600"))
+# Фоновое обновление объекта из фолбэка – не раньше чем через столько секунд
+# после неудачного чтения и не чаще раза за этот интервал на объект
+FALLBACK_REFRESH_DELAY = float(os.environ.get("FALLBACK_REFRESH_DELAY", "5"))
 
 # Если запускаем локально, то соответствующий хост
 if MODE == 'local':
@@ -49,37 +135,24 @@ DATABASES = {
     }
 }
 
-LOGGING = {
-    "version": 1,
-    "disable_existing_loggers": False,
-
-    "formatters": {
-        "standard": {
-            "format": "[%(asctime)s] %(levelname)s %(name)s: %(message)s",
-        },
-    },
-
-    "handlers": {
-        "console": {
-            "class": "logging.StreamHandler",
-            "formatter": "standard",
-        }
+# Структурированные логи через очередь; успешные вызовы сэмплируются по маршруту
+# (LOG_SAMPLE_RATES="/cars:0.01,/payment:0.1"), ошибки и медленные вызовы пишутся всегда
+LOGGING = build_logging(
+    loggers={
+        "django": "INFO",
+        "gateway_service.gateway": "INFO",
     },
-
-    "loggers": {
-        "django": {
-            "handlers": ["console"],
-            "level": "INFO",
-            "propagate": True,
-        },
-
-        "gateway_service.gateway": {
-            "handlers": ["console"],
-            "level": "INFO",
-            "propagate": False,
-        },
-    },
-}
+    sample_rates=os.environ.get("LOG_SAMPLE_RATES", ""),
+    default_rate=float(os.environ.get("LOG_DEFAULT_SAMPLE_RATE", "1.0")),
+    slow_ms=float(os.environ.get("LOG_SLOW_MS", "1000")),
+)
+
+# Трассировка: контекст идёт между сервисами в заголовке traceparent,
+# готовые спаны пишет TRACING_EXPORTER (none | memory | file | dotted path)
+TRACING_SERVICE_NAME = "gateway-service"
+TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER", "none")
+TRACING_FILE = os.environ.get("TRACING_FILE", "/tmp/traces.jsonl")
+TRACING_MEMORY_SIZE = int(os.environ.get("TRACING_MEMORY_SIZE", "10000"))
 
 # --------------------------------------------------------------------------
 
@@ -105,10 +178,17 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny'
     ],
+    # JSON через orjson (см. service_common/json_codec.py)
+    "DEFAULT_RENDERER_CLASSES": ["service_common.json_codec.FastJSONRenderer"],
+    "DEFAULT_PARSER_CLASSES": ["service_common.json_codec.FastJSONParser"],
 }
 
 MIDDLEWARE = [
+    'service_common.metrics.metrics_middleware',
+    'service_common.tracing.tracing_middleware',
+    'gateway_service.gateway.middleware.AdaptiveConcurrencyMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'gateway_service.gateway.middleware.DeadlineMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
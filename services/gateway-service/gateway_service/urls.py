@@ -17,8 +17,9 @@ Including another URLconf
 from django.contrib import admin
 from django.http import JsonResponse
 from django.urls import path
+from service_common.metrics import metrics_view
 
-from .gateway.views import CarsView, RentalListView, RentalDetailView, RentalFinishView
+from .gateway.views import CarsView, RentalListView, RentalDetailView, RentalFinishView, manage_stats
 
 
 def health_check(request):
@@ -31,4 +32,6 @@ urlpatterns = [
     path("api/v1/rental/<uuid:rentalUid>", RentalDetailView.as_view()),
     path("api/v1/rental/<uuid:rentalUid>/finish", RentalFinishView.as_view()),
     path('manage/health', health_check, name='health-check'),
+    path('manage/metrics', metrics_view, name='metrics'),
+    path('manage/stats', manage_stats, name='manage-stats'),
 ]
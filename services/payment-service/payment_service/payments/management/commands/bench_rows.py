@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...models import Payment
+from ...serializers import PaymentSerializer, payment_rows
+
+
+class Command(BaseCommand):
+    help = "Пакетное чтение оплат: PaymentSerializer против payment_rows (values_list) – время на пакет"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100, help="оплат в пакете")
+        parser.add_argument("--repeat", type=int, default=200, help="сколько раз собрать пакет")
+
+    def handle(self, *args, rows, repeat, **options):
+        # Тестовые оплаты живут только внутри транзакции и откатываются в конце
+        with transaction.atomic():
+            payments = Payment.objects.bulk_create(Payment(price=10500) for _ in range(rows))
+            queryset = Payment.objects.filter(id__gte=payments[0].id).order_by("id")[:rows]
+
+            serializer = self._measure(lambda: PaymentSerializer(queryset.all(), many=True).data, repeat)
+            mapper = self._measure(lambda: payment_rows.rows(payment_rows.values_list(queryset.all())), repeat)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"  serializer: {serializer * 1e3:8.3f} мс на пакет из {rows}")
+        self.stdout.write(f"payment_rows: {mapper * 1e3:8.3f} мс на пакет из {rows}")
+        self.stdout.write(f"ускорение: x{serializer / mapper:.1f}")
+
+    @staticmethod
+    def _measure(func, repeat: int) -> float:
+        func()  # прогрев
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - started) / repeat
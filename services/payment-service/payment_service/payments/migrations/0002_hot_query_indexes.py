@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:17
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='payment',
+            name='payment_payment_30844c_idx',
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='payment_uid',
+            field=models.UUIDField(default=uuid.uuid4, unique=True),
+        ),
+    ]
@@ -9,14 +9,19 @@ class Payment(models.Model):
         CANCELED = "CANCELED", "Canceled"
 
     id = models.AutoField(primary_key=True)
-    payment_uid = models.UUIDField(default=uuid.uuid4, unique=True, db_index=True)
+    payment_uid = models.UUIDField(default=uuid.uuid4, unique=True)
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.PAID)
     price = models.IntegerField()
 
+    # Разрешённые переходы: целевой статус -> из каких статусов в него можно перейти
+    TRANSITIONS = {
+        Status.CANCELED: (Status.PAID,),
+    }
+
     class Meta:
         db_table = "payment"
+        # Поиск по payment_uid идёт по индексу unique-ограничения, отдельный не нужен
         indexes = [
-            models.Index(fields=["payment_uid"]),
             models.Index(fields=["status"]),
         ]
 
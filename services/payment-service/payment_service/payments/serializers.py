@@ -1,4 +1,6 @@
 from rest_framework import serializers
+
+from ..field_mapper import FieldMapper
 from .models import Payment
 
 
@@ -6,6 +8,10 @@ class CreatePaymentRequestSerializer(serializers.Serializer):
     price = serializers.IntegerField(min_value=0)
 
 
+class PaymentBatchRequestSerializer(serializers.Serializer):
+    paymentUids = serializers.ListField(child=serializers.UUIDField(), allow_empty=True, max_length=500)
+
+
 class PaymentSerializer(serializers.ModelSerializer):
     paymentUid = serializers.UUIDField(source="payment_uid", read_only=True)
     status = serializers.ChoiceField(choices=Payment.Status.choices, read_only=True)
@@ -14,3 +20,7 @@ class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = ["paymentUid", "status", "price"]
+
+
+# Пакетное чтение оплат – из values_list() без экземпляров Payment (ответ как у PaymentSerializer)
+payment_rows = FieldMapper(PaymentSerializer)
@@ -0,0 +1,125 @@
+import json
+import uuid
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from rest_framework.renderers import JSONRenderer
+from service_common.json_codec import FastJSONRenderer
+from service_common.testing import MetricsEndpointTestsMixin
+
+from .models import Payment
+from .serializers import PaymentSerializer, payment_rows
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from _plan_nodes(child)
+
+
+class PaymentRowsParityTests(TestCase):
+    """Ответы из values_list() (payment_rows) байт в байт совпадают с PaymentSerializer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Payment.objects.bulk_create([
+            Payment(price=10500, status=Payment.Status.PAID),
+            Payment(price=0, status=Payment.Status.CANCELED),
+            Payment(price=2 ** 31 - 1, status=Payment.Status.PAID),
+        ])
+
+    def assertSameBytes(self, queryset):
+        expected = PaymentSerializer(queryset, many=True).data
+        actual = payment_rows.rows(payment_rows.values_list(queryset))
+        for renderer in (JSONRenderer(), FastJSONRenderer()):
+            self.assertEqual(renderer.render(actual), renderer.render(expected))
+
+    def test_payments(self):
+        self.assertSameBytes(Payment.objects.order_by("id"))
+
+    def test_empty(self):
+        self.assertSameBytes(Payment.objects.none())
+
+    def test_batch_endpoint_matches_serializer(self):
+        payments = Payment.objects.order_by("id")
+        response = self.client.post("/api/v1/payment/batch/",
+                                    {"paymentUids": [str(p.payment_uid) for p in payments]},
+                                    content_type="application/json")
+        self.assertEqual(response.content, FastJSONRenderer().render(PaymentSerializer(payments, many=True).data))
+
+
+class PaymentCancelTests(TestCase):
+    """Отмена оплаты одним условным UPDATE: 204 (в т.ч. повторно), 404 и 409."""
+
+    def setUp(self):
+        self.payment = Payment.objects.create(price=10500, status=Payment.Status.PAID)
+
+    def cancel(self, payment_uid=None):
+        return self.client.delete(f"/api/v1/payment/{payment_uid or self.payment.payment_uid}/")
+
+    def test_cancel(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.cancel().status_code, 204)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.Status.CANCELED)
+
+    def test_cancel_twice(self):
+        self.cancel()
+        with self.assertNumQueries(2):
+            self.assertEqual(self.cancel().status_code, 204)
+
+    def test_forbidden_transition(self):
+        # Сейчас в CANCELED можно только из PAID; запрещаем и его, чтобы проверить 409
+        with patch.dict(Payment.TRANSITIONS, {Payment.Status.CANCELED: ()}):
+            response = self.cancel()
+        self.assertEqual(response.status_code, 409)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.Status.PAID)
+
+    def test_unknown_payment(self):
+        self.assertEqual(self.cancel(uuid.uuid4()).status_code, 404)
+        self.assertEqual(self.cancel("0" * 36).status_code, 404)
+
+
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN-тесты индексов – только на Postgres (TEST_DB=postgres)")
+class HotQueryIndexTests(TestCase):
+    """
+    Горячие запросы должны идти по индексам. Таблица засеивается так, чтобы читать
+    её целиком планировщику было невыгодно, после ANALYZE проверяется план EXPLAIN.
+    """
+    PAYMENTS = 20000
+
+    @classmethod
+    def setUpTestData(cls):
+        Payment.objects.bulk_create(
+            (Payment(price=1000 + i % 500,
+                     status=Payment.Status.CANCELED if i % 10 == 0 else Payment.Status.PAID)
+             for i in range(cls.PAYMENTS)),
+            batch_size=2000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE payment")
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        nodes = list(_plan_nodes(json.loads(queryset.explain(format="json"))["Plan"]))
+        self.assertFalse([node for node in nodes if node["Node Type"] == "Seq Scan"],
+                         f"Seq Scan в плане: {nodes}")
+        used = {node.get("Index Name") for node in nodes if "Index" in node["Node Type"]}
+        if index_name is None:
+            self.assertTrue(used, f"Нет индексного доступа в плане: {nodes}")
+        else:
+            self.assertIn(index_name, used)
+
+    def test_payment_by_uid_uses_unique_index(self):
+        payment = Payment.objects.order_by("id")[self.PAYMENTS // 2]
+        self.assertUsesIndex(Payment.objects.filter(payment_uid=payment.payment_uid))
+
+    def test_payments_batch_uses_unique_index(self):
+        uids = list(Payment.objects.order_by("?").values_list("payment_uid", flat=True)[:20])
+        self.assertUsesIndex(Payment.objects.filter(payment_uid__in=uids).order_by("id"))
+
+
+class MetricsTests(MetricsEndpointTestsMixin, SimpleTestCase):
+    """/manage/metrics сервиса: гистограмма запросов и multiprocess-режим."""
@@ -1,9 +1,12 @@
+import uuid
+
+from django.http import Http404
 from rest_framework import status, viewsets, mixins
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
 from .models import Payment
-from .serializers import PaymentSerializer, CreatePaymentRequestSerializer
+from .serializers import PaymentSerializer, CreatePaymentRequestSerializer, PaymentBatchRequestSerializer, payment_rows
 
 
 class PaymentViewSet(mixins.CreateModelMixin,
@@ -14,6 +17,7 @@ class PaymentViewSet(mixins.CreateModelMixin,
     GET    /api/v1/payment/{paymentUid}  -> получить оплату
     DELETE /api/v1/payment/{paymentUid}  -> пометить оплату CANCELED (идемпотентно)
     POST   /api/v1/payment/{paymentUid}/cancel -> отменить оплату, 409 если уже отменена
+    POST   /api/v1/payment/batch         -> пакетное чтение оплат по списку paymentUids
     """
     serializer_class = PaymentSerializer
     queryset = Payment.objects.all().order_by("id")
@@ -30,9 +34,33 @@ class PaymentViewSet(mixins.CreateModelMixin,
         payment = self.get_object()
         return Response(PaymentSerializer(payment).data)
 
+    @action(detail=False, methods=["post"], url_path="batch")
+    def batch(self, request):
+        """Вернуть оплаты по списку paymentUid одним запросом (WHERE payment_uid IN (...))."""
+        req = PaymentBatchRequestSerializer(data=request.data)
+        req.is_valid(raise_exception=True)
+        payment_uids = req.validated_data["paymentUids"]
+        if not payment_uids:
+            return Response([])
+        payments = payment_rows.values_list(Payment.objects.filter(payment_uid__in=payment_uids).order_by("id"))
+        return Response(payment_rows.rows(payments))
+
     def destroy(self, request, *args, **kwargs):
-        payment = self.get_object()
-        if payment.status != Payment.Status.CANCELED:
-            payment.status = Payment.Status.CANCELED
-            payment.save(update_fields=["status"])
+        """
+        Отмена одним UPDATE ... WHERE payment_uid = ? AND status IN (разрешённые).
+        Если строка не изменилась, второй запрос отличает уже отменённую оплату (204) от отсутствующей (404).
+        """
+        try:
+            payment_uid = uuid.UUID(kwargs[self.lookup_field])
+        except ValueError:
+            raise Http404
+        payments = Payment.objects.filter(payment_uid=payment_uid)
+        target = Payment.Status.CANCELED
+        if not payments.filter(status__in=Payment.TRANSITIONS[target]).update(status=target):
+            current = payments.values_list("status", flat=True).first()
+            if current is None:
+                raise Http404
+            if current != target:
+                return Response({"message": f"Оплату в статусе {current} нельзя перевести в {target}"},
+                                status=status.HTTP_409_CONFLICT)
         return Response(status=status.HTTP_204_NO_CONTENT)
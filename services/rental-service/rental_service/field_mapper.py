@@ -0,0 +1,67 @@
+"""
+Ответы списков прямо из values_list(), без экземпляров моделей.
+
+ModelSerializer на каждую строку создаёт объект модели и прогоняет все поля
+через машинерию сериализатора. Для горячих списков FieldMapper один раз
+разбирает сериализатор (имя в ответе <- колонка, преобразование) и дальше
+собирает словари из кортежей values_list(). Поля, у которых представление
+совпадает со значением из БД (строки, числа, bool, choices), копируются как
+есть; остальные (UUID, даты) проходят через to_representation того же поля
+сериализатора, поэтому ответ совпадает с сериализатором байт в байт.
+"""
+from functools import cached_property
+from typing import Any, Iterable
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+
+# Поля, у которых to_representation не меняет значение из БД
+PASSTHROUGH_FIELDS = (
+    serializers.CharField, serializers.IntegerField, serializers.BooleanField, serializers.ChoiceField,
+)
+
+
+class FieldMapper:
+    def __init__(self, serializer_class: type[serializers.Serializer]):
+        self.serializer_class = serializer_class
+
+    @cached_property
+    def _plan(self) -> tuple[tuple[str, ...], tuple[str, ...], tuple[tuple[int, Any], ...]]:
+        # Поля ModelSerializer строятся из модели – только после загрузки приложений
+        names, columns, converters = [], [], []
+        for name, field in self.serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if field.source == "*" or "." in field.source or isinstance(field, serializers.BaseSerializer):
+                raise ImproperlyConfigured(f"{self.serializer_class.__name__}.{name}: поле не из колонки модели")
+            if isinstance(field, serializers.UUIDField) and field.uuid_format == "hex_verbose":
+                # то же, что UUIDField.to_representation, без лишнего вызова
+                converters.append((len(names), str))
+            elif not isinstance(field, PASSTHROUGH_FIELDS):
+                converters.append((len(names), field.to_representation))
+            names.append(name)
+            columns.append(field.source)
+        return tuple(names), tuple(columns), tuple(converters)
+
+    @property
+    def columns(self) -> tuple[str, ...]:
+        return self._plan[1]
+
+    @property
+    def row_fields(self) -> tuple[str, ...]:
+        """Поля строки для rows(): id первым (по нему считает курсор keyset-пагинация), затем колонки ответа."""
+        return ("id", *self.columns)
+
+    def values_list(self, queryset):
+        return queryset.values_list(*self.row_fields)
+
+    def rows(self, rows: Iterable[tuple]) -> list[dict[str, Any]]:
+        names, _, converters = self._plan
+        result = []
+        for row in rows:
+            values = list(row[1:])
+            for index, convert in converters:
+                if values[index] is not None:
+                    values[index] = convert(values[index])
+            result.append(dict(zip(names, values)))
+        return result
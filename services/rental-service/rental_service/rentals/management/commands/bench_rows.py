@@ -0,0 +1,46 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from ...models import Rental
+from ...serializers import RentalShortSerializer, rental_rows
+
+
+class Command(BaseCommand):
+    help = "Список аренд: RentalShortSerializer против rental_rows (values_list) – время на страницу"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100, help="аренд на странице")
+        parser.add_argument("--repeat", type=int, default=200, help="сколько раз собрать страницу")
+
+    def handle(self, *args, rows, repeat, **options):
+        username = f"bench-{uuid.uuid4()}"
+        now = timezone.now()
+        # Тестовые аренды живут только внутри транзакции и откатываются в конце
+        with transaction.atomic():
+            Rental.objects.bulk_create(
+                Rental(username=username, car_uid=uuid.uuid4(), payment_uid=uuid.uuid4(),
+                       date_from=now, date_to=now + timedelta(days=3))
+                for _ in range(rows)
+            )
+            queryset = Rental.objects.filter(username=username).order_by("-id")[:rows]
+
+            serializer = self._measure(lambda: RentalShortSerializer(queryset.all(), many=True).data, repeat)
+            mapper = self._measure(lambda: rental_rows.rows(rental_rows.values_list(queryset.all())), repeat)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"serializer: {serializer * 1e3:8.3f} мс на страницу из {rows}")
+        self.stdout.write(f"rental_rows: {mapper * 1e3:7.3f} мс на страницу из {rows}")
+        self.stdout.write(f"ускорение: x{serializer / mapper:.1f}")
+
+    @staticmethod
+    def _measure(func, repeat: int) -> float:
+        func()  # прогрев
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - started) / repeat
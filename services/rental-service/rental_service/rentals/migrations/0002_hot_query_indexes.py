@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:17
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='rental',
+            name='rental_rental__23a50d_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='rental',
+            name='rental_usernam_15809a_idx',
+        ),
+        migrations.AlterField(
+            model_name='rental',
+            name='rental_uid',
+            field=models.UUIDField(default=uuid.uuid4, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['username', 'id'], name='rental_username_id_idx'),
+        ),
+    ]
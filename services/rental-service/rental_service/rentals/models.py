@@ -9,7 +9,7 @@ class Rental(models.Model):
         CANCELED = "CANCELED", "Canceled"
 
     id = models.AutoField(primary_key=True)
-    rental_uid = models.UUIDField(default=uuid.uuid4, unique=True, db_index=True)
+    rental_uid = models.UUIDField(default=uuid.uuid4, unique=True)
     username = models.CharField(max_length=80)
     payment_uid = models.UUIDField()
     car_uid = models.UUIDField()
@@ -17,11 +17,19 @@ class Rental(models.Model):
     date_to = models.DateTimeField()
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.IN_PROGRESS)
 
+    # Разрешённые переходы: целевой статус -> из каких статусов в него можно перейти
+    TRANSITIONS = {
+        Status.CANCELED: (Status.IN_PROGRESS,),
+        Status.FINISHED: (Status.IN_PROGRESS,),
+    }
+
     class Meta:
         db_table = "rental"
+        # rental_uid индексирует unique-ограничение. Список аренд пользователя –
+        # filter(username=...).order_by("-id") с курсором по id: (username, id)
+        # отдаёт страницу обратным проходом индекса, без сортировки
         indexes = [
-            models.Index(fields=["rental_uid"]),
-            models.Index(fields=["username"]),
+            models.Index(fields=["username", "id"], name="rental_username_id_idx"),
             models.Index(fields=["status"]),
         ]
 
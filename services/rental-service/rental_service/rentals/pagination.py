@@ -0,0 +1,68 @@
+import base64
+import binascii
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+def _row_id(row) -> int:
+    # Объект модели или кортеж values_list() с id первым (FieldMapper.values_list)
+    return row[0] if isinstance(row, tuple) else row.id
+
+
+class RentalCursorPagination(BasePagination):
+    """
+    Keyset-пагинация списка аренд пользователя по (username, id), от новых к старым.
+
+    Следующая страница – это id < последнего id текущей, поэтому глубокие страницы
+    не дороже первой: ни OFFSET, ни COUNT(*). Тело ответа – по-прежнему массив,
+    курсор следующей страницы – в заголовке X-Next-Cursor (на последней его нет).
+    """
+    cursor_query_param = "cursor"  # ?cursor=
+    limit_query_param = "limit"  # ?limit=
+    default_limit = 100
+    max_limit = 100
+    next_cursor_header = "X-Next-Cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        limit = self.get_limit(request)
+        last_id = self.decode_cursor(request)
+        if last_id is not None:
+            queryset = queryset.filter(id__lt=last_id)
+
+        # Лишняя строка показывает, есть ли следующая страница
+        page = list(queryset.order_by("-id")[:limit + 1])
+        self.next_cursor = self.encode_cursor(_row_id(page[limit - 1])) if len(page) > limit else None
+        return page[:limit]
+
+    def get_paginated_response(self, data):
+        response = Response(data)
+        if self.next_cursor is not None:
+            response[self.next_cursor_header] = self.next_cursor
+        return response
+
+    def get_limit(self, request) -> int:
+        raw = request.query_params.get(self.limit_query_param)
+        if raw is None:
+            return self.default_limit
+        try:
+            limit = int(raw)
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= self.max_limit:
+            raise ValidationError({self.limit_query_param: [f"Ожидается число от 1 до {self.max_limit}"]})
+        return limit
+
+    def decode_cursor(self, request):
+        raw = request.query_params.get(self.cursor_query_param)
+        if not raw:
+            return None
+        try:
+            return int(base64.urlsafe_b64decode(raw.encode("ascii")).decode("ascii"))
+        except (ValueError, UnicodeError, binascii.Error):
+            raise ValidationError({self.cursor_query_param: ["Некорректный курсор"]})
+
+    @staticmethod
+    def encode_cursor(last_id: int) -> str:
+        return base64.urlsafe_b64encode(str(last_id).encode("ascii")).decode("ascii")
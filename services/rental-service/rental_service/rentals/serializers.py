@@ -1,4 +1,6 @@
 from rest_framework import serializers
+
+from ..field_mapper import FieldMapper
 from .models import Rental
 
 
@@ -24,3 +26,19 @@ class RentalShortSerializer(serializers.ModelSerializer):
     class Meta:
         model = Rental
         fields = ["rentalUid", "status", "dateFrom", "dateTo", "carUid", "paymentUid"]
+
+
+# Список аренд – из values_list() без экземпляров Rental (ответ как у RentalShortSerializer)
+rental_rows = FieldMapper(RentalShortSerializer)
+
+
+class RentalListQuerySerializer(serializers.Serializer):
+    """Фильтры списка аренд: статус и аренды, пересекающиеся с периодом [dateFrom, dateTo]."""
+    status = serializers.ChoiceField(choices=Rental.Status.choices, required=False)
+    dateFrom = serializers.DateField(required=False)
+    dateTo = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        if "dateFrom" in attrs and "dateTo" in attrs and attrs["dateTo"] < attrs["dateFrom"]:
+            raise serializers.ValidationError({"dateTo": "dateTo не может быть раньше dateFrom"})
+        return attrs
@@ -0,0 +1,254 @@
+import json
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from service_common.json_codec import FastJSONRenderer
+from service_common.testing import MetricsEndpointTestsMixin
+
+from .models import Rental
+from .serializers import RentalShortSerializer, rental_rows
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from _plan_nodes(child)
+
+
+class RentalRowsParityTests(TestCase):
+    """Ответы из values_list() (rental_rows) байт в байт совпадают с RentalShortSerializer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        midnight = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        Rental.objects.bulk_create([
+            Rental(username="user", car_uid=uuid.uuid4(), payment_uid=uuid.uuid4(),
+                   date_from=midnight, date_to=midnight + timedelta(days=3), status=status)
+            for status in Rental.Status.values
+        ] + [
+            # не полночь UTC: дата зависит от часового пояса сериализатора
+            Rental(username="user", car_uid=uuid.uuid4(), payment_uid=uuid.uuid4(),
+                   date_from=midnight + timedelta(hours=22), date_to=midnight + timedelta(days=1, hours=23)),
+        ])
+
+    def assertSameBytes(self, queryset):
+        expected = RentalShortSerializer(queryset, many=True).data
+        actual = rental_rows.rows(rental_rows.values_list(queryset))
+        for renderer in (JSONRenderer(), FastJSONRenderer()):
+            self.assertEqual(renderer.render(actual), renderer.render(expected))
+
+    def test_user_rentals(self):
+        self.assertSameBytes(Rental.objects.filter(username="user").order_by("-id"))
+
+    @override_settings(TIME_ZONE="Asia/Vladivostok")
+    def test_user_rentals_in_other_time_zone(self):
+        self.assertSameBytes(Rental.objects.filter(username="user").order_by("-id"))
+
+    def test_empty(self):
+        self.assertSameBytes(Rental.objects.none())
+
+    def test_list_endpoint_matches_serializer(self):
+        response = self.client.get("/api/v1/rental/", HTTP_X_USER_NAME="user")
+        expected = RentalShortSerializer(Rental.objects.filter(username="user").order_by("-id"), many=True).data
+        self.assertEqual(response.content, FastJSONRenderer().render(expected))
+
+
+class RentalListTests(TestCase):
+    """Список аренд: keyset-страницы от новых к старым с X-Next-Cursor, фильтры по статусу и периоду."""
+
+    @classmethod
+    def setUpTestData(cls):
+        start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        # Аренды i: [1 + 2i января, 3 + 2i января], статусы по кругу
+        cls.rentals = Rental.objects.bulk_create([
+            Rental(username="user", car_uid=uuid.uuid4(), payment_uid=uuid.uuid4(),
+                   date_from=start + timedelta(days=2 * i), date_to=start + timedelta(days=2 * i + 2),
+                   status=Rental.Status.values[i % 3])
+            for i in range(7)
+        ] + [
+            Rental(username="other", car_uid=uuid.uuid4(), payment_uid=uuid.uuid4(),
+                   date_from=start, date_to=start + timedelta(days=30)),
+        ])
+
+    def get(self, **params):
+        return self.client.get("/api/v1/rental/", params, HTTP_X_USER_NAME="user")
+
+    def uids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [rental["rentalUid"] for rental in response.json()]
+
+    def expected(self, queryset):
+        return [str(uid) for uid in queryset.filter(username="user").order_by("-id").values_list("rental_uid", flat=True)]
+
+    def test_pages_follow_cursor(self):
+        pages, params = [], {"limit": 3}
+        while True:
+            response = self.get(**params)
+            pages.append(self.uids(response))
+            if "X-Next-Cursor" not in response:
+                break
+            params["cursor"] = response["X-Next-Cursor"]
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), self.expected(Rental.objects.all()))
+
+    def test_last_page_has_no_cursor(self):
+        # Последняя страница заполнена целиком – заголовка нет, пустой страницы за ней нет
+        response = self.get(limit=7)
+        self.assertEqual(len(self.uids(response)), 7)
+        self.assertNotIn("X-Next-Cursor", response)
+
+    def test_default_limit(self):
+        response = self.get()
+        self.assertEqual(self.uids(response), self.expected(Rental.objects.all()))
+        self.assertNotIn("X-Next-Cursor", response)
+
+    def test_invalid_limit(self):
+        for limit in ("0", "101", "-1", "many", ""):
+            response = self.get(limit=limit)
+            self.assertEqual(response.status_code, 400, limit)
+            self.assertIn("limit", response.json())
+
+    def test_invalid_cursor(self):
+        for cursor in ("###", "YWJj"):  # не base64 и base64 не от числа
+            response = self.get(cursor=cursor)
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertIn("cursor", response.json())
+
+    def test_status_filter(self):
+        for value in Rental.Status.values:
+            self.assertEqual(self.uids(self.get(status=value)), self.expected(Rental.objects.filter(status=value)))
+        self.assertEqual(self.get(status="LOST").status_code, 400)
+
+    def test_status_filter_with_cursor(self):
+        first = self.get(status=Rental.Status.IN_PROGRESS, limit=2)
+        second = self.get(status=Rental.Status.IN_PROGRESS, limit=2, cursor=first["X-Next-Cursor"])
+        self.assertEqual(self.uids(first) + self.uids(second),
+                         self.expected(Rental.objects.filter(status=Rental.Status.IN_PROGRESS)))
+        self.assertNotIn("X-Next-Cursor", second)
+
+    def test_period_overlap(self):
+        by_index = [str(rental.rental_uid) for rental in self.rentals[:7]]
+        # Аренда пересекается с периодом, если началась не позже dateTo и закончилась не раньше dateFrom;
+        # границы включительно: аренда 1 (3–5 января) и аренда 2 (5–7 января) касаются 5 января
+        self.assertEqual(self.uids(self.get(dateFrom="2025-01-05", dateTo="2025-01-05")),
+                         [by_index[2], by_index[1]])
+        self.assertEqual(self.uids(self.get(dateFrom="2025-01-12")), [by_index[6], by_index[5]])
+        self.assertEqual(self.uids(self.get(dateTo="2025-01-02")), [by_index[0]])
+        self.assertEqual(self.uids(self.get(dateFrom="2025-02-01")), [])
+
+    def test_invalid_period(self):
+        for params in ({"dateFrom": "2025-13-01"}, {"dateTo": "tomorrow"},
+                       {"dateFrom": "2025-01-05", "dateTo": "2025-01-04"}):
+            self.assertEqual(self.get(**params).status_code, 400, params)
+
+
+class RentalTransitionTests(TestCase):
+    """Отмена и завершение одним условным UPDATE: 204 (в т.ч. повторно), 404 и 409."""
+
+    def setUp(self):
+        now = timezone.now()
+        self.rental = Rental.objects.create(username="user", car_uid=uuid.uuid4(), payment_uid=uuid.uuid4(),
+                                            date_from=now, date_to=now + timedelta(days=3))
+
+    def cancel(self, rental_uid=None, username="user"):
+        return self.client.delete(f"/api/v1/rental/{rental_uid or self.rental.rental_uid}/",
+                                  HTTP_X_USER_NAME=username)
+
+    def finish(self, rental_uid=None, username="user"):
+        return self.client.post(f"/api/v1/rental/{rental_uid or self.rental.rental_uid}/finish/",
+                                HTTP_X_USER_NAME=username)
+
+    def assertStatus(self, expected):
+        self.rental.refresh_from_db()
+        self.assertEqual(self.rental.status, expected)
+
+    def test_cancel(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.cancel().status_code, 204)
+        self.assertStatus(Rental.Status.CANCELED)
+
+    def test_cancel_twice(self):
+        self.cancel()
+        self.assertEqual(self.cancel().status_code, 204)
+        self.assertStatus(Rental.Status.CANCELED)
+
+    def test_finish(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.finish().status_code, 204)
+        self.assertEqual(self.finish().status_code, 204)
+        self.assertStatus(Rental.Status.FINISHED)
+
+    def test_finish_canceled(self):
+        self.cancel()
+        response = self.finish()
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("CANCELED", response.json()["message"])
+        self.assertStatus(Rental.Status.CANCELED)
+
+    def test_cancel_finished(self):
+        self.finish()
+        self.assertEqual(self.cancel().status_code, 409)
+        self.assertStatus(Rental.Status.FINISHED)
+
+    def test_foreign_rental(self):
+        self.assertEqual(self.cancel(username="other").status_code, 404)
+        self.assertEqual(self.finish(username="other").status_code, 404)
+        self.assertStatus(Rental.Status.IN_PROGRESS)
+
+    def test_unknown_rental(self):
+        self.assertEqual(self.cancel(rental_uid=uuid.uuid4()).status_code, 404)
+        self.assertEqual(self.finish(rental_uid="not-a-uuid").status_code, 404)
+
+
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN-тесты индексов – только на Postgres (TEST_DB=postgres)")
+class HotQueryIndexTests(TestCase):
+    """
+    Горячие запросы должны идти по индексам. Таблица засеивается так, чтобы читать
+    её целиком планировщику было невыгодно, после ANALYZE проверяется план EXPLAIN.
+    """
+    USERS = 200
+    RENTALS = 20000
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        Rental.objects.bulk_create(
+            (Rental(username=f"user{i % cls.USERS}", car_uid=uuid.uuid4(), payment_uid=uuid.uuid4(),
+                    date_from=now, date_to=now + timedelta(days=1 + i % 10),
+                    status=Rental.Status.FINISHED if i % 3 else Rental.Status.IN_PROGRESS)
+             for i in range(cls.RENTALS)),
+            batch_size=2000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE rental")
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        nodes = list(_plan_nodes(json.loads(queryset.explain(format="json"))["Plan"]))
+        self.assertFalse([node for node in nodes if node["Node Type"] == "Seq Scan"],
+                         f"Seq Scan в плане: {nodes}")
+        used = {node.get("Index Name") for node in nodes if "Index" in node["Node Type"]}
+        if index_name is None:
+            self.assertTrue(used, f"Нет индексного доступа в плане: {nodes}")
+        else:
+            self.assertIn(index_name, used)
+
+    def test_user_rentals_page_uses_username_id_index(self):
+        qs = Rental.objects.filter(username="user7").order_by("-id")[:101]
+        self.assertUsesIndex(qs, "rental_username_id_idx")
+
+    def test_user_rentals_keyset_page_uses_username_id_index(self):
+        qs = Rental.objects.filter(username="user7", id__lt=self.RENTALS // 2).order_by("-id")[:101]
+        self.assertUsesIndex(qs, "rental_username_id_idx")
+
+    def test_rental_by_uid_uses_unique_index(self):
+        rental = Rental.objects.order_by("id")[self.RENTALS // 2]
+        self.assertUsesIndex(Rental.objects.filter(rental_uid=rental.rental_uid))
+
+
+class MetricsTests(MetricsEndpointTestsMixin, SimpleTestCase):
+    """/manage/metrics сервиса: гистограмма запросов и multiprocess-режим."""
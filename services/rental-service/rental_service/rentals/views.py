@@ -1,3 +1,4 @@
+import uuid
 import zoneinfo
 from datetime import datetime
 
@@ -8,7 +9,10 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 
 from .models import Rental
-from .serializers import CreateRentalRequestSerializer, RentalShortSerializer
+from .pagination import RentalCursorPagination
+from .serializers import (
+    CreateRentalRequestSerializer, RentalListQuerySerializer, RentalShortSerializer, rental_rows,
+)
 from .permissions import HasUserHeader
 
 
@@ -24,22 +28,40 @@ def _to_aware_midnight(d):
 class RentalViewSet(viewsets.ViewSet):
     """
     /api/v1/rental:
-      GET  -> список аренд пользователя (по X-User-Name)
+      GET  -> страница аренд пользователя (по X-User-Name), от новых к старым;
+              ?limit=&cursor= – keyset-пагинация, курсор следующей страницы в X-Next-Cursor;
+              ?status=&dateFrom=&dateTo= – фильтры
       POST -> создать аренду (IN_PROGRESS)
 
     /api/v1/rental/{rentalUid}:
       GET    -> аренда пользователя (проверка владения)
-      DELETE -> отмена аренды (CANCELED)
+      DELETE -> отмена аренды (IN_PROGRESS -> CANCELED)
 
     /api/v1/rental/{rentalUid}/finish:
-      POST -> завершить аренду (FINISHED)
+      POST -> завершить аренду (IN_PROGRESS -> FINISHED)
+
+    Переходы статуса: 204 (в т.ч. повторный), 404 – чужая или несуществующая аренда,
+    409 – переход из этого статуса запрещён (Rental.TRANSITIONS).
     """
     permission_classes = [HasUserHeader]
+    pagination_class = RentalCursorPagination
 
     def list(self, request):
         user = _username(request)
-        rentals = Rental.objects.filter(username=user).order_by("-id")
-        return Response(RentalShortSerializer(rentals, many=True).data)
+        query = RentalListQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        rentals = Rental.objects.filter(username=user)
+        if "status" in query.validated_data:
+            rentals = rentals.filter(status=query.validated_data["status"])
+        if "dateFrom" in query.validated_data:
+            rentals = rentals.filter(date_to__gte=_to_aware_midnight(query.validated_data["dateFrom"]))
+        if "dateTo" in query.validated_data:
+            rentals = rentals.filter(date_from__lte=_to_aware_midnight(query.validated_data["dateTo"]))
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(rental_rows.values_list(rentals), request, view=self)
+        return paginator.get_paginated_response(rental_rows.rows(page))
 
     def retrieve(self, request, pk=None):
         user = _username(request)
@@ -69,24 +91,33 @@ class RentalViewSet(viewsets.ViewSet):
         return Response(RentalShortSerializer(rental).data, status=status.HTTP_200_OK)
 
     def destroy(self, request, pk=None):
-        user = _username(request)
-        rental = get_object_or_404(Rental, rental_uid=pk)
-        if rental.username != user:
-            return Response({"message": "Аренда не найдена"}, status=status.HTTP_404_NOT_FOUND)
-        if rental.status == Rental.Status.CANCELED:
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        rental.status = Rental.Status.CANCELED
-        rental.save(update_fields=["status"])
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self._transition(request, pk, Rental.Status.CANCELED)
 
     @action(detail=True, methods=["post"], url_path="finish")
     def finish(self, request, pk=None):
-        user = _username(request)
-        rental = get_object_or_404(Rental, rental_uid=pk)
-        if rental.username != user:
+        return self._transition(request, pk, Rental.Status.FINISHED)
+
+    @staticmethod
+    def _transition(request, pk, target: str):
+        """
+        Переход одним UPDATE ... WHERE rental_uid = ? AND username = ? AND status IN (разрешённые):
+        владение и исходный статус проверяются в том же запросе, что и запись, поэтому
+        параллельные cancel/finish не перетирают друг друга. Если строка не изменилась,
+        второй запрос выясняет почему: аренды нет/чужая (404), уже в target (204) или 409.
+        """
+        try:
+            rental_uid = uuid.UUID(str(pk))
+        except ValueError:
+            return Response({"message": "Аренда не найдена"}, status=status.HTTP_404_NOT_FOUND)
+
+        rentals = Rental.objects.filter(rental_uid=rental_uid, username=_username(request))
+        if rentals.filter(status__in=Rental.TRANSITIONS[target]).update(status=target):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        current = rentals.values_list("status", flat=True).first()
+        if current is None:
             return Response({"message": "Аренда не найдена"}, status=status.HTTP_404_NOT_FOUND)
-        if rental.status == Rental.Status.FINISHED:
+        if current == target:
             return Response(status=status.HTTP_204_NO_CONTENT)
-        rental.status = Rental.Status.FINISHED
-        rental.save(update_fields=["status"])
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response({"message": f"Аренду в статусе {current} нельзя перевести в {target}"},
+                        status=status.HTTP_409_CONFLICT)